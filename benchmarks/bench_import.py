@@ -0,0 +1,78 @@
+"""
+bench_import.py – cold-start and import-time benchmark
+
+Measures, in fresh interpreters:
+  • wall time of `python -m modules --help` (CLI cold start)
+  • wall time of `import modules.<name>` for every module
+  • the slowest entries of `python -X importtime` for each module
+
+    python -m benchmarks.bench_import [--repeat 5] [--budget-ms 300]
+
+Exits with status 1 if the CLI cold start exceeds --budget-ms.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+MODULES = ["platform", "sapos_query", "sapos_batch", "wze_uav", "rename_rinex_tool", "rinex",
+           "move_files", "move_files_las", "exif_gps", "preflight",
+           "work_queue", "redtoolbox_report", "image_pack", "pipeline",
+           "watch", "detectors", "streaming",
+           "disk_space", "flight_index", "xmp_quality"]
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _wall_ms(cmd: List[str], repeat: int) -> float:
+    """Median wall time of *cmd* in ms."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=REPO, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def _importtime_top(module: str, n: int = 5) -> List[Tuple[int, str]]:
+    """Slowest cumulative imports reported by `-X importtime` (µs, name)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=REPO, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        rows.append((int(cum), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=300.0)
+    args = ap.parse_args(argv)
+
+    baseline = _wall_ms([sys.executable, "-c", "pass"], args.repeat)
+    cli = _wall_ms([sys.executable, "-m", "modules", "--help"], args.repeat)
+    print(f"{'python -c pass':<32} {baseline:8.1f} ms")
+    print(f"{'python -m modules --help':<32} {cli:8.1f} ms")
+    for name in MODULES:
+        mod = f"modules.{name}"
+        ms = _wall_ms([sys.executable, "-c", f"import {mod}"], args.repeat)
+        top = ", ".join(f"{n} {us / 1000:.0f}ms" for us, n in _importtime_top(mod, 3))
+        print(f"{'import ' + mod:<32} {ms:8.1f} ms   ({top})")
+
+    if cli > args.budget_ms:
+        print(f"\nCLI cold start {cli:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+bench_pipeline.py – time the pipeline helpers on synthetic archives
+
+Builds a fresh synthetic archive (see synthetic_archive.py) per scale and
+times each helper on it.  Run from the repository root:
+
+    python -m benchmarks.bench_pipeline                      # 10/100/1000 flights
+    python -m benchmarks.bench_pipeline --scales 10 100 --json bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json --tolerance 0.25
+
+With --baseline the run is compared against an earlier --json report and
+exits with status 1 if any benchmark got slower than the tolerance allows.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic_archive import make_archive
+from modules.progress import QUIET, set_verbosity
+from modules.profiling import profile_run
+
+
+def _benchmarks(paths: Dict[str, str], work: str, year: int
+                ) -> List[Tuple[str, Callable[[], object]]]:
+    """(name, thunk) pairs in an order where mutating steps come last."""
+    from modules.sapos_batch import batch_generate_sapos_queries, batch_generate_sapos_queries_v2
+    from modules.wze_uav import extract_fplans, find_ppk_files, copy_ppk_images
+    from modules.move_files_las import move_las
+    from modules.rename_rinex_tool import batch_rename_convert
+
+    queries_v2 = os.path.join(work, "all_sapos_queries_v2.txt")
+    fplans_fn = os.path.join(work, "fplans.txt")
+    yy = str(year)[2:]
+
+    def _find_ppk_all():
+        for date_dir in sorted(os.listdir(paths["wze_ppk"])):
+            for tnr in sorted(os.listdir(os.path.join(paths["wze_ppk"], date_dir))):
+                find_ppk_files(os.path.join(paths["wze_ppk"], date_dir, tnr, f"{tnr}_FPLAN"), yy)
+
+    return [
+        ("batch_generate_sapos_queries[dji]",
+         lambda: batch_generate_sapos_queries(paths["dji"], os.path.join(work, "q_dji.txt"))),
+        ("batch_generate_sapos_queries[wingtra]",
+         lambda: batch_generate_sapos_queries(paths["wingtra"], os.path.join(work, "q_wt.txt"))),
+        ("batch_generate_sapos_queries_v2",
+         lambda: batch_generate_sapos_queries_v2(paths["wze"], queries_v2, recurse=True)),
+        ("extract_fplans",
+         lambda: extract_fplans(queries_v2, paths["wze"], fplans_fn)),
+        ("find_ppk_files", _find_ppk_all),
+        ("copy_ppk_images",
+         lambda: copy_ppk_images(paths["wze"], os.path.join(work, "PPK_TEMP"))),
+        ("move_las",
+         lambda: move_las(paths["las"], os.path.join(work, "las_out"))),
+        ("batch_rename_convert",
+         lambda: batch_rename_convert(paths["dji"])),
+    ]
+
+
+def run_scale(n_flights: int, images: int, image_bytes: int, year: int,
+              tmp_root: Optional[str]) -> Dict[str, Dict]:
+    """Generate an archive with *n_flights* flights and time every benchmark."""
+    if tmp_root:
+        os.makedirs(tmp_root, exist_ok=True)
+    base = tempfile.mkdtemp(prefix=f"bench_{n_flights}_", dir=tmp_root)
+    try:
+        t0 = time.perf_counter()
+        paths = make_archive(os.path.join(base, "archive"), n_flights, images,
+                             image_bytes, year)
+        gen_s = time.perf_counter() - t0
+        work = os.path.join(base, "work")
+        os.makedirs(work)
+
+        results: Dict[str, Dict] = {"_generate": {"seconds": round(gen_s, 4)}}
+        for name, thunk in _benchmarks(paths, work, year):
+            with profile_run(name=name) as prof:
+                t0 = time.perf_counter()
+                thunk()
+                secs = time.perf_counter() - t0
+            rep = prof.report()
+            results[name] = {"seconds": round(secs, 4),
+                             "stages": {k: round(v["total_s"], 4) for k, v in rep["stages"].items()},
+                             "counters": rep["counters"]}
+        return results
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return one message per benchmark slower than baseline × (1 + tolerance)."""
+    regressions = []
+    for scale, benches in current.items():
+        for name, res in benches.items():
+            old = baseline.get(scale, {}).get(name)
+            if not old or name.startswith("_"):
+                continue
+            # ignore sub-10 ms timings, they are noise
+            if res["seconds"] > max(old["seconds"] * (1 + tolerance), 0.01):
+                regressions.append(f"{scale:>5} flights  {name}: "
+                                   f"{old['seconds']:.3f}s → {res['seconds']:.3f}s")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--images", type=int, default=20, help="images per flight")
+    ap.add_argument("--image-bytes", type=int, default=4096)
+    ap.add_argument("--year", type=int, default=2025)
+    ap.add_argument("--tmp", default=None, help="where to build the archives")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    ap.add_argument("--baseline", default=None, help="compare against this --json file")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    set_verbosity(QUIET)
+    report: Dict[str, Dict] = {}
+    for n in args.scales:
+        res = run_scale(n, args.images, args.image_bytes, args.year, args.tmp)
+        report[str(n)] = res
+        print(f"\n── {n} flights ({n * args.images} images per layout) ──", file=sys.stderr)
+        for name, r in res.items():
+            print(f"  {name:<40} {r['seconds']:9.3f} s", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:", file=sys.stderr)
+            for r in regressions:
+                print("  " + r, file=sys.stderr)
+            return 1
+        print("\nNo regressions against baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
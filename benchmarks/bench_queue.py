@@ -0,0 +1,117 @@
+"""
+bench_queue.py – several local processes sharing one work queue
+
+Starts `--procs` worker processes that call `run_queued` on the same
+temporary queue folder and the same `--items` keys, each item sleeping
+`--work-ms`.  With `--ttl` shorter than the work time, only the lease
+heartbeat keeps other processes from taking items over.  With `--stale`,
+every item starts with an expired lease of a crashed owner, so all
+processes race to take the same stale leases over.  Afterwards it checks
+that every item ran exactly once and has a done/ record:
+
+    python -m benchmarks.bench_queue [--procs 4] [--items 200] [--work-ms 5]
+    python -m benchmarks.bench_queue --items 12 --work-ms 1500 --ttl 0.6
+    python -m benchmarks.bench_queue --procs 8 --items 200 --ttl 2 --stale
+
+Exits with status 1 if an item ran twice, never, or has no done record.
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+from modules.work_queue import WorkQueue, run_queued  # noqa: E402
+
+
+def _worker(queue_dir: str, keys: List[str], work_s: float, ttl: float,
+            runs_dir: str) -> None:
+    queue = WorkQueue(queue_dir, ttl=ttl)
+    runs_fn = os.path.join(runs_dir, f"{os.getpid()}.txt")
+
+    def work(key: str):
+        with open(runs_fn, "a", encoding="utf-8") as fh:
+            fh.write(key + "\n")
+        time.sleep(work_s)
+        return {"pid": os.getpid()}
+
+    run_queued(queue, keys, work)
+
+
+def _write_stale_leases(queue_dir: str, keys: List[str], ttl: float) -> None:
+    """An expired lease of a crashed owner for every key."""
+    queue = WorkQueue(queue_dir, ttl=ttl, owner="crashed")
+    old = time.time() - 10 * ttl
+    for key in keys:
+        path = queue._lease_path(key)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"key": key, "owner": "crashed", "claimed": old}, fh)
+        os.utime(path, (old, old))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--items", type=int, default=200)
+    ap.add_argument("--work-ms", type=float, default=5.0)
+    ap.add_argument("--ttl", type=float, default=300.0)
+    ap.add_argument("--stale", action="store_true",
+                    help="start every item with an expired lease of a crashed owner")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench_queue_")
+    try:
+        queue_dir, runs_dir = os.path.join(tmp, "queue"), os.path.join(tmp, "runs")
+        os.makedirs(runs_dir)
+        keys = [f"flight_{i:05d}" for i in range(args.items)]
+        if args.stale:
+            _write_stale_leases(queue_dir, keys, args.ttl)
+        t0 = time.perf_counter()
+        procs = [multiprocessing.Process(target=_worker,
+                                         args=(queue_dir, keys, args.work_ms / 1000,
+                                               args.ttl, runs_dir))
+                 for _ in range(args.procs)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        wall = time.perf_counter() - t0
+
+        runs: collections.Counter = collections.Counter()
+        per_proc = []
+        for fn in os.listdir(runs_dir):
+            with open(os.path.join(runs_dir, fn), encoding="utf-8") as fh:
+                done = [ln.strip() for ln in fh if ln.strip()]
+            per_proc.append(len(done))
+            runs.update(done)
+        queue = WorkQueue(queue_dir)
+        twice = sorted(k for k, n in runs.items() if n > 1)
+        never = sorted(k for k in keys if k not in runs)
+        no_record = sorted(k for k in keys if not queue.is_done(k))
+        leases = os.listdir(os.path.join(queue_dir, "leases"))
+
+        print(f"{args.procs} processes, {args.items} items, {args.work_ms:.0f} ms each, "
+              f"ttl {args.ttl:g} s{', stale leases' if args.stale else ''}: "
+              f"{wall:.2f} s wall")
+        print(f"  items per process: {sorted(per_proc, reverse=True)}")
+        print(f"  ran twice: {len(twice)}  never ran: {len(never)}  "
+              f"without done record: {len(no_record)}  leases left: {len(leases)}")
+        ok = not (twice or never or no_record or leases)
+        print("OK" if ok else "FAILED: " + ", ".join((twice + never + no_record)[:10]))
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+synthetic_archive.py – build realistic fake flight archives for benchmarks
+
+Every layout the modules expect can be generated at configurable scale:
+
+    • WZE-UAV       <root>/<date>_<n>/<TNR>/<TNR>_FPLAN/100MEDIA/{MRK, JPGs}
+                    plus VRS items "{TNR}_*" in a separate SAPOS folder
+    • DJI M3E / L2  <root>/DJI_YYYYMMDDHHMM_<id>/{MRK, JPGs, .25o/.RPOS pairs, .LDR}
+                    plus loose "<id>_*" files for organize_files
+    • Wingtra       <root>/<flight>/DATA/<flight>.json
+    • LAS           <root>/<project>/<sub>/cloud.las (header only)
+
+JPGs carry a minimal but valid EXIF block (Make, Model, DateTimeOriginal and
+a GPS IFD) followed by padding, so `exifread` and the bounded readers in
+modules.jpeg_meta work on them.  MRK, JPG names, EXIF times and RINEX epochs
+are mutually consistent.
+
+    >>> from benchmarks.synthetic_archive import make_archive
+    >>> paths = make_archive("/tmp/archive", n_flights=100)
+"""
+
+import json
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ["make_archive", "make_wze_tree", "make_vrs_folder", "make_dji_folders",
+           "make_wingtra_logs", "make_las_projects", "write_jpeg", "write_mrk",
+           "write_rinex_obs", "write_rinex_nav", "write_las"]
+
+GPS_EPOCH = datetime(1980, 1, 6)
+LEAP_SECONDS = 18
+
+# rough bounding box of Bavaria
+_LAT = (47.5, 50.5)
+_LON = (9.0, 13.8)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  file writers
+# ────────────────────────────────────────────────────────────────────────────
+def _rational(values: List[float], denom: int = 10000) -> bytes:
+    return b"".join(struct.pack("<II", int(round(v * denom)), denom) for v in values)
+
+
+def _dms(deg: float) -> List[float]:
+    deg = abs(deg)
+    d = int(deg)
+    m = int((deg - d) * 60)
+    s = (deg - d - m / 60) * 3600
+    return [d, m, s]
+
+
+def _ifd_bytes(entries: List[Tuple[int, int, int, bytes]], offset: int) -> bytes:
+    """Serialise one little-endian IFD placed at *offset* (data follows it)."""
+    entries = sorted(entries)
+    data_off = offset + 2 + 12 * len(entries) + 4
+    head = struct.pack("<H", len(entries))
+    data = b""
+    for tag, typ, cnt, val in entries:
+        if len(val) <= 4:
+            head += struct.pack("<HHI", tag, typ, cnt) + val.ljust(4, b"\x00")
+        else:
+            head += struct.pack("<HHII", tag, typ, cnt, data_off + len(data))
+            data += val + (b"\x00" if len(val) % 2 else b"")
+    return head + struct.pack("<I", 0) + data
+
+
+def _ifd_size(entries: List[Tuple[int, int, int, bytes]]) -> int:
+    return 2 + 12 * len(entries) + 4 + sum(
+        len(v) + len(v) % 2 for _, _, _, v in entries if len(v) > 4)
+
+
+def _ascii(s: str) -> Tuple[int, bytes]:
+    b = s.encode("ascii") + b"\x00"
+    return len(b), b
+
+
+def exif_block(taken: datetime, model: str = "FC6360", make: str = "DJI",
+               lat: Optional[float] = None, lon: Optional[float] = None,
+               alt: Optional[float] = None) -> bytes:
+    """Return the TIFF structure of an EXIF APP1 payload (without 'Exif\\0\\0')."""
+    n_make, b_make = _ascii(make)
+    n_model, b_model = _ascii(model)
+    n_dto, b_dto = _ascii(taken.strftime("%Y:%m:%d %H:%M:%S"))
+
+    exif = [(0x9003, 2, n_dto, b_dto)]
+    gps: List[Tuple[int, int, int, bytes]] = []
+    if lat is not None and lon is not None:
+        gps = [
+            (0x0000, 1, 4, bytes([2, 3, 0, 0])),
+            (0x0001, 2, 2, (b"N" if lat >= 0 else b"S") + b"\x00"),
+            (0x0002, 5, 3, _rational(_dms(lat))),
+            (0x0003, 2, 2, (b"E" if lon >= 0 else b"W") + b"\x00"),
+            (0x0004, 5, 3, _rational(_dms(lon))),
+            (0x0005, 1, 1, bytes([0 if (alt or 0) >= 0 else 1])),
+            (0x0006, 5, 1, _rational([abs(alt or 0.0)], 1000)),
+        ]
+
+    ifd0 = [(0x010F, 2, n_make, b_make), (0x0110, 2, n_model, b_model),
+            (0x8769, 4, 1, b"\x00" * 4)]
+    if gps:
+        ifd0.append((0x8825, 4, 1, b"\x00" * 4))
+    exif_off = 8 + _ifd_size(ifd0)
+    gps_off = exif_off + _ifd_size(exif)
+    ifd0 = [(t, ty, c, struct.pack("<I", exif_off) if t == 0x8769 else
+             struct.pack("<I", gps_off) if t == 0x8825 else v) for t, ty, c, v in ifd0]
+
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    tiff += _ifd_bytes(ifd0, 8)
+    tiff += _ifd_bytes(exif, exif_off)
+    if gps:
+        tiff += _ifd_bytes(gps, gps_off)
+    return tiff
+
+
+def write_jpeg(path: str, taken: datetime, model: str = "FC6360",
+               lat: Optional[float] = None, lon: Optional[float] = None,
+               alt: Optional[float] = None, size: int = 4096,
+               xmp: Optional[bytes] = None) -> None:
+    """Write a JPEG with an EXIF block, optional XMP and ~*size* bytes of scan data."""
+    app1 = b"Exif\x00\x00" + exif_block(taken, model, lat=lat, lon=lon, alt=alt)
+    out = b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+    if xmp is not None:
+        payload = b"http://ns.adobe.com/xap/1.0/\x00" + xmp
+        out += b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+    pad = max(0, size - len(out) - 4)
+    out += b"\xff\xda" + b"\x00" * pad + b"\xff\xd9"
+    with open(path, "wb") as fh:
+        fh.write(out)
+
+
+def dji_xmp(rtk_flag: int = 50, std: float = 0.02, yaw: float = 0.0) -> bytes:
+    """DJI-style XMP packet with the drone-dji RTK and gimbal attributes."""
+    return (b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description '
+            b'xmlns:drone-dji="http://www.dji.com/drone-dji/1.0/" '
+            + f'drone-dji:GpsStatus="RTK" drone-dji:RtkFlag="{rtk_flag}" '
+              f'drone-dji:RtkStdLon="{std:.5f}" drone-dji:RtkStdLat="{std:.5f}" '
+              f'drone-dji:RtkStdHgt="{2 * std:.5f}" drone-dji:GimbalRollDegree="+0.00" '
+              f'drone-dji:GimbalYawDegree="{yaw:+.2f}" drone-dji:GimbalPitchDegree="-90.00" '
+              f'drone-dji:CaptureUUID="{rtk_flag:02d}{int(yaw * 100):08d}"'.encode()
+            + b'/></rdf:RDF></x:xmpmeta>')
+
+
+def gps_week_sow(utc: datetime) -> Tuple[int, float]:
+    """GPS week and seconds-of-week for a naive UTC datetime."""
+    dt = (utc - GPS_EPOCH).total_seconds() + LEAP_SECONDS
+    week = int(dt // (7 * 86400))
+    return week, dt - week * 7 * 86400
+
+
+def write_mrk(path: str, times_utc: List[datetime], lat: float, lon: float,
+              h: float = 480.0, rng: Optional[random.Random] = None,
+              float_every: int = 0) -> None:
+    """
+    Write a DJI *_Timestamp.MRK with one record per capture.  Every
+    `float_every`-th record gets a float RTK flag (34) instead of fixed (50).
+    """
+    rng = rng or random.Random(0)
+    with open(path, "w", encoding="utf-8") as fh:
+        for i, t in enumerate(times_utc, start=1):
+            week, sow = gps_week_sow(t)
+            q = 34 if float_every and i % float_every == 0 else 50
+            la = lat + rng.uniform(-5e-4, 5e-4)
+            lo = lon + rng.uniform(-5e-4, 5e-4)
+            fh.write(
+                f"{i}\t{sow:.6f}\t[{week}]\t   -1,N\t   19,E\t -126,V\t"
+                f"{la:.8f},Lat\t{lo:.8f},Lon\t{h + rng.uniform(-2, 2):.3f},Ellh\t"
+                f"0.013234, 0.010873, 0.027622\t{q},Q\n"
+            )
+
+
+def _hdr(content: str, label: str) -> str:
+    return f"{content:<60}{label}\n"
+
+
+def write_rinex_obs(path: str, start_utc: datetime, end_utc: datetime,
+                    interval: float = 1.0, n_sats: int = 6,
+                    marker: str = "VRS") -> None:
+    """Write a small RINEX 3.04 observation file covering [start, end] (GPS time)."""
+    start = start_utc + timedelta(seconds=LEAP_SECONDS)
+    end = end_utc + timedelta(seconds=LEAP_SECONDS)
+    sats = [f"G{i:02d}" for i in range(1, n_sats + 1)]
+    with open(path, "w", encoding="ascii") as fh:
+        fh.write(_hdr("     3.04           OBSERVATION DATA    M (MIXED)", "RINEX VERSION / TYPE"))
+        fh.write(_hdr("synthetic_archive", "PGM / RUN BY / DATE"))
+        fh.write(_hdr(marker, "MARKER NAME"))
+        fh.write(_hdr("  4052124.1000   852123.4000  4847123.9000", "APPROX POSITION XYZ"))
+        fh.write(_hdr("G    4 C1C L1C C2W L2W", "SYS / # / OBS TYPES"))
+        fh.write(_hdr(f"{interval:10.3f}", "INTERVAL"))
+        fh.write(_hdr(start.strftime("  %Y    %m    %d    %H    %M   %S.0000000     GPS"),
+                      "TIME OF FIRST OBS"))
+        fh.write(_hdr("", "END OF HEADER"))
+        t = start
+        step = timedelta(seconds=interval)
+        while t <= end:
+            fh.write(f"> {t:%Y %m %d %H %M} {t.second + t.microsecond / 1e6:10.7f}  0{len(sats):3d}\n")
+            for k, s in enumerate(sats):
+                fh.write(f"{s}{22000000 + k * 1000:14.3f}  {115000000 + k * 5000:14.3f}  "
+                         f"{22000003 + k * 1000:14.3f}  {89000000 + k * 4000:14.3f}  \n")
+            t += step
+
+
+def write_rinex_nav(path: str, when_utc: datetime, n_sats: int = 6) -> None:
+    """Write a small RINEX 3.04 GPS navigation file (one record per satellite)."""
+    t = when_utc.replace(minute=0, second=0, microsecond=0)
+    with open(path, "w", encoding="ascii") as fh:
+        fh.write(_hdr("     3.04           N: GNSS NAV DATA    G: GPS", "RINEX VERSION / TYPE"))
+        fh.write(_hdr("synthetic_archive", "PGM / RUN BY / DATE"))
+        fh.write(_hdr("", "END OF HEADER"))
+        for i in range(1, n_sats + 1):
+            fh.write(f"G{i:02d} {t:%Y %m %d %H %M %S}" + " 1.000000000000E-04" * 3 + "\n")
+            for _ in range(7):
+                fh.write("    " + " 1.000000000000E+00" * 4 + "\n")
+
+
+def write_las(path: str, n_points: int = 1000) -> None:
+    """Write a LAS 1.2 public header block (227 bytes) without point records."""
+    hdr = bytearray(227)
+    hdr[0:4] = b"LASF"
+    hdr[24:26] = bytes([1, 2])                                   # version 1.2
+    hdr[26:58] = b"synthetic_archive".ljust(32, b"\x00")
+    hdr[58:90] = b"synthetic_archive".ljust(32, b"\x00")
+    struct.pack_into("<HHIIBHI", hdr, 94, 227, 227, 0, 0, 3, 34, n_points)
+    with open(path, "wb") as fh:
+        fh.write(bytes(hdr))
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  tree builders
+# ────────────────────────────────────────────────────────────────────────────
+def _flight_times(start_local: datetime, n_images: int, step_s: float = 2.0
+                  ) -> Tuple[List[datetime], List[datetime]]:
+    """Local (Berlin, naive) and UTC capture times; summer time assumed (UTC+2)."""
+    local = [start_local + timedelta(seconds=i * step_s) for i in range(n_images)]
+    utc = [t - timedelta(hours=2) for t in local]
+    return local, utc
+
+
+def make_wze_tree(root: str, n_flights: int, images_per_flight: int = 20,
+                  image_bytes: int = 4096, year: int = 2025, seed: int = 0,
+                  with_base_files: bool = False) -> List[str]:
+    """
+    WZE-UAV (Phantom 4 Multispectral) layout.  Returns the FPLAN folder paths.
+    With `with_base_files` the FPLAN folders already contain the VRS
+    base-station .o/.p files, as after `copy_vrs_for_fplans`.
+    """
+    rng = random.Random(seed)
+    yy = str(year)[2:]
+    fplans: List[str] = []
+    for i in range(n_flights):
+        day = datetime(year, 6, 1) + timedelta(days=i // 25)
+        date_dir = os.path.join(root, f"{day:%Y%m%d}_{i // 25 + 1:02d}")
+        tnr = str(10000 + i)
+        fplan = os.path.join(date_dir, tnr, f"{tnr}_FPLAN")
+        media = os.path.join(fplan, "100MEDIA")
+        os.makedirs(media, exist_ok=True)
+        lat, lon = rng.uniform(*_LAT), rng.uniform(*_LON)
+        start = day.replace(hour=9) + timedelta(minutes=(i % 25) * 15)
+        local, utc = _flight_times(start, images_per_flight)
+        for k, t in enumerate(local, start=1):
+            write_jpeg(os.path.join(media, f"DJI_{k:03d}0.JPG"), t, "FC6360",
+                       lat, lon, 480.0, image_bytes)
+        write_mrk(os.path.join(media, "100_0001_Timestamp.MRK"), utc, lat, lon, rng=rng)
+        with open(os.path.join(media, "PPKOBS.obs"), "w") as fh:
+            fh.write("rover\n")
+        if with_base_files:
+            write_rinex_obs(os.path.join(fplan, f"{tnr}_VRS.{yy}o"),
+                            utc[0] - timedelta(minutes=10), utc[-1] + timedelta(minutes=10),
+                            interval=5.0)
+            write_rinex_nav(os.path.join(fplan, f"{tnr}_VRS.{yy}p"), utc[0])
+        fplans.append(fplan)
+    return fplans
+
+
+def make_vrs_folder(vrs_root: str, fplans: List[str], year: int = 2025) -> None:
+    """SAPOS download folder with "{TNR}_*" items for every FPLAN folder."""
+    os.makedirs(vrs_root, exist_ok=True)
+    yy = str(year)[2:]
+    for fplan in fplans:
+        tnr = os.path.basename(os.path.dirname(fplan))
+        day = datetime.strptime(os.path.basename(os.path.dirname(os.path.dirname(fplan)))[:8],
+                                "%Y%m%d")
+        start = day.replace(hour=6)
+        write_rinex_obs(os.path.join(vrs_root, f"{tnr}_Rinex.{yy}o"), start,
+                        start + timedelta(minutes=5), interval=5.0)
+        write_rinex_nav(os.path.join(vrs_root, f"{tnr}_Rinex.{yy}p"), start)
+        with open(os.path.join(vrs_root, f"{tnr}_Protokoll_VRS.txt"), "w") as fh:
+            fh.write(f"VRS protocol for {tnr}\n")
+
+
+def make_dji_folders(root: str, n_flights: int, images_per_flight: int = 20,
+                     image_bytes: int = 4096, year: int = 2025, seed: int = 0,
+                     l2_every: int = 4, loose_files: int = 2,
+                     float_every: int = 0) -> List[str]:
+    """
+    DJI_YYYYMMDDHHMM_<id> folders (Mavic 3 Enterprise, every `l2_every`-th a
+    Zenmuse L2 flight with .LDR).  Each folder gets a .RPOS/.25o pair; the
+    master folder gets `loose_files` "<id>_*" files per flight.  Images carry
+    DJI XMP; with `float_every`, every n-th image is RTK float (flag 34).
+    """
+    rng = random.Random(seed)
+    yy = str(year)[2:]
+    folders: List[str] = []
+    os.makedirs(root, exist_ok=True)
+    for i in range(n_flights):
+        start = datetime(year, 5, 1, 8) + timedelta(minutes=30 * i)
+        fid = f"F{i:04d}"
+        folder = os.path.join(root, f"DJI_{start:%Y%m%d%H%M}_{fid}")
+        os.makedirs(folder, exist_ok=True)
+        lat, lon = rng.uniform(*_LAT), rng.uniform(*_LON)
+        local, utc = _flight_times(start, images_per_flight)
+        is_l2 = bool(l2_every) and i % l2_every == l2_every - 1
+        model = "L2" if is_l2 else "M3E"
+        for k, t in enumerate(local, start=1):
+            flag = 34 if float_every and k % float_every == 0 else 50
+            write_jpeg(os.path.join(folder, f"DJI_{t:%Y%m%d%H%M%S}_{k:04d}_D.JPG"),
+                       t, model, lat, lon, 480.0, image_bytes,
+                       xmp=dji_xmp(flag, 0.02 if flag == 50 else 0.35, (k * 7.5) % 360 - 180))
+        write_mrk(os.path.join(folder, f"DJI_{start:%Y%m%d%H%M}_001_{fid}_Timestamp.MRK"),
+                  utc, lat, lon, rng=rng)
+        if is_l2:
+            with open(os.path.join(folder, f"DJI_{start:%Y%m%d%H%M}_001.LDR"), "wb") as fh:
+                fh.write(b"\x00" * 64)
+        with open(os.path.join(folder, f"DJI_{start:%Y%m%d%H%M}_001.RPOS"), "w") as fh:
+            fh.write("rpos\n")
+        write_rinex_obs(os.path.join(folder, f"VRS_{fid}.{yy}o"),
+                        utc[0] - timedelta(minutes=10), utc[-1] + timedelta(minutes=10),
+                        interval=5.0)
+        for n in range(loose_files):
+            with open(os.path.join(root, f"{fid}_extra_{n}.txt"), "w") as fh:
+                fh.write("x\n")
+        folders.append(folder)
+    return folders
+
+
+def make_wingtra_logs(root: str, n_flights: int, year: int = 2025,
+                      seed: int = 0) -> List[str]:
+    """Wingtra flights <root>/<flight>/DATA/<flight>.json.  Returns JSON paths."""
+    rng = random.Random(seed)
+    out: List[str] = []
+    for i in range(n_flights):
+        name = f"Wingtra Flight {i:04d}"
+        data = os.path.join(root, name, "DATA")
+        os.makedirs(data, exist_ok=True)
+        start = datetime(year, 7, 1, 9) + timedelta(hours=i)
+        gps_ms = ((start - GPS_EPOCH).total_seconds() + LEAP_SECONDS) * 1000
+        lat, lon = rng.uniform(*_LAT), rng.uniform(*_LON)
+        events = [{"timestamp": f"{gps_ms + k * 1000:.1f}"} for k in range(0, 1200, 60)]
+        doc = {"flight": name,
+               "coordinate": [f"{lat:.7f}", f"{lon:.7f}", f"{rng.uniform(400, 600):.2f}"],
+               "events": events}
+        path = os.path.join(data, f"{name.replace(' ', '_')}.json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(doc, fh, indent=2)
+        out.append(path)
+    return out
+
+
+def make_las_projects(root: str, n_projects: int, files_per_project: int = 1) -> None:
+    """L2 processing output: <root>/<project>/lidars/terra_las/cloud*.las (+ a .zip)."""
+    for i in range(n_projects):
+        sub = os.path.join(root, f"Project_{i:04d}", "lidars", "terra_las")
+        os.makedirs(sub, exist_ok=True)
+        for k in range(files_per_project):
+            write_las(os.path.join(sub, f"cloud{k}.las"))
+        with open(os.path.join(sub, "cloud.zip"), "wb") as fh:
+            fh.write(b"PK\x05\x06" + b"\x00" * 18)
+
+
+def make_archive(root: str, n_flights: int = 10, images_per_flight: int = 20,
+                 image_bytes: int = 4096, year: int = 2025, seed: int = 0
+                 ) -> Dict[str, str]:
+    """
+    Build every layout under *root* with `n_flights` flights each and return
+    their root folders: wze, wze_ppk, vrs, dji, wingtra, las.
+    """
+    paths = {k: os.path.join(root, k) for k in ("wze", "wze_ppk", "vrs", "dji", "wingtra", "las")}
+    fplans = make_wze_tree(paths["wze"], n_flights, images_per_flight, image_bytes, year, seed)
+    make_wze_tree(paths["wze_ppk"], n_flights, images_per_flight, image_bytes, year, seed,
+                  with_base_files=True)
+    make_vrs_folder(paths["vrs"], fplans, year)
+    make_dji_folders(paths["dji"], n_flights, images_per_flight, image_bytes, year, seed)
+    make_wingtra_logs(paths["wingtra"], n_flights, year, seed)
+    make_las_projects(paths["las"], n_flights)
+    return paths
@@ -0,0 +1,313 @@
+"""
+python -m modules – command-line entry point for scheduled runs
+
+    python -m modules query   ROOT OUT [--v2] [--recurse] [--merge] [--queue DIR]
+    python -m modules watch   ROOT OUT [--v2] [--merge] [--interval 15] [--settle 120] [--skip-existing]
+    python -m modules fplans  SAPOS_FN ROOT OUT [--workers 16]
+    python -m modules vrs     FPLAN_LIST VRS_ROOT [--merge] [--queue DIR]
+    python -m modules ingest  ZIP_OR_DIR... [--fplans FPLAN_LIST] [--flights ROOT]
+    python -m modules rinex   MASTER [--ext 25o] [--move] [--merge] [--workers 4]
+    python -m modules batch   DIRLIST BATCH_DIR LOG_DIR [--device P4M|M3E|auto] [--epn-yr 24]
+                                                        [--check-base] [--trim-base 120] [--preflight]
+                                                        [--queue DIR] [--console-log]
+    python -m modules preflight DIRLIST REPORT.csv [--workers 8]
+    python -m modules results DIRLIST|EVENTS.jsonl REPORT.csv [--workers 8]
+    python -m modules xmp     ROOT REPORT.csv [--v2] [--workers 8]
+    python -m modules images  SRC DST [--pack tar|zip] [--max-gb 4] [--workers 4]
+    python -m modules unpack  INDEX.csv DEST [--workers 4]
+    python -m modules geotag  TABLE IMAGES [--out DIR] [--workers N]
+    python -m modules las     MASTER DEST [--flat] [--keep-ext]
+    python -m modules pipeline ROOT VRS_ROOT PPK_DEST BATCH_DIR LOG_DIR [--epn-yr 24]
+                               [--merge] [--check-base] [--trim-base 120] [--workers query=4 ...]
+                               [--console-log]
+
+Global options (before the subcommand): -v / -q for verbosity and
+--profile REPORT.json to write a stage-timing report.
+
+Only argparse is imported at start-up; each subcommand imports its module
+when it runs, so `--help` and light subcommands start quickly.
+"""
+
+import argparse
+import sys
+from typing import Callable, List, Optional
+
+
+def _query(a: argparse.Namespace) -> None:
+    from modules.sapos_batch import batch_generate_sapos_queries, batch_generate_sapos_queries_v2
+    if a.v2:
+        batch_generate_sapos_queries_v2(a.root, a.out, recurse=a.recurse, merge=a.merge,
+                                        queue_dir=a.queue, sort=a.sort)
+    elif a.queue:
+        raise SystemExit("--queue needs --v2")
+    else:
+        batch_generate_sapos_queries(a.root, a.out, recurse=a.recurse, merge=a.merge)
+
+
+def _watch(a: argparse.Namespace) -> None:
+    from modules.watch import watch_sapos_queries
+    watch_sapos_queries(a.root, a.out, nested=a.v2, merge=a.merge, interval=a.interval,
+                        settle_s=a.settle, skip_existing=a.skip_existing)
+
+
+def _fplans(a: argparse.Namespace) -> None:
+    from modules.wze_uav import extract_fplans
+    extract_fplans(a.sapos_fn, a.root, a.out, workers=a.workers, sort=a.sort)
+
+
+def _vrs(a: argparse.Namespace) -> None:
+    from modules.wze_uav import copy_vrs_for_fplans
+    copy_vrs_for_fplans(a.fplan_list, a.vrs_root, merge_rinex_files=a.merge,
+                        queue_dir=a.queue, check_space=not a.no_space_check)
+
+
+def _ingest(a: argparse.Namespace) -> None:
+    from modules.sapos_ingest import ingest_sapos_archives
+    archives = a.archives[0] if len(a.archives) == 1 else a.archives
+    ingest_sapos_archives(archives, a.fplans, a.flights, workers=a.workers)
+
+
+def _rinex(a: argparse.Namespace) -> None:
+    from modules.rename_rinex_tool import batch_rename_convert
+    batch_rename_convert(a.master, ext=a.ext, keep_original=not a.move, workers=a.workers,
+                         merge=a.merge)
+
+
+def _batch(a: argparse.Namespace) -> None:
+    from modules import wze_uav
+    fn = {"auto": wze_uav.generate_redtoolbox_batch_mixed,
+          "M3E": wze_uav.generate_redtoolbox_batch_M3E,
+          "P4M": wze_uav.generate_redtoolbox_batch}[a.device]
+    fn(a.dirlist, a.batch_dir, a.log_dir, a.epn_yr, check_base=a.check_base,
+       trim_base_margin_s=a.trim_base, preflight=a.preflight, queue_dir=a.queue,
+       console_log=a.console_log)
+
+
+def _preflight(a: argparse.Namespace) -> None:
+    from modules.preflight import preflight_missions, write_preflight_report
+    from modules.wze_uav import read_dirlist
+    results = preflight_missions(read_dirlist(a.dirlist), workers=a.workers)
+    write_preflight_report(results, a.report)
+
+
+def _results(a: argparse.Namespace) -> None:
+    from modules.redtoolbox_report import collect_results, write_results_report
+    write_results_report(collect_results(a.source, workers=a.workers), a.report)
+
+
+def _xmp(a: argparse.Namespace) -> None:
+    from modules.xmp_quality import xmp_quality_report
+    if a.v2:
+        from modules.sapos_batch import iter_flight_folders_v2
+        flights = [str(p) for p in iter_flight_folders_v2(a.root, sort=True)]
+    else:
+        from modules.wze_uav import iter_folders
+        flights = list(iter_folders(a.root, sort=True))
+    xmp_quality_report(flights, a.report, workers=a.workers)
+
+
+def _images(a: argparse.Namespace) -> None:
+    if a.pack:
+        from modules.image_pack import pack_ppk_images
+        pack_ppk_images(a.src, a.dst, fmt=a.pack, max_bytes=int(a.max_gb * 1024 ** 3),
+                        workers=a.workers)
+        return
+    from modules.wze_uav import copy_ppk_images
+    copy_ppk_images(a.src, a.dst, check_space=not a.no_space_check, allow_link=a.link)
+
+
+def _unpack(a: argparse.Namespace) -> None:
+    from modules.image_pack import extract_ppk_images
+    res = extract_ppk_images(a.index, a.dest, workers=a.workers)
+    if res["damaged"] or res["missing"]:
+        raise SystemExit(1)
+
+
+def _geotag(a: argparse.Namespace) -> None:
+    from modules.exif_gps import geotag_images
+    geotag_images(a.images, a.table, output_dir=a.out, workers=a.workers)
+
+
+def _pipeline(a: argparse.Namespace) -> None:
+    from modules.pipeline import run_wze_pipeline
+    workers = {}
+    for spec in a.workers or []:
+        name, _, n = spec.partition("=")
+        workers[name] = int(n)
+    run_wze_pipeline(a.root, a.vrs_root, a.ppk_dest, a.batch_dir, a.log_dir,
+                     master_out=a.master, epn_yr=a.epn_yr, merge_rinex_files=a.merge,
+                     check_base=a.check_base, trim_base_margin_s=a.trim_base,
+                     workers=workers, queue_size=a.queue_size, console_log=a.console_log)
+
+
+def _las(a: argparse.Namespace) -> None:
+    from modules.move_files_las import move_las
+    move_las(a.master, a.dest, recursive=not a.flat, standardize_ext=not a.keep_ext)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m modules",
+                                 description="SAPOS tagging toolkit")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print one line per item")
+    ap.add_argument("-q", "--quiet", action="store_true", help="summaries and warnings only")
+    ap.add_argument("--profile", metavar="REPORT", help="write a JSON stage-timing report")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def add(name: str, func: Callable, help_: str) -> argparse.ArgumentParser:
+        p = sub.add_parser(name, help=help_)
+        p.set_defaults(func=func)
+        return p
+
+    p = add("query", _query, "generate SAPOS query files")
+    p.add_argument("root")
+    p.add_argument("out", help="master query file or folder")
+    p.add_argument("--v2", action="store_true", help="nested date/flight layout (WZE-UAV)")
+    p.add_argument("--recurse", action="store_true")
+    p.add_argument("--merge", action="store_true",
+                   help="one merged window per folder instead of one query per flight log")
+    p.add_argument("--queue", metavar="DIR",
+                   help="shared work-queue folder for running on several workstations")
+    p.add_argument("--sort", action="store_true",
+                   help="process flight folders in path order (--v2; bounded-memory sort)")
+
+    p = add("watch", _watch, "append queries of new or changed flights as they arrive")
+    p.add_argument("root")
+    p.add_argument("out", help="master query file (appended to)")
+    p.add_argument("--v2", action="store_true", help="nested date/flight layout (WZE-UAV)")
+    p.add_argument("--merge", action="store_true",
+                   help="one merged window per folder instead of one query per flight log")
+    p.add_argument("--interval", type=float, default=15.0, help="seconds between polls")
+    p.add_argument("--settle", type=float, default=120.0,
+                   help="seconds without file changes before a flight counts as complete")
+    p.add_argument("--skip-existing", action="store_true",
+                   help="only flights that appear after the start")
+
+    p = add("fplans", _fplans, "list FPLAN folders for the WZE-UAV workflow")
+    p.add_argument("sapos_fn")
+    p.add_argument("root")
+    p.add_argument("out")
+    p.add_argument("--workers", type=int, default=1, help="threads listing folders")
+    p.add_argument("--sort", action="store_true",
+                   help="write the list sorted (bounded-memory sort) instead of in scan order")
+
+    p = add("vrs", _vrs, "copy VRS files into their FPLAN folders")
+    p.add_argument("fplan_list")
+    p.add_argument("vrs_root")
+    p.add_argument("--merge", action="store_true",
+                   help="merge several RINEX files of one TNR into {TNR}_merged.<ext>")
+    p.add_argument("--queue", metavar="DIR",
+                   help="shared work-queue folder for running on several workstations")
+    p.add_argument("--no-space-check", action="store_true",
+                   help="copy without sizing the VRS items against the free space first")
+
+    p = add("ingest", _ingest, "extract SAPOS zip deliveries into FPLAN/flight folders")
+    p.add_argument("archives", nargs="+", help="zip files or one folder of zips")
+    p.add_argument("--fplans", help="FPLAN list from 'fplans' (routes {TNR}_* members)")
+    p.add_argument("--flights", help="root with @sapos_query.txt files (routes by flight name)")
+    p.add_argument("--workers", type=int, default=4)
+
+    p = add("rinex", _rinex, "rename *.25o to the .RPOS base name and make *.obs")
+    p.add_argument("master")
+    p.add_argument("--ext", default="25o")
+    p.add_argument("--move", action="store_true", help="rename instead of copying to .obs")
+    p.add_argument("--merge", action="store_true",
+                   help="merge several .EXT of one .RPOS into the .obs")
+    p.add_argument("--workers", type=int, default=4)
+
+    p = add("batch", _batch, "write the REDtoolbox batch file")
+    p.add_argument("dirlist")
+    p.add_argument("batch_dir")
+    p.add_argument("log_dir")
+    p.add_argument("--device", choices=["P4M", "M3E", "auto"], default="P4M")
+    p.add_argument("--epn-yr", default="24")
+    p.add_argument("--check-base", action="store_true",
+                   help="skip missions whose base RINEX does not cover the flight")
+    p.add_argument("--trim-base", type=float, metavar="SECONDS",
+                   help="trim base RINEX files to the flight window plus SECONDS")
+    p.add_argument("--preflight", action="store_true",
+                   help="check MRK records against images first, skip missions with errors")
+    p.add_argument("--queue", metavar="DIR",
+                   help="shared work-queue folder for running on several workstations")
+    p.add_argument("--console-log", action="store_true",
+                   help="keep REDtoolbox output in output_dir for the `results` report")
+
+    p = add("preflight", _preflight, "check MRK records against images for all missions")
+    p.add_argument("dirlist")
+    p.add_argument("report", help="CSV report")
+    p.add_argument("--workers", type=int, default=8)
+
+    p = add("results", _results, "collect REDtoolbox results and throughput after a batch run")
+    p.add_argument("source", help="mission list or the batch run's .jsonl event file")
+    p.add_argument("report", help="CSV report (per-device table next to it)")
+    p.add_argument("--workers", type=int, default=8)
+
+    p = add("xmp", _xmp, "per-image RTK quality from the DJI XMP, one table per flight")
+    p.add_argument("root", help="folder with the flight folders")
+    p.add_argument("report", help="CSV report, one row per flight")
+    p.add_argument("--v2", action="store_true", help="nested date/flight layout (WZE-UAV)")
+    p.add_argument("--workers", type=int, default=8, help="threads reading images")
+
+    p = add("images", _images, "copy MEDIA/EXIF_images folders for Metashape")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p.add_argument("--pack", choices=("tar", "zip"),
+                   help="write size-capped archives + index into DST instead of copying")
+    p.add_argument("--max-gb", type=float, default=4.0, help="size cap per archive")
+    p.add_argument("--workers", type=int, default=4, help="reader threads")
+    p.add_argument("--link", action="store_true",
+                   help="hard-link instead of copying when DST is on the same drive")
+    p.add_argument("--no-space-check", action="store_true",
+                   help="copy without sizing the folders against the free space first")
+
+    p = add("unpack", _unpack, "extract packed images and verify them against the index")
+    p.add_argument("index", help="<name>_index.csv next to the archives")
+    p.add_argument("dest")
+    p.add_argument("--workers", type=int, default=4)
+
+    p = add("geotag", _geotag, "write PPK positions into the EXIF GPS tags in place")
+    p.add_argument("table", help="CSV with image name, lat, lon, alt columns")
+    p.add_argument("images")
+    p.add_argument("--out", help="patch copies in this folder instead of the originals")
+    p.add_argument("--workers", type=int, help="processes (default: CPU count)")
+
+    p = add("las", _las, "collect .las files into one folder")
+    p.add_argument("master")
+    p.add_argument("dest")
+    p.add_argument("--flat", action="store_true", help="only top level of each project")
+    p.add_argument("--keep-ext", action="store_true", help="keep the original extension case")
+
+    p = add("pipeline", _pipeline, "WZE-UAV workflow as one streaming pipeline per flight")
+    p.add_argument("root", help="<date>/<TNR> flight folders")
+    p.add_argument("vrs_root")
+    p.add_argument("ppk_dest", help="destination of the MEDIA/EXIF_images copies")
+    p.add_argument("batch_dir")
+    p.add_argument("log_dir")
+    p.add_argument("--master", help="master query file (default: in LOG_DIR)")
+    p.add_argument("--epn-yr", default="24")
+    p.add_argument("--merge", action="store_true", help="merge split RINEX deliveries")
+    p.add_argument("--check-base", action="store_true")
+    p.add_argument("--trim-base", type=float, metavar="SECONDS")
+    p.add_argument("--workers", nargs="+", metavar="STAGE=N",
+                   help="threads per stage (query, vrs, batch, images)")
+    p.add_argument("--queue-size", type=int, default=8, help="flights buffered between stages")
+    p.add_argument("--console-log", action="store_true",
+                   help="keep REDtoolbox output in output_dir for the `results` report")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.verbose or args.quiet:
+        from modules.progress import set_verbosity, VERBOSE, QUIET
+        set_verbosity(VERBOSE if args.verbose else QUIET)
+    if args.profile:
+        from modules.profiling import profile_run
+        with profile_run(args.profile, name=args.cmd):
+            args.func(args)
+    else:
+        args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+detectors.py – platform detection from a single folder listing
+
+Every supported platform is a `Detector` in REGISTRY.  A detector declares
+its evidence (marker file patterns, an MRK naming scheme, EXIF camera
+models), the SAPOS query builder it uses (key of
+`sapos_query.QUERY_BUILDERS`) and its REDtoolbox profile (key of
+`wze_uav.DEVICE_PROFILES`, None when not processed by REDtoolbox).
+
+`detect_platform` lists the folder once and runs all probes against that
+listing, cheapest first, stopping at the first hit:
+
+  • COST_NAME      file-name patterns, no I/O beyond the listing
+  • COST_EXIF      camera model from the first JPG (bounded header read)
+  • COST_FALLBACK  catch-alls such as "any *.MRK", tried last
+
+Probes of equal cost run in registry order.  To support another platform,
+call `register_detector` (or append to REGISTRY) – query generation and the
+REDtoolbox batch pick it up without further changes.
+"""
+
+import fnmatch
+import ntpath
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from modules.jpeg_meta import read_camera_model
+from modules.profiling import count
+
+__all__ = ["COST_NAME", "COST_EXIF", "COST_FALLBACK", "Detector", "REGISTRY",
+           "register_detector", "scan_folder", "detect_platform"]
+
+COST_NAME = 1
+COST_EXIF = 10
+COST_FALLBACK = 100
+
+
+class Detector:
+    """
+    One platform and the evidence that identifies it.
+
+    Parameters
+    ----------
+    name : str
+        Short platform name (e.g. 'M3E').
+    label : str
+        Human-readable name used in progress messages.
+    query : str
+        Key of the SAPOS query builder ('wingtra' or 'dji').
+    profile : str | None
+        Key of the REDtoolbox device profile, None if not processed there.
+    markers : sequence of str
+        Case-insensitive file-name patterns; any match identifies the platform.
+    mrk_name : str | None
+        Regex matched (case-insensitive) against the *.MRK file names.
+    exif_models : sequence of str
+        EXIF IFD0 'Model' prefixes of the camera (first JPG of the folder).
+    cost : int
+        Cost of the name probes (markers, mrk_name); COST_FALLBACK puts a
+        catch-all behind every EXIF probe.
+    icon : str
+        Prefix of the progress messages.
+    """
+
+    def __init__(self, name: str, label: str, query: str,
+                 profile: Optional[str] = None,
+                 markers: Sequence[str] = (),
+                 mrk_name: Optional[str] = None,
+                 exif_models: Sequence[str] = (),
+                 cost: int = COST_NAME,
+                 icon: str = "🛸"):
+        self.name = name
+        self.label = label
+        self.query = query
+        self.profile = profile
+        self.markers = tuple(p.lower() for p in markers)
+        self.mrk_name = re.compile(mrk_name, re.IGNORECASE) if mrk_name else None
+        self.exif_models = tuple(m.upper() for m in exif_models)
+        self.cost = cost
+        self.icon = icon
+
+    def probes(self) -> List[Tuple[int, str]]:
+        """(cost, kind) of every probe this detector declares."""
+        out = []
+        if self.markers:
+            out.append((self.cost, "markers"))
+        if self.mrk_name is not None:
+            out.append((self.cost, "mrk_name"))
+        if self.exif_models:
+            out.append((COST_EXIF, "exif"))
+        return out
+
+    def __repr__(self) -> str:
+        return f"Detector({self.name!r})"
+
+
+# Wingtra first and the generic MRK catch-all last keep the order
+# generate_sapos_query always had (JSON, then LDR, then any MRK).
+REGISTRY: List[Detector] = [
+    Detector("wingtra", "Wingtra", query="wingtra",
+             markers=("*.json",), icon="🛩"),
+    Detector("L2", "DJI Zenmuse L2", query="dji", profile="L2",
+             markers=("*.ldr",), exif_models=("L2",), icon="🚁"),
+    Detector("P4M", "DJI Phantom 4 Multispectral", query="dji", profile="P4M",
+             mrk_name=r"^\d{3}_\d{4}_Timestamp\.MRK$", exif_models=("FC6360",)),
+    Detector("M3E", "DJI Mavic 3 Enterprise", query="dji", profile="M3E",
+             mrk_name=r"^DJI_\d{12}_\d{3}_(.+_)?Timestamp\.MRK$",
+             exif_models=("M3E", "M3M")),
+    Detector("dji", "DJI (MRK)", query="dji",
+             markers=("*.mrk",), cost=COST_FALLBACK),
+]
+
+
+def register_detector(detector: Detector, before: Optional[str] = None) -> Detector:
+    """
+    Add *detector* to REGISTRY (replacing one of the same name).  With
+    `before`, it is inserted ahead of that detector, which decides ties
+    between probes of equal cost.
+    """
+    REGISTRY[:] = [d for d in REGISTRY if d.name != detector.name]
+    names = [d.name for d in REGISTRY]
+    REGISTRY.insert(names.index(before) if before in names else len(REGISTRY), detector)
+    return detector
+
+
+def scan_folder(d: str) -> List[str]:
+    """Walk folder `d` once and return every file path below it."""
+    listing: List[str] = []
+    stack = [d]
+    while stack:
+        cur = stack.pop()
+        count("dirs_listed")
+        with os.scandir(cur) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    listing.append(entry.path)
+    count("files_seen", len(listing))
+    return listing
+
+
+class _Evidence:
+    """What the probes look at, each part computed on first use."""
+
+    def __init__(self, listing: List[str]):
+        self.listing = listing
+        self._names: Optional[List[str]] = None
+        self._model: Optional[str] = None
+        self._model_read = False
+
+    @property
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = [ntpath.basename(f) for f in self.listing]
+        return self._names
+
+    @property
+    def model(self) -> Optional[str]:
+        if not self._model_read:
+            self._model_read = True
+            jpgs = [f for f in self.listing if f.lower().endswith(".jpg")]
+            if jpgs:
+                count("exif_reads")
+                try:
+                    model = read_camera_model(min(jpgs))
+                except OSError:
+                    model = None
+                self._model = model.upper() if model else None
+        return self._model
+
+    def matches(self, det: Detector, kind: str) -> bool:
+        count("detector_probes")
+        if kind == "markers":
+            return any(fnmatch.fnmatchcase(n.lower(), p)
+                       for p in det.markers for n in self.names)
+        if kind == "mrk_name":
+            return any(det.mrk_name.match(n) for n in self.names
+                       if n.lower().endswith(".mrk"))
+        model = self.model
+        return model is not None and model.startswith(det.exif_models)
+
+
+def detect_platform(
+    d: str,
+    listing: Optional[List[str]] = None,
+    detectors: Optional[Sequence[Detector]] = None
+) -> Optional[Detector]:
+    """
+    Return the detector matching folder `d`, or None.
+
+    `listing` is the output of `scan_folder(d)` (computed here when not
+    given); `detectors` defaults to REGISTRY.  Probes run cheapest first
+    and the first hit wins, so the JPG header is only read when no name
+    probe matched.
+    """
+    detectors = REGISTRY if detectors is None else detectors
+    if listing is None:
+        listing = scan_folder(d)
+    probes = sorted(((cost, i, kind) for i, det in enumerate(detectors)
+                     for cost, kind in det.probes()), key=lambda p: p[:2])
+    evidence = _Evidence(listing)
+    for _, i, kind in probes:
+        if evidence.matches(detectors[i], kind):
+            return detectors[i]
+    return None
@@ -0,0 +1,152 @@
+"""
+disk_space.py – size a planned copy/move and fit it to the free space
+
+Before `copy_ppk_images`, `copy_vrs_for_fplans` or
+`move_files_like_subfolders` start, the transfer is planned in whole units
+(an image folder, the VRS items of one TNR, one subfolder):
+
+  • size        summed from the os.scandir entries of the scan, no file reads
+  • method      per unit and target volume: "rename" for a move on the same
+                volume (needs no space), "link" (hard link) for a copy on the
+                same volume when allowed, otherwise "copy" / "copy+delete"
+  • fit         units are scheduled in order while they fit into the free
+                space of their target volume (shutil.disk_usage) minus
+                `reserve_bytes`; units that do not fit are deferred and never
+                started, so a full drive does not leave half-copied trees
+
+The planned bytes go into `Progress(total_bytes=...)`, whose status line
+then projects the remaining time from the measured throughput.
+"""
+
+import os
+import shutil
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modules.progress import Progress, format_bytes
+from modules.profiling import count
+
+__all__ = ["RESERVE_BYTES", "tree_size", "existing_ancestor", "same_volume",
+           "transfer_method", "plan_transfers", "report_plan", "link_or_copy"]
+
+# free space left untouched on every target volume
+RESERVE_BYTES = 1 << 30
+
+
+def tree_size(path: str) -> Tuple[int, int]:
+    """(files, bytes) below *path* (or of the file *path*), from DirEntry stats."""
+    if not os.path.isdir(path):
+        return 1, os.path.getsize(path)
+    files = nbytes = 0
+    stack = [path]
+    while stack:
+        cur = stack.pop()
+        count("dirs_listed")
+        with os.scandir(cur) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.is_file():
+                    files += 1
+                    nbytes += e.stat().st_size
+    count("files_seen", files)
+    return files, nbytes
+
+
+def existing_ancestor(path: str) -> str:
+    """*path* itself or its closest parent that exists (targets may not yet)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def same_volume(src: str, dst: str) -> bool:
+    """Do *src* and (the existing part of) *dst* live on the same device?"""
+    return os.stat(src).st_dev == os.stat(existing_ancestor(dst)).st_dev
+
+
+def transfer_method(src: str, dst: str, move: bool, allow_link: bool = False) -> str:
+    """"rename", "copy+delete", "link" or "copy" for one unit."""
+    same = same_volume(src, dst)
+    if move:
+        return "rename" if same else "copy+delete"
+    return "link" if same and allow_link else "copy"
+
+
+def plan_transfers(
+    units: Iterable[Tuple[str, str, str]],
+    move: bool = False,
+    allow_link: bool = False,
+    reserve_bytes: int = RESERVE_BYTES,
+    sizes: Optional[Dict[str, Tuple[int, int]]] = None
+) -> Dict:
+    """
+    Plan the transfer of *units*, each (name, src, dst).
+
+    `sizes` maps a name to a known (files, bytes), e.g. from a listing the
+    caller already made; other units are sized with `tree_size`.  Returns
+    {"units": [...], "deferred": [...], "volumes": {...}, "files", "bytes"}:
+    every unit is a dict with name/src/dst/files/bytes/method/needed; the
+    volumes are keyed by the existing target path and hold free/needed.
+    """
+    scheduled: List[Dict] = []
+    deferred: List[Dict] = []
+    volumes: Dict[int, Dict] = {}
+    for name, src, dst in units:
+        files, nbytes = sizes[name] if sizes and name in sizes else tree_size(src)
+        method = transfer_method(src, dst, move, allow_link)
+        needed = 0 if method in ("rename", "link") else nbytes
+        target = existing_ancestor(dst)
+        dev = os.stat(target).st_dev
+        vol = volumes.get(dev)
+        if vol is None:
+            vol = volumes[dev] = {"path": target, "free": shutil.disk_usage(target).free,
+                                  "needed": 0, "deferred": 0}
+        unit = {"name": name, "src": src, "dst": dst, "files": files, "bytes": nbytes,
+                "method": method, "needed": needed}
+        if vol["needed"] + needed > vol["free"] - reserve_bytes:
+            vol["deferred"] += needed
+            deferred.append(unit)
+            continue
+        vol["needed"] += needed
+        scheduled.append(unit)
+    return {
+        "units": scheduled,
+        "deferred": deferred,
+        "volumes": {v["path"]: v for v in volumes.values()},
+        "files": sum(u["files"] for u in scheduled),
+        "bytes": sum(u["bytes"] for u in scheduled),
+    }
+
+
+def report_plan(plan: Dict, prog: Progress) -> None:
+    """Print the per-volume summary of *plan* and warn about deferred units."""
+    methods: Dict[str, int] = {}
+    for u in plan["units"]:
+        methods[u["method"]] = methods.get(u["method"], 0) + 1
+    prog.info(f"📦 {len(plan['units'])} unit(s), {plan['files']} files, "
+              f"{format_bytes(plan['bytes'])} ("
+              + ", ".join(f"{n} {m}" for m, n in sorted(methods.items())) + ")")
+    for path, vol in plan["volumes"].items():
+        prog.info(f"💾 {path}: {format_bytes(vol['needed'])} needed, "
+                  f"{format_bytes(vol['free'])} free")
+    if plan["deferred"]:
+        prog.warn(f"⛔ Not enough space for {len(plan['deferred'])} unit(s) "
+                  f"({format_bytes(sum(u['needed'] for u in plan['deferred']))}); "
+                  f"they are not started:")
+        for u in plan["deferred"]:
+            prog.warn(f"    {u['name']} ({format_bytes(u['needed'])})")
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """Hard-link *src* to *dst* (copy2 where the file system refuses)."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
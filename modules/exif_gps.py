@@ -0,0 +1,222 @@
+"""
+exif_gps.py – write PPK positions into the EXIF GPS IFD of existing JPGs
+
+DJI images already carry a GPS IFD with GPSLatitude/Longitude/Altitude.
+`patch_gps` overwrites those values where they are – a few dozen bytes per
+image – without touching the rest of the file, so geotagging is bounded by
+metadata I/O instead of full image copies.  `geotag_images` applies a
+position table (CSV or {image name: (lat, lon, alt)}) to a folder on a
+process pool; images are copied first only when an output folder is given.
+"""
+
+import csv
+import os
+import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from modules.jpeg_meta import find_exif, read_head, read_ifd
+from modules.progress import Progress
+from modules.profiling import stage, count
+
+__all__ = ["read_position_table", "patch_gps", "geotag_images"]
+
+Position = Tuple[float, float, float]
+
+TAG_GPS_IFD = 0x8825
+_GPS_LAT_REF, _GPS_LAT, _GPS_LON_REF, _GPS_LON, _GPS_ALT_REF, _GPS_ALT = range(1, 7)
+
+# accepted CSV column names (lower case)
+_NAME_COLS = ("image", "name", "file", "filename", "photo", "label")
+_LAT_COLS = ("lat", "latitude")
+_LON_COLS = ("lon", "long", "longitude")
+_ALT_COLS = ("alt", "altitude", "ellh", "height", "h")
+
+
+def read_position_table(csv_fn: str) -> Dict[str, Position]:
+    """
+    {image name: (lat, lon, alt)} from a CSV file with a header row.
+
+    The delimiter (',', ';' or tab) is detected; columns are matched by name
+    (image/name/file, lat/latitude, lon/longitude, alt/altitude/ellh/height,
+    case-insensitive).  Decimal commas are accepted.
+    """
+    with open(csv_fn, newline="", encoding="utf-8-sig") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        reader = csv.reader(fh, dialect)
+        header = [h.strip().lower() for h in next(reader)]
+
+        def _col(names: Tuple[str, ...]) -> int:
+            for n in names:
+                if n in header:
+                    return header.index(n)
+            raise ValueError(f"No column {names} in {csv_fn}: {header}")
+
+        i_name, i_lat, i_lon, i_alt = (_col(c) for c in
+                                       (_NAME_COLS, _LAT_COLS, _LON_COLS, _ALT_COLS))
+        table: Dict[str, Position] = {}
+        for row in reader:
+            if len(row) <= max(i_name, i_lat, i_lon, i_alt) or not row[i_name].strip():
+                continue
+            lat, lon, alt = (float(row[i].replace(",", ".")) for i in (i_lat, i_lon, i_alt))
+            table[os.path.basename(row[i_name].strip())] = (lat, lon, alt)
+    return table
+
+
+def _dms_rational(value: float, endian: str) -> bytes:
+    """|value| as three EXIF RATIONALs: degrees/1, minutes/1, seconds/10^6."""
+    v = abs(value)
+    deg = int(v)
+    minutes = int((v - deg) * 60)
+    sec = round(((v - deg) * 60 - minutes) * 60 * 1_000_000)
+    if sec >= 60 * 1_000_000:           # rounding carried into the next minute
+        sec -= 60 * 1_000_000
+        minutes += 1
+        if minutes == 60:
+            minutes, deg = 0, deg + 1
+    return struct.pack(endian + "6I", deg, 1, minutes, 1, sec, 1_000_000)
+
+
+def patch_gps(path: str, lat: float, lon: float, alt: float) -> int:
+    """
+    Overwrite GPSLatitude/Longitude/Altitude (and their Ref tags) of *path*
+    in place.  Only the existing GPS IFD values are rewritten; the tags must
+    already be present with their standard types, otherwise ValueError is
+    raised and the file is left untouched.
+
+    Returns the number of bytes written.
+    """
+    data = read_head(path)
+    found = find_exif(data)
+    if found is None:
+        raise ValueError(f"No EXIF block in {path}")
+    tiff, endian = found
+    (ifd0,) = struct.unpack(endian + "I", data[tiff + 4:tiff + 8])
+    ptr = read_ifd(data, tiff, ifd0, endian).get(TAG_GPS_IFD)
+    if ptr is None:
+        raise ValueError(f"No GPS IFD in {path}")
+    (gps_off,) = struct.unpack(endian + "I", data[ptr[2]:ptr[2] + 4])
+    gps = read_ifd(data, tiff, gps_off, endian)
+
+    expected = {_GPS_LAT_REF: (2, 2), _GPS_LAT: (5, 3), _GPS_LON_REF: (2, 2),
+                _GPS_LON: (5, 3), _GPS_ALT_REF: (1, 1), _GPS_ALT: (5, 1)}
+    for tag, (typ, n) in expected.items():
+        entry = gps.get(tag)
+        if entry is None or entry[:2] != (typ, n) or entry[2] + 8 * n > len(data):
+            raise ValueError(f"GPS tag {tag} missing or unexpected in {path}")
+
+    writes = [
+        (gps[_GPS_LAT_REF][2], b"N\x00" if lat >= 0 else b"S\x00"),
+        (gps[_GPS_LAT][2], _dms_rational(lat, endian)),
+        (gps[_GPS_LON_REF][2], b"E\x00" if lon >= 0 else b"W\x00"),
+        (gps[_GPS_LON][2], _dms_rational(lon, endian)),
+        (gps[_GPS_ALT_REF][2], bytes([0 if alt >= 0 else 1])),
+        (gps[_GPS_ALT][2], struct.pack(endian + "2I", round(abs(alt) * 1000), 1000)),
+    ]
+    with open(path, "r+b") as fh:
+        for off, payload in writes:
+            fh.seek(off)
+            fh.write(payload)
+    return sum(len(p) for _, p in writes)
+
+
+def _geotag_one(job: Tuple[str, Optional[str], Position]) -> Tuple[str, int, Optional[str]]:
+    """Process-pool worker: copy if needed, then patch.  (src, bytes, error)."""
+    src, dst, (lat, lon, alt) = job
+    try:
+        target = src
+        if dst is not None:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+            target = dst
+        return src, patch_gps(target, lat, lon, alt), None
+    except (OSError, ValueError) as exc:
+        return src, 0, str(exc)
+
+
+def geotag_images(
+    image_dir: str,
+    positions: Union[str, Mapping[str, Position], Iterable[Tuple[str, float, float, float]]],
+    output_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    recursive: bool = True
+) -> Dict[str, List]:
+    """
+    Write positions into the EXIF GPS tags of the JPGs below *image_dir*.
+
+    Parameters
+    ----------
+    image_dir : str
+        Folder with the images.
+    positions : str | mapping | iterable
+        CSV file (see `read_position_table`), {name: (lat, lon, alt)} or
+        rows (name, lat, lon, alt).  Images are matched by file name.
+    output_dir : str | None
+        None (or `image_dir` itself) patches the images in place; otherwise
+        each image is copied to the same relative path below `output_dir`
+        and the copy is patched.
+    workers : int | None
+        Processes used (default: CPU count).
+    recursive : bool
+        Include sub-folders of *image_dir*.
+
+    Returns
+    -------
+    dict
+        {"tagged": [path, ...], "no_position": [path, ...],
+         "failed": [(path, error), ...], "unused": [name, ...]}
+    """
+    if isinstance(positions, str):
+        positions = read_position_table(positions)
+    elif not isinstance(positions, Mapping):
+        positions = {os.path.basename(str(n)): (float(la), float(lo), float(h))
+                     for n, la, lo, h in positions}
+    if output_dir is not None and os.path.abspath(output_dir) == os.path.abspath(image_dir):
+        output_dir = None
+
+    with stage("scan"):
+        images: List[str] = []
+        for root, dirs, files in os.walk(image_dir):
+            images.extend(os.path.join(root, f) for f in sorted(files)
+                          if f.lower().endswith((".jpg", ".jpeg")))
+            if not recursive:
+                break
+    count("files_seen", len(images))
+
+    summary: Dict[str, List] = {"tagged": [], "no_position": [], "failed": [], "unused": []}
+    jobs = []
+    for src in images:
+        pos = positions.get(os.path.basename(src))
+        if pos is None:
+            summary["no_position"].append(src)
+            continue
+        dst = (os.path.join(output_dir, os.path.relpath(src, image_dir))
+               if output_dir is not None else None)
+        jobs.append((src, dst, pos))
+    used = {os.path.basename(j[0]) for j in jobs}
+    summary["unused"] = sorted(n for n in positions if n not in used)
+
+    prog = Progress("geotag_images", total=len(jobs), unit="images")
+    n_proc = workers or os.cpu_count() or 1
+    chunk = max(1, len(jobs) // (8 * n_proc))
+    with stage("geotag"), ProcessPoolExecutor(max_workers=n_proc) as ex:
+        for src, nbytes, err in ex.map(_geotag_one, jobs, chunksize=chunk):
+            if err is None:
+                summary["tagged"].append(src)
+                count("exif_bytes_written", nbytes)
+                prog.advance()
+                prog.detail(f"📍 {src}")
+            else:
+                summary["failed"].append((src, err))
+                prog.fail(f"❌ {src}: {err}")
+
+    if summary["no_position"]:
+        prog.warn(f"⚠️  {len(summary['no_position'])} image(s) without a position")
+    if summary["unused"]:
+        prog.warn(f"⚠️  {len(summary['unused'])} position(s) without an image")
+    prog.done(f"{len(summary['tagged'])} tagged"
+              + (f" into {output_dir}" if output_dir else " in place"))
+    return summary
@@ -0,0 +1,251 @@
+"""
+flight_index.py – one keyed table linking flights, queries, FPLANs and VRS
+
+The WZE-UAV staging steps all need the same links:
+
+    flight → SAPOS query line → TNR → VRS items → FPLAN folder
+
+`build_flight_index` builds them once, from hash maps keyed by TNR:
+
+  • queries   the master SAPOS query file; the flight name is the last field
+              of each line and its leading number is the TNR (flight folders
+              of the nested layout are named after the TNR), the date is the
+              dd.mm.yyyy field
+  • FPLANs    the FPLAN list from `extract_fplans`; the TNR is the folder
+              above the first path component containing "FPLAN", the date
+              the <YYYYMMDD>_* folder above the TNR
+  • VRS       one listing of the VRS folder; items are named "{TNR}_*"
+
+Queries are joined on (date, TNR), so a TNR flown on several days keeps
+its flights apart; FPLAN folders without a date folder take the flights of
+all days.
+
+Each source is read once and joined by dict lookups, O(n) overall.  The
+result has one row per FPLAN folder plus the entries of every source that
+found no partner ("unmatched").  `write_flight_index` persists it as a
+';'-separated table next to the FPLAN list (`<list>_index.csv`), which
+`copy_vrs_for_fplans` and `sapos_ingest` read instead of re-deriving the
+links from paths.
+"""
+
+import csv
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modules.disk_space import tree_size
+from modules.progress import Progress
+from modules.profiling import stage, count
+
+__all__ = ["read_fplan_list", "split_fplan_path", "fplan_date", "tnr_of_flight",
+           "read_query_flights",
+           "index_fplans", "index_vrs", "build_flight_index", "flight_index_path",
+           "write_flight_index", "read_flight_index", "load_flight_index",
+           "report_unmatched"]
+
+INDEX_FIELDS = ["tnr", "fplan_dir", "flights", "queries", "vrs"]
+_SEP = "|"      # separates several values inside one cell
+
+
+def read_fplan_list(fplan_list_fn: str) -> List[str]:
+    """Read the FPLAN paths written by `extract_fplans` (blank lines dropped)."""
+    with open(fplan_list_fn, 'r', encoding='utf-8') as fp:
+        return [ln.strip() for ln in fp if ln.strip()]
+
+
+def split_fplan_path(fplan_path: str) -> Optional[Tuple[str, str]]:
+    """
+    Return (fplan_dir, tnr_code) for a path from the FPLAN list: the first
+    path component containing "FPLAN" and the directory name just above it.
+    Returns None if no component contains "FPLAN".
+    """
+    parts = fplan_path.split(os.sep)
+    try:
+        idx = next(i for i, p in enumerate(parts) if 'FPLAN' in p.upper())
+    except StopIteration:
+        return None
+    return os.sep.join(parts[:idx+1]), parts[idx-1]
+
+
+def fplan_date(fplan_dir: str) -> str:
+    """YYYYMMDD of the <date>_* folder above an FPLAN folder's TNR, "" if it has none."""
+    parts = fplan_dir.split(os.sep)
+    head = parts[-3][:8] if len(parts) >= 3 else ""
+    return head if len(head) == 8 and head.isdigit() else ""
+
+
+def _query_date(line: str) -> str:
+    """YYYYMMDD of the dd.mm.yyyy field of a query line, "" if it has none."""
+    m = re.search(r"\b(\d{2})\.(\d{2})\.(\d{4})\b", line)
+    return m.group(3) + m.group(2) + m.group(1) if m else ""
+
+
+def tnr_of_flight(flight: str) -> Optional[str]:
+    """TNR of a query flight name ("16197" or "16197_<sub-flight>"), None if not numeric."""
+    head = flight.split("_", 1)[0]
+    return head if head.isdigit() else None
+
+
+def read_query_flights(sapos_fn: str) -> Dict[Tuple[str, str], List[Tuple[str, str]]]:
+    """
+    {(date, TNR): [(flight, query line), ...]} of a SAPOS query file, date
+    as YYYYMMDD; TNR "" for non-TNR flights.
+    """
+    out: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+    with open(sapos_fn, encoding="utf-8") as fh:
+        for line in fh:
+            fields = line.split()
+            if not fields:
+                continue
+            flight = fields[-1]
+            key = (_query_date(line), tnr_of_flight(flight) or "")
+            out.setdefault(key, []).append((flight, line.strip()))
+    return out
+
+
+def index_fplans(fplan_paths: Iterable[str]) -> Dict[str, str]:
+    """{FPLAN folder: TNR} in list order; paths without an FPLAN component are left out."""
+    out: Dict[str, str] = {}
+    for path in fplan_paths:
+        t = split_fplan_path(path)
+        if t is not None:
+            out.setdefault(t[0], t[1])
+    return out
+
+
+def index_vrs(
+    vrs_root: str,
+    sizes: Optional[Dict[str, Tuple[int, int]]] = None
+) -> Dict[str, List[str]]:
+    """
+    {TNR: sorted item names} from one listing of *vrs_root* ("{TNR}_*" items,
+    TNR numeric like in `tnr_of_flight`; other names are left out).
+    With `sizes`, (files, bytes) of every item is stored there by name, from
+    the DirEntry of the same listing (folders are summed with `tree_size`).
+    """
+    out: Dict[str, List[str]] = {}
+    with stage("scan"), os.scandir(vrs_root) as it:
+        for e in it:
+            tnr = tnr_of_flight(e.name) if "_" in e.name else None
+            if tnr is not None:
+                out.setdefault(tnr, []).append(e.name)
+                if sizes is not None:
+                    sizes[e.name] = (tree_size(e.path) if e.is_dir()
+                                     else (1, e.stat().st_size))
+    count("dirs_listed")
+    for names in out.values():
+        names.sort()
+    return out
+
+
+def build_flight_index(
+    fplan_paths: Iterable[str],
+    sapos_fn: Optional[str] = None,
+    vrs_root: Optional[str] = None
+) -> Dict:
+    """
+    Join the FPLAN list with the query file (on date and TNR) and the VRS
+    folder (on TNR); both are optional.
+
+    Returns {"rows": [...], "unmatched": {...}, "vrs_sizes": {...}}.  Each
+    row is a dict with tnr, fplan_dir, flights, queries and vrs (lists);
+    "unmatched" holds the query flights without FPLAN ("queries"), the FPLAN
+    folders without query ("fplans_without_query", only with `sapos_fn`) or
+    without VRS items ("fplans_without_vrs", only with `vrs_root`), VRS
+    items whose TNR has no FPLAN folder ("vrs") and list entries without an
+    FPLAN component ("paths").  "vrs_sizes" maps every VRS item name to
+    (files, bytes) from the same listing, for `disk_space.plan_transfers`.
+    """
+    fplan_paths = list(fplan_paths)
+    fplans = index_fplans(fplan_paths)
+    queries = read_query_flights(sapos_fn) if sapos_fn else {}
+    vrs_sizes: Dict[str, Tuple[int, int]] = {}
+    vrs = index_vrs(vrs_root, vrs_sizes) if vrs_root else {}
+
+    by_tnr: Dict[str, List[Tuple[str, str]]] = {}
+    for (_, t), fl in queries.items():
+        by_tnr.setdefault(t, []).extend(fl)
+
+    rows: List[Dict] = []
+    matched = set()
+    for fplan_dir, tnr in fplans.items():
+        day = fplan_date(fplan_dir)
+        if day:
+            matched.add((day, tnr))
+            flights = queries.get((day, tnr), [])
+        else:
+            matched.update(k for k in queries if k[1] == tnr)
+            flights = by_tnr.get(tnr, [])
+        rows.append({"tnr": tnr, "fplan_dir": fplan_dir,
+                     "flights": [f for f, _ in flights],
+                     "queries": [q for _, q in flights],
+                     "vrs": list(vrs.get(tnr, []))})
+    count("index_rows", len(rows))
+
+    tnrs = set(fplans.values())
+    unmatched = {
+        "queries": [f for k, fl in queries.items() if k not in matched for f, _ in fl],
+        "fplans_without_query": [r["fplan_dir"] for r in rows if sapos_fn and not r["flights"]],
+        "fplans_without_vrs": [r["fplan_dir"] for r in rows if vrs_root and not r["vrs"]],
+        "vrs": [n for t, names in vrs.items() if t not in tnrs for n in names],
+        "paths": [p for p in fplan_paths if split_fplan_path(p) is None],
+    }
+    return {"rows": rows, "unmatched": unmatched, "vrs_sizes": vrs_sizes}
+
+
+def flight_index_path(fplan_list_fn: str) -> str:
+    """Where the index of an FPLAN list lives: `<list>_index.csv`."""
+    return os.path.splitext(fplan_list_fn)[0] + "_index.csv"
+
+
+def write_flight_index(index: Dict, index_fn: str) -> None:
+    """One ';'-separated row per FPLAN folder; list cells joined with '|'."""
+    with open(index_fn, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(INDEX_FIELDS)
+        for r in index["rows"]:
+            w.writerow([r["tnr"], r["fplan_dir"], _SEP.join(r["flights"]),
+                        _SEP.join(r["queries"]), _SEP.join(r["vrs"])])
+
+
+def read_flight_index(index_fn: str) -> List[Dict]:
+    """Rows written by `write_flight_index`, list cells split again."""
+    rows: List[Dict] = []
+    with open(index_fn, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh, delimiter=";"):
+            rec = {"tnr": row["tnr"], "fplan_dir": row["fplan_dir"]}
+            for k in ("flights", "queries", "vrs"):
+                rec[k] = row[k].split(_SEP) if row[k] else []
+            rows.append(rec)
+    return rows
+
+
+def load_flight_index(fplan_list_fn: str) -> List[Dict]:
+    """
+    Rows of `<fplan_list>_index.csv` when it is at least as new as the FPLAN
+    list, otherwise rows joined from the list alone (no queries/VRS).
+    """
+    index_fn = flight_index_path(fplan_list_fn)
+    if (os.path.exists(index_fn)
+            and os.path.getmtime(index_fn) >= os.path.getmtime(fplan_list_fn)):
+        return read_flight_index(index_fn)
+    return build_flight_index(read_fplan_list(fplan_list_fn))["rows"]
+
+
+def report_unmatched(index: Dict, prog: Progress,
+                     keys: Optional[Iterable[str]] = None) -> None:
+    """Warn about the source entries the join could not place (all `keys` by default)."""
+    labels = {
+        "paths": "FPLAN list entr(y/ies) without FPLAN folder in the path",
+        "queries": "query flight(s) without FPLAN folder",
+        "fplans_without_query": "FPLAN folder(s) without SAPOS query",
+        "fplans_without_vrs": "FPLAN folder(s) without VRS items",
+        "vrs": "VRS item(s) without FPLAN folder",
+    }
+    for key, label in labels.items():
+        if keys is not None and key not in keys:
+            continue
+        items = index["unmatched"][key]
+        if items:
+            prog.warn(f"⚠️  {len(items)} {label}: {', '.join(items[:10])}"
+                      + (" …" if len(items) > 10 else ""))
@@ -0,0 +1,434 @@
+"""
+image_pack.py – pack PPK image sets into a few archives for transfer
+
+`copy_ppk_images` copies the MEDIA/EXIF_images folders file by file; moving
+tens of thousands of small files to the Metashape server is dominated by
+per-file overhead.  `pack_ppk_images` streams the same folders into
+size-capped tar (or store-only zip) volumes instead:
+
+    PPK_images_000.tar, PPK_images_001.tar, …   members keep the relative
+                                                 <date>/<flight>/…/MEDIA paths
+    PPK_images_index.csv                         archive;name;size;mtime;sha256
+
+Files up to one chunk are read whole on a thread pool (bounded read-ahead),
+larger ones are streamed chunk by chunk by the writer; both are hashed
+while they are read and the writer only appends.  On the receiving side
+`extract_ppk_images` unpacks all volumes (one thread per volume), checks
+size and SHA-256 of every member against the index and reports missing,
+damaged and unexpected files.
+"""
+
+import csv
+import hashlib
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules.progress import Progress
+from modules.profiling import stage, count
+from modules.wze_uav import iter_ppk_image_dirs
+
+__all__ = ["pack_ppk_images", "extract_ppk_images", "read_pack_index"]
+
+CHUNK = 8 * 1024 * 1024
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+_BLOCK = tarfile.BLOCKSIZE
+_INDEX_COLS = ["archive", "name", "size", "mtime", "sha256"]
+# what a damaged or truncated volume raises while it is read
+_ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.ReadError, EOFError, zlib.error)
+
+# (relative name, full path, size, mtime)
+Member = Tuple[str, str, int, float]
+
+
+def _list_members(source_folder: str) -> List[Member]:
+    """All files of the PPK image folders, in a stable order."""
+    members: List[Member] = []
+    seen = set()
+    for folder in iter_ppk_image_dirs(source_folder):
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            count("dirs_listed")
+            for f in sorted(files):
+                path = os.path.join(root, f)
+                if path in seen:        # nested MEDIA folders are yielded twice
+                    continue
+                seen.add(path)
+                st = os.stat(path)
+                rel = os.path.relpath(path, source_folder).replace(os.sep, "/")
+                members.append((rel, path, st.st_size, st.st_mtime))
+    count("files_seen", len(members))
+    return members
+
+
+def _volumes(members: List[Member], max_bytes: int) -> List[List[Member]]:
+    """Split *members* into volumes of at most *max_bytes* (files never split)."""
+    vols: List[List[Member]] = [[]]
+    size = 0
+    for m in members:
+        if vols[-1] and size + m[2] > max_bytes:
+            vols.append([])
+            size = 0
+        vols[-1].append(m)
+        size += m[2]
+    return vols if vols[0] else []
+
+
+def _read(path: str, chunk: int) -> Tuple[List[bytes], str]:
+    """Read the small file *path* whole in *chunk*-sized blocks; (blocks, sha256 hex)."""
+    h = hashlib.sha256()
+    blocks: List[bytes] = []
+    with open(path, "rb", buffering=0) as fh:
+        while True:
+            b = fh.read(chunk)
+            if not b:
+                break
+            h.update(b)
+            blocks.append(b)
+    return blocks, h.hexdigest()
+
+
+def _stream(fh: IO[bytes], size: int, chunk: int, h) -> Iterator[bytes]:
+    """
+    Yield exactly *size* bytes of the open file *fh* in *chunk* blocks,
+    hashing them into *h*; raises ValueError if the file is shorter or
+    longer, since the archive header already announced *size*.
+    """
+    left = size
+    while left:
+        b = fh.read(min(chunk, left))
+        if not b:
+            raise ValueError(f"{fh.name} shrank while packing ({size - left} of {size} bytes)")
+        h.update(b)
+        left -= len(b)
+        yield b
+    if fh.read(1):
+        raise ValueError(f"{fh.name} grew while packing (more than {size} bytes)")
+
+
+def _prefetch(ex: ThreadPoolExecutor, members: List[Member], chunk: int,
+              depth: int) -> Iterator[Tuple[Member, Optional[List[bytes]], Optional[str]]]:
+    """
+    Yield (member, blocks, sha256) in order, keeping *depth* reads in flight.
+    Files larger than *chunk* are not read ahead; they come with blocks None
+    and are streamed by the writer, so read-ahead stays below depth * chunk.
+    """
+    def submit(m: Member):
+        return ex.submit(_read, m[1], chunk) if m[2] <= chunk else None
+
+    pending: deque = deque()
+    it = iter(members)
+    for m in it:
+        pending.append((m, submit(m)))
+        if len(pending) >= depth:
+            break
+    while pending:
+        m, fut = pending.popleft()
+        nxt = next(it, None)
+        if nxt is not None:
+            pending.append((nxt, submit(nxt)))
+        if fut is None:
+            yield m, None, None
+        else:
+            blocks, digest = fut.result()
+            yield m, blocks, digest
+
+
+class _TarWriter:
+    """Append-only tar stream (PAX headers) without seeking."""
+
+    def __init__(self, fh: IO[bytes]):
+        self.fh = fh
+
+    def add(self, name: str, size: int, mtime: float, blocks: Iterable[bytes]) -> None:
+        ti = tarfile.TarInfo(name)
+        ti.size, ti.mtime, ti.mode = size, int(mtime), 0o644
+        self.fh.write(ti.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        for b in blocks:
+            self.fh.write(b)
+        if size % _BLOCK:
+            self.fh.write(b"\0" * (_BLOCK - size % _BLOCK))
+
+    def close(self) -> None:
+        self.fh.write(b"\0" * (2 * _BLOCK))
+        pos = self.fh.tell()
+        if pos % tarfile.RECORDSIZE:
+            self.fh.write(b"\0" * (tarfile.RECORDSIZE - pos % tarfile.RECORDSIZE))
+
+
+class _ZipWriter:
+    """Store-only zip; members are streamed (zip64 where needed)."""
+
+    def __init__(self, fh: IO[bytes]):
+        self.zf = zipfile.ZipFile(fh, "w", zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, name: str, size: int, mtime: float, blocks: Iterable[bytes]) -> None:
+        zi = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])
+        zi.compress_type = zipfile.ZIP_STORED
+        zi.file_size = size
+        with self.zf.open(zi, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as out:
+            for b in blocks:
+                out.write(b)
+
+    def close(self) -> None:
+        self.zf.close()
+
+
+def _add_member(writer, m: Member, blocks: Optional[List[bytes]], digest: Optional[str],
+                chunk: int) -> Tuple[int, str]:
+    """
+    Append member *m* to *writer*; returns the (size, sha256) written.
+
+    Read-ahead files carry their actual length, so a file that changed
+    after the listing is stored as read.  Large files are re-stat'ed on
+    the open handle right before the header is written and then streamed.
+    """
+    rel, path, _, mtime = m
+    if blocks is not None:
+        size = sum(len(b) for b in blocks)
+        writer.add(rel, size, mtime, blocks)
+        return size, digest
+    h = hashlib.sha256()
+    with open(path, "rb", buffering=0) as fh:
+        size = os.fstat(fh.fileno()).st_size
+        writer.add(rel, size, mtime, _stream(fh, size, chunk, h))
+    return size, h.hexdigest()
+
+
+def pack_ppk_images(
+    source_folder: str,
+    out_dir: str,
+    fmt: str = "tar",
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    name: str = "PPK_images",
+    workers: int = 4,
+    chunk_size: int = CHUNK
+) -> List[str]:
+    """
+    Write the MEDIA/EXIF_images folders below *source_folder* (same
+    selection as `copy_ppk_images`) into archives in *out_dir*.  Raises
+    ValueError if a streamed file changes size while it is written; the
+    volume being written is removed.
+
+    Parameters
+    ----------
+    source_folder : str
+        Root with <date>/<flight> folders.
+    out_dir : str
+        Folder for the archives and the index (created if missing).
+    fmt : str
+        "tar" or "zip" (store-only, no compression).
+    max_bytes : int
+        Size cap of the member data per archive; a file larger than the cap
+        gets an archive of its own.
+    name : str
+        Archive base name: <name>_000.<fmt>, …, <name>_index.csv.
+    workers : int
+        Reader threads; up to 2 * workers files are read ahead.
+    chunk_size : int
+        Read size per call; files larger than this are streamed instead of
+        read ahead.
+
+    Returns
+    -------
+    list of str
+        Archive paths, followed by the index path.
+    """
+    if fmt not in ("tar", "zip"):
+        raise ValueError(f"Unknown archive format {fmt!r} (tar or zip)")
+    os.makedirs(out_dir, exist_ok=True)
+    with stage("scan"):
+        members = _list_members(source_folder)
+    vols = _volumes(members, max_bytes)
+    total = sum(m[2] for m in members)
+
+    prog = Progress("pack_ppk_images", total=len(members), unit="files")
+    index_fn = os.path.join(out_dir, f"{name}_index.csv")
+    archives: List[str] = []
+    part = index_fn + ".part"
+    try:
+        with open(index_fn + ".part", "w", newline="", encoding="utf-8") as idx_fh, \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            index = csv.writer(idx_fh, delimiter=";")
+            index.writerow(_INDEX_COLS)
+            for i, vol in enumerate(vols):
+                arc = os.path.join(out_dir, f"{name}_{i:03d}.{fmt}")
+                part = arc + ".part"
+                with stage("image_pack"), open(part, "wb", buffering=CHUNK) as fh:
+                    writer = _TarWriter(fh) if fmt == "tar" else _ZipWriter(fh)
+                    for m, blocks, digest in _prefetch(ex, vol, chunk_size,
+                                                       2 * max(1, workers)):
+                        rel, _, _, mtime = m
+                        size, digest = _add_member(writer, m, blocks, digest, chunk_size)
+                        index.writerow([os.path.basename(arc), rel, size, f"{mtime:.3f}",
+                                        digest])
+                        count("image_files")
+                        count("image_bytes", size)
+                        prog.advance(1, size)
+                    writer.close()
+                os.replace(part, arc)
+                archives.append(arc)
+                prog.detail(f"📦 {arc}: {len(vol)} files")
+    except BaseException:
+        # never leave a half-written volume or index behind
+        for fn in (part, index_fn + ".part"):
+            if os.path.exists(fn):
+                os.remove(fn)
+        raise
+    os.replace(index_fn + ".part", index_fn)
+    prog.done(f"{len(members)} files ({total / 1024 ** 2:.0f} MB) in "
+              f"{len(archives)} archive(s) in {out_dir}")
+    return archives + [index_fn]
+
+
+def read_pack_index(index_fn: str) -> Dict[str, Dict[str, Dict]]:
+    """{archive name: {member name: {"size", "mtime", "sha256"}}} from an index."""
+    out: Dict[str, Dict[str, Dict]] = {}
+    with open(index_fn, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh, delimiter=";"):
+            out.setdefault(row["archive"], {})[row["name"]] = {
+                "size": int(row["size"]), "mtime": float(row["mtime"]),
+                "sha256": row["sha256"]}
+    return out
+
+
+def _safe_target(dest: str, name: str) -> str:
+    """Destination path of member *name*; rejects absolute paths and '..'."""
+    parts = name.replace("\\", "/").split("/")
+    if name.startswith("/") or ".." in parts or ":" in parts[0]:
+        raise ValueError(f"Unsafe member name {name!r}")
+    return os.path.join(dest, *parts)
+
+
+def _iter_archive(path: str) -> Iterator[Tuple[str, IO[bytes]]]:
+    """(member name, readable stream) of the regular files in an archive."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for zi in zf.infolist():
+                if not zi.is_dir():
+                    with zf.open(zi) as src:
+                        yield zi.filename, src
+    else:
+        with tarfile.open(path, "r|*", bufsize=CHUNK) as tf:
+            for ti in tf:
+                if ti.isfile():
+                    yield ti.name, tf.extractfile(ti)
+
+
+def _extract_one(path: str, dest: str, expected: Dict[str, Dict],
+                 chunk: int) -> Dict[str, List]:
+    """
+    Extract one archive with verification (see `extract_ppk_images`).
+
+    A member that fails its CRC, decompression or size/SHA-256 check is
+    "damaged"; when the archive cannot be opened or ends early, the members
+    not reached are "missing".  No `.part` file is left behind either way.
+    """
+    res: Dict[str, List] = {"extracted": [], "damaged": [], "unexpected": [], "missing": [],
+                            "errors": []}
+    seen = set()
+    members = _iter_archive(path)
+    try:
+        while True:
+            try:
+                item = next(members, None)
+            except _ARCHIVE_ERRORS as exc:     # unreadable or truncated volume
+                res["errors"].append(f"{os.path.basename(path)}: {exc}")
+                break
+            if item is None:
+                break
+            name, src = item
+            exp = expected.get(name)
+            if exp is None:
+                res["unexpected"].append(name)
+                continue
+            seen.add(name)
+            target = _safe_target(dest, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            h = hashlib.sha256()
+            size = 0
+            try:
+                with open(target + ".part", "wb") as out:
+                    while True:
+                        b = src.read(chunk)
+                        if not b:
+                            break
+                        h.update(b)
+                        size += len(b)
+                        out.write(b)
+            except _ARCHIVE_ERRORS as exc:
+                os.remove(target + ".part")
+                res["damaged"].append(name)
+                res["errors"].append(f"{name}: {exc}")
+                continue
+            if size != exp["size"] or h.hexdigest() != exp["sha256"]:
+                os.remove(target + ".part")
+                res["damaged"].append(name)
+                continue
+            os.replace(target + ".part", target)
+            os.utime(target, (exp["mtime"], exp["mtime"]))
+            res["extracted"].append(name)
+            count("image_files")
+            count("image_bytes", size)
+    finally:
+        members.close()
+    res["missing"] = sorted(set(expected) - seen)
+    return res
+
+
+def extract_ppk_images(
+    index_fn: str,
+    dest: str,
+    workers: int = 4,
+    chunk_size: int = CHUNK
+) -> Dict[str, List]:
+    """
+    Extract the archives listed in *index_fn* (looked up next to it) into
+    *dest*, one thread per archive, verifying size and SHA-256 of every
+    member.  Damaged members are not kept; members of a missing archive
+    are reported as missing.
+
+    Returns {"extracted", "damaged", "missing", "unexpected"} (member names),
+    "archives_missing" (archive names) and "errors" (read errors of damaged
+    or truncated volumes).
+    """
+    index = read_pack_index(index_fn)
+    base = os.path.dirname(os.path.abspath(index_fn))
+    summary: Dict[str, List] = {"extracted": [], "damaged": [], "missing": [],
+                                "unexpected": [], "archives_missing": [], "errors": []}
+    present = []
+    for arc, members in index.items():
+        if os.path.exists(os.path.join(base, arc)):
+            present.append(arc)
+        else:
+            summary["archives_missing"].append(arc)
+            summary["missing"].extend(sorted(members))
+
+    prog = Progress("extract_ppk_images", total=len(present), unit="archives")
+    with stage("image_unpack"), ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = [(arc, ex.submit(_extract_one, os.path.join(base, arc), dest, index[arc],
+                                chunk_size)) for arc in present]
+        for arc, fut in futs:
+            res = fut.result()
+            for k in ("extracted", "damaged", "missing", "unexpected", "errors"):
+                summary[k].extend(res[k])
+            if res["damaged"] or res["missing"]:
+                prog.fail(f"❌ {arc}: {len(res['damaged'])} damaged, "
+                          f"{len(res['missing'])} missing")
+                for err in res["errors"]:
+                    prog.detail(f"    {err}")
+            else:
+                prog.advance()
+                prog.detail(f"📂 {arc}: {len(res['extracted'])} files")
+
+    for arc in summary["archives_missing"]:
+        prog.warn(f"⚠️  archive {arc} not found")
+    if summary["unexpected"]:
+        prog.warn(f"⚠️  {len(summary['unexpected'])} member(s) not in the index, skipped")
+    prog.done(f"{len(summary['extracted'])} files verified into {dest}")
+    return summary
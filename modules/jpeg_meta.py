@@ -0,0 +1,200 @@
+"""
+jpeg_meta.py – bounded-read helpers for JPEG/EXIF metadata
+
+Only the first few kilobytes of an image are read; the pixel data is never
+touched.  This is enough for camera model lookups on DJI JPGs, whose EXIF
+IFD0 sits right behind the SOI marker.
+"""
+
+import re
+import struct
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+__all__ = ["read_head", "iter_app_segments", "find_exif", "read_ifd",
+           "read_camera_model", "read_datetime_original", "read_xmp", "parse_dji_xmp",
+           "read_dji_xmp"]
+
+# how much of a file we are willing to read for metadata lookups
+HEAD_BYTES = 64 * 1024
+
+# APP1 payload prefix of an XMP packet
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+# segments looked at before giving up on finding XMP
+MAX_SEGMENTS = 16
+
+# DJI writes its XMP properties as attributes (drone-dji:Key="value"), some
+# tools rewrite them as elements (<drs:Key>value</drs:Key>)
+_DJI_XMP_ATTR = re.compile(rb'(?:drone-dji|drs):(\w+)="([^"]*)"')
+_DJI_XMP_ELEM = re.compile(rb'<(?:drone-dji|drs):(\w+)>([^<]*)</')
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+
+
+def read_head(path: str, nbytes: int = HEAD_BYTES) -> bytes:
+    """Return the first *nbytes* of *path*."""
+    with open(path, "rb") as fh:
+        return fh.read(nbytes)
+
+
+def iter_app_segments(data: bytes) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yield (marker, payload_offset, payload_length) for every segment in the
+    JPEG header held in *data*, stopping at start-of-scan.  Segments that run
+    past the end of *data* are still yielded; callers check the length.
+    """
+    if data[:2] != b"\xff\xd8":
+        return
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return
+        marker = data[pos + 1]
+        if marker == 0xFF:              # fill byte
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):      # start of scan / end of image
+            return
+        (length,) = struct.unpack(">H", data[pos + 2:pos + 4])
+        yield marker, pos + 4, length - 2
+        pos += 2 + length
+
+
+def find_exif(data: bytes) -> Optional[Tuple[int, str]]:
+    """
+    Locate the TIFF header of the EXIF APP1 segment.
+
+    Returns
+    -------
+    (tiff_offset, endian) | None
+        Absolute offset of the TIFF header inside *data* and the struct
+        byte-order prefix ('<' or '>').
+    """
+    for marker, off, length in iter_app_segments(data):
+        if marker == 0xE1 and data[off:off + 6] == b"Exif\x00\x00":
+            tiff = off + 6
+            order = data[tiff:tiff + 2]
+            if order == b"II":
+                return tiff, "<"
+            if order == b"MM":
+                return tiff, ">"
+    return None
+
+
+def read_ifd(data: bytes, tiff: int, ifd_offset: int, endian: str
+             ) -> Dict[int, Tuple[int, int, int]]:
+    """
+    Parse one IFD and return {tag: (type, count, value_offset)} where
+    value_offset is absolute in *data* (inline values point into the entry).
+    """
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    start = tiff + ifd_offset
+    if start + 2 > len(data):
+        return entries
+    (n,) = struct.unpack(endian + "H", data[start:start + 2])
+    for i in range(n):
+        e = start + 2 + 12 * i
+        if e + 12 > len(data):
+            break
+        tag, typ, count = struct.unpack(endian + "HHI", data[e:e + 8])
+        size = _TYPE_SIZES.get(typ, 1) * count
+        if size <= 4:
+            value_off = e + 8
+        else:
+            (rel,) = struct.unpack(endian + "I", data[e + 8:e + 12])
+            value_off = tiff + rel
+        entries[tag] = (typ, count, value_off)
+    return entries
+
+
+def _ascii(data: bytes, entry: Tuple[int, int, int]) -> Optional[str]:
+    typ, count, off = entry
+    if typ != 2 or off + count > len(data):
+        return None
+    return data[off:off + count].split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+
+
+def read_camera_model(path: str) -> Optional[str]:
+    """
+    Return the EXIF IFD0 'Model' string of *path* (e.g. 'FC6360', 'M3E'),
+    or None if the file carries no readable EXIF block.
+    """
+    data = read_head(path)
+    found = find_exif(data)
+    if found is None:
+        return None
+    tiff, endian = found
+    (ifd0,) = struct.unpack(endian + "I", data[tiff + 4:tiff + 8])
+    entry = read_ifd(data, tiff, ifd0, endian).get(TAG_MODEL)
+    return _ascii(data, entry) if entry else None
+
+
+def read_datetime_original(path: str) -> Optional[datetime]:
+    """
+    Return EXIF DateTimeOriginal of *path* as a naive datetime (camera
+    local time), or None if it is missing.
+    """
+    data = read_head(path)
+    found = find_exif(data)
+    if found is None:
+        return None
+    tiff, endian = found
+    (ifd0,) = struct.unpack(endian + "I", data[tiff + 4:tiff + 8])
+    ptr = read_ifd(data, tiff, ifd0, endian).get(TAG_EXIF_IFD)
+    if ptr is None:
+        return None
+    (exif_ifd,) = struct.unpack(endian + "I", data[ptr[2]:ptr[2] + 4])
+    entry = read_ifd(data, tiff, exif_ifd, endian).get(TAG_DATETIME_ORIGINAL)
+    text = _ascii(data, entry) if entry else None
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def read_xmp(path: str, max_segments: int = MAX_SEGMENTS) -> Optional[bytes]:
+    """
+    Return the XMP packet of *path*, or None.
+
+    Only segment headers are read until the XMP APP1 segment turns up; other
+    segments (EXIF, maker notes, thumbnails) are skipped with a seek, and the
+    search stops at start-of-scan or after `max_segments` segments.
+    """
+    with open(path, "rb") as fh:
+        if fh.read(2) != b"\xff\xd8":
+            return None
+        for _ in range(max_segments):
+            head = fh.read(4)
+            if len(head) < 4 or head[0] != 0xFF or head[1] in (0xDA, 0xD9):
+                return None
+            (length,) = struct.unpack(">H", head[2:4])
+            if head[1] == 0xE1 and length - 2 >= len(XMP_HEADER):
+                prefix = fh.read(len(XMP_HEADER))
+                if prefix == XMP_HEADER:
+                    return fh.read(length - 2 - len(XMP_HEADER))
+                fh.seek(length - 2 - len(prefix), 1)
+            else:
+                fh.seek(length - 2, 1)
+    return None
+
+
+def parse_dji_xmp(xmp: bytes) -> Dict[str, str]:
+    """{property: value} of the DJI namespace ('drone-dji:' / 'drs:') in *xmp*."""
+    out = {k.decode("ascii"): v.decode("utf-8", "replace")
+           for k, v in _DJI_XMP_ELEM.findall(xmp)}
+    out.update((k.decode("ascii"), v.decode("utf-8", "replace"))
+               for k, v in _DJI_XMP_ATTR.findall(xmp))
+    return out
+
+
+def read_dji_xmp(path: str) -> Dict[str, str]:
+    """DJI XMP properties of *path* (RtkFlag, RtkStdLat, GimbalYawDegree, ...); {} if none."""
+    xmp = read_xmp(path)
+    return parse_dji_xmp(xmp) if xmp else {}
@@ -1,7 +1,10 @@
+import os
 from pathlib import Path
 import re
 import shutil
 
+from modules.progress import Progress
+
 # --- Patterns ---
 # Folder: DJI_YYYYMMDDHHMM_<ID>
 FOLDER_RE = re.compile(r"^DJI_\d{12}_([A-Za-z0-9]+)$")
@@ -23,20 +26,23 @@ def build_folder_map(master: Path):
                     by_id[id_] = p
     return by_id, dups
 
-def plan_moves(master: Path, id_to_folder: dict):
-    """Return list of (src_file, dest_file) pairs to move."""
-    planned = []
-    for p in master.iterdir():
-        if p.is_file():
-            m = FILE_RE.match(p.name)
+def iter_moves(master: Path, id_to_folder: dict):
+    """Yield (src_file, dest_file) pairs to move, as master is listed."""
+    with os.scandir(master) as it:
+        for e in it:
+            if not e.is_file():
+                continue
+            m = FILE_RE.match(e.name)
             if not m:
                 continue
-            id_ = m.group(1)
-            dest_dir = id_to_folder.get(id_)
+            dest_dir = id_to_folder.get(m.group(1))
             if dest_dir is None:
                 continue
-            planned.append((p, dest_dir / p.name))
-    return planned
+            yield master / e.name, dest_dir / e.name
+
+def plan_moves(master: Path, id_to_folder: dict):
+    """Return list of (src_file, dest_file) pairs to move."""
+    return list(iter_moves(master, id_to_folder))
 
 def resolve_conflict(dest: Path):
     """Create a unique name by appending _1, _2, ... before the extension."""
@@ -58,19 +64,20 @@ def organize_files(master_dir, rename_on_conflict=False):
         raise NotADirectoryError(master)
 
     id_to_folder, dups = build_folder_map(master)
+    planned = plan_moves(master, id_to_folder)
+    prog = Progress("organize_files", total=len(planned), unit="files")
     if dups:
-        print("WARNING: Duplicate IDs mapped to multiple folders:")
+        lines = ["WARNING: Duplicate IDs mapped to multiple folders:"]
         for k, paths in dups.items():
-            print(f"  {k}:")
-            for p in paths:
-                print(f"    - {p}")
+            lines.append(f"  {k}:")
+            lines.extend(f"    - {p}" for p in paths)
+        prog.warn("\n".join(lines))
 
-    planned = plan_moves(master, id_to_folder)
     if not planned:
-        print("No matching files found to move.")
+        prog.info("No matching files found to move.")
         return
 
-    print(f"Found {len(planned)} file(s) that are placed into matching folders.\n")
+    prog.info(f"Found {len(planned)} file(s) that are placed into matching folders.")
 
     moves_count = 0
     for src, dest in planned:
@@ -78,16 +85,18 @@ def organize_files(master_dir, rename_on_conflict=False):
         if dest.exists():
             if rename_on_conflict:
                 final_dest = resolve_conflict(dest)
-                print(f"DRY-RUN rename+move : {src.name} -> {final_dest}")
+                prog.detail(f"rename+move   : {src.name} -> {final_dest}")
                 moves_count += 1
             else:
-                print(f"SKIP (exists)       : {src.name} -> {dest}")
+                prog.detail(f"SKIP (exists) : {src.name} -> {dest}")
+                prog.skip()
                 continue
         else:
-            print(f"DRY-RUN move        : {src.name} -> {final_dest}")
+            prog.detail(f"move          : {src.name} -> {final_dest}")
             moves_count += 1
 
         final_dest.parent.mkdir(parents=True, exist_ok=True)
         shutil.move(str(src), str(final_dest))
+        prog.advance()
 
-    print(f"\n Complete. {moves_count} move(s) performed.")
+    prog.done(f"{moves_count} move(s) performed.")
@@ -1,6 +1,8 @@
 from pathlib import Path
 import shutil
 
+from modules.progress import Progress
+
 def _next_unique_name(base: str, ext: str, dest_root: Path, used_names: set) -> str:
     """
     Reserve a unique filename in dest_root like:
@@ -15,16 +17,12 @@ def _next_unique_name(base: str, ext: str, dest_root: Path, used_names: set) ->
             return name
         i += 1
 
-def move_las(master_dir, las_dest_dir, recursive=True, standardize_ext=True):
+def iter_las_moves(master_dir, las_dest_dir, recursive=True, standardize_ext=True):
     """
-    - master_dir: path to the folder containing multiple project folders
-    - las_dest_dir: destination folder to collect all LAS files (e.g. "/path/to/master/las")
-    - recursive: if True, find .las files also in subfolders of each project folder
-    - standardize_ext: if True, rename extension to '.las' (lowercase)
-
-    Notes:
-    - Explicitly ignores .zip files.
-    - Each .las file is renamed to the *top-level project folder* name, with _1, _2… added if needed.
+    Yield (src, dest) for every .las file below the project folders of
+    master_dir, project by project, as `move_las` would move them.
+    Destination names are reserved as they are yielded (see
+    `_next_unique_name`), so only the names are kept in memory.
     """
     master = Path(master_dir).resolve()
     dest_root = Path(las_dest_dir).resolve()
@@ -36,9 +34,8 @@ def move_las(master_dir, las_dest_dir, recursive=True, standardize_ext=True):
 
     # Get top-level project folders (exclude the destination folder if it's inside master)
     top_level_folders = [p for p in master.iterdir() if p.is_dir()]
-    top_level_folders = [p for p in top_level_folders if p.resolve() != dest_root.resolve()]
+    top_level_folders = [p for p in top_level_folders if p.resolve() != dest_root]
 
-    plan = []
     used_names = set()  # reserve names during this run to avoid duplicate targets
     for proj in sorted(top_level_folders, key=lambda x: x.name):
         # Gather files inside this project folder
@@ -62,21 +59,37 @@ def move_las(master_dir, las_dest_dir, recursive=True, standardize_ext=True):
 
             # Reserve a unique destination name like base.las, base_1.las, ...
             dest_name = _next_unique_name(base, ext, dest_root, used_names)
-            dest_path = dest_root / dest_name
+            yield src, dest_root / dest_name
+
+def move_las(master_dir, las_dest_dir, recursive=True, standardize_ext=True):
+    """
+    - master_dir: path to the folder containing multiple project folders
+    - las_dest_dir: destination folder to collect all LAS files (e.g. "/path/to/master/las")
+    - recursive: if True, find .las files also in subfolders of each project folder
+    - standardize_ext: if True, rename extension to '.las' (lowercase)
 
-            plan.append((src, dest_path))
+    Notes:
+    - Explicitly ignores .zip files.
+    - Each .las file is renamed to the *top-level project folder* name, with _1, _2… added if needed.
+    - The plan comes from `iter_las_moves`; it is listed in full first so
+      the number of files is known before anything moves.
+    """
+    dest_root = Path(las_dest_dir).resolve()
+    plan = list(iter_las_moves(master_dir, las_dest_dir, recursive, standardize_ext))
 
+    prog = Progress("move_las", total=len(plan), unit="files")
     if not plan:
-        print("No .las files found to move.")
+        prog.info("No .las files found to move.")
         return
 
     # Print plan
-    print(f"Found {len(plan)} .las file(s) to place into: {dest_root}")
+    prog.info(f"Found {len(plan)} .las file(s) to place into: {dest_root}")
 
     for src, dest in plan:
-        print(f"DRY-RUN move: {src}  ->  {dest}")
+        prog.detail(f"move: {src}  ->  {dest}")
 
         dest.parent.mkdir(parents=True, exist_ok=True)
         shutil.move(str(src), str(dest))
+        prog.advance()
 
-    print(f"\nRun complete. {len(plan)} move(s) performed.")
+    prog.done(f"{len(plan)} move(s) performed.")
@@ -0,0 +1,378 @@
+"""
+pipeline.py – stream flights through the WZE-UAV workflow stage by stage
+
+The notebook runs the SAPOS queries, FPLAN scan, VRS copy, REDtoolbox batch
+and image copy as separate passes over the whole archive.  Here every flight
+(<root>/<date>/<TNR>) flows through
+
+    scan → query → vrs → batch → images
+
+as soon as the previous stage is done with it.  Stages are connected by
+bounded asyncio queues (a full queue makes the upstream stage wait, so a
+slow stage throttles the scan instead of piling up work), each stage runs
+its blocking file work on its own thread pool with a per-stage worker
+limit, and the run can be cancelled at any point: queued work is dropped,
+running calls finish, the output files are flushed.
+
+`Pipeline` is the generic engine; `run_wze_pipeline` wires it to the
+existing helpers.  The per-stage report shows where the time goes: busy
+seconds, time waiting for input and time blocked by the next stage.
+"""
+
+import asyncio
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from modules.progress import Progress, VERBOSE
+from modules.profiling import stage, count
+from modules.run_log import RunLog
+from modules.sapos_query import generate_sapos_queries_v2
+from modules.flight_index import index_vrs
+from modules.wze_uav import (CONSOLE_LOG, DEVICE_PROFILES, batch_filenames, build_redtoolbox_commands,
+                             check_base_coverage, detect_device, find_ppk_files,
+                             flight_image_dirs, scan_fplan_entries, scan_mission, scan_subdirs,
+                             stage_vrs_for_fplan, trim_base_to_flight)
+
+__all__ = ["Stage", "Pipeline", "run_wze_pipeline", "DEFAULT_WORKERS"]
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One pipeline stage: `func(item)` runs on `workers` threads and returns
+    the item for the next stage, or None to drop it.  An exception counts
+    the item as failed for this stage (it does not go further).
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1,
+                 queue_size: Optional[int] = None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.stats: Dict[str, Any] = {}
+
+    def _reset(self) -> None:
+        self.stats = {"in": 0, "out": 0, "dropped": 0, "failed": [],
+                      "busy_s": 0.0, "wait_s": 0.0, "blocked_s": 0.0}
+
+
+class Pipeline:
+    """
+    Run the items of `source` (any iterable; it is advanced on a thread, so
+    a lazy directory scan works) through `stages`.
+
+    Parameters
+    ----------
+    source : iterable
+        Items for the first stage.
+    stages : list of Stage
+        In order; stage i reads from queue i and writes to queue i + 1.
+    queue_size : int
+        Default capacity of the queues between stages.
+    key : callable
+        Item → short name used in failure reports.
+    stop_on_error : bool
+        Cancel the whole run at the first failed item.
+    label : str
+        Name for the progress lines.
+    """
+
+    def __init__(self, source: Iterable, stages: List[Stage], queue_size: int = 8,
+                 key: Callable[[Any], str] = str, stop_on_error: bool = False,
+                 label: str = "pipeline"):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.key = key
+        self.stop_on_error = stop_on_error
+        self.label = label
+        self.scanned = 0
+        self.cancelled = False
+        self._cancel_requested = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._prog: Optional[Progress] = None
+
+    # ── control ────────────────────────────────────────────────────────────
+    def cancel(self) -> None:
+        """Stop the run; safe to call from any thread (e.g. a stage function)."""
+        self._cancel_requested = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def _cancel_tasks(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+
+    # ── workers ────────────────────────────────────────────────────────────
+    async def _feed(self, out_q: asyncio.Queue, ex: ThreadPoolExecutor) -> None:
+        it = iter(self.source)
+        while True:
+            item = await self._loop.run_in_executor(ex, next, it, _DONE)
+            if item is _DONE:
+                break
+            self.scanned += 1
+            await out_q.put(item)
+        await out_q.put(_DONE)
+
+    async def _work(self, st: Stage, in_q: asyncio.Queue, out_q: Optional[asyncio.Queue],
+                    ex: ThreadPoolExecutor, remaining: List[int]) -> None:
+        s = st.stats
+        while True:
+            t0 = time.perf_counter()
+            item = await in_q.get()
+            s["wait_s"] += time.perf_counter() - t0
+            if item is _DONE:
+                # hand the marker to the sibling workers; the last one passes it on
+                await in_q.put(_DONE)
+                remaining[0] -= 1
+                if remaining[0] == 0 and out_q is not None:
+                    await out_q.put(_DONE)
+                return
+
+            s["in"] += 1
+            t0 = time.perf_counter()
+            try:
+                res = await self._loop.run_in_executor(ex, st.func, item)
+            except Exception as exc:
+                s["failed"].append((self.key(item), f"{type(exc).__name__}: {exc}"))
+                self._prog.fail(f"❌ [{st.name}] {self.key(item)}: {exc}")
+                if self.stop_on_error:
+                    self.cancel()
+                continue
+            finally:
+                s["busy_s"] += time.perf_counter() - t0
+
+            if res is None:
+                s["dropped"] += 1
+                continue
+            s["out"] += 1
+            if out_q is None:
+                self._prog.advance()
+                self._prog.detail(f"✅ {self.key(res)}")
+            else:
+                t0 = time.perf_counter()
+                await out_q.put(res)        # waits while the next stage is full
+                s["blocked_s"] += time.perf_counter() - t0
+
+    # ── running ────────────────────────────────────────────────────────────
+    async def run_async(self) -> Dict[str, Any]:
+        """Run to completion (or cancellation) and return `report()`."""
+        self._loop = asyncio.get_running_loop()
+        self._prog = Progress(self.label, unit="items")
+        t0 = time.perf_counter()
+        queues = [asyncio.Queue(maxsize=st.queue_size or self.queue_size) for st in self.stages]
+        executors = [ThreadPoolExecutor(max_workers=st.workers, thread_name_prefix=st.name)
+                     for st in self.stages]
+        src_ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="source")
+
+        self._tasks = [asyncio.create_task(self._feed(queues[0], src_ex))]
+        for i, st in enumerate(self.stages):
+            st._reset()
+            out_q = queues[i + 1] if i + 1 < len(self.stages) else None
+            remaining = [st.workers]
+            self._tasks += [asyncio.create_task(self._work(st, queues[i], out_q,
+                                                           executors[i], remaining))
+                            for _ in range(st.workers)]
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            if not self._cancel_requested:
+                raise               # cancelled from outside (e.g. Ctrl-C): propagate
+        finally:
+            self._cancel_tasks()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            # queued calls are dropped, running ones finish
+            for ex in executors + [src_ex]:
+                ex.shutdown(wait=True, cancel_futures=True)
+            self.wall_s = time.perf_counter() - t0
+            n_failed = sum(len(st.stats["failed"]) for st in self.stages)
+            self._prog.done(("cancelled – " if self.cancelled else "")
+                            + f"{self.scanned} scanned, {n_failed} failed")
+        return self.report()
+
+    def run(self) -> Dict[str, Any]:
+        """
+        `run_async` in a fresh event loop – on a helper thread when the
+        calling thread already runs one (Jupyter), where `asyncio.run`
+        would refuse.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run_async())
+        with ThreadPoolExecutor(1, thread_name_prefix="pipeline") as ex:
+            return ex.submit(asyncio.run, self.run_async()).result()
+
+    def report(self) -> Dict[str, Any]:
+        """{"wall_s", "scanned", "cancelled", "stages": {name: stats}}."""
+        return {"wall_s": round(getattr(self, "wall_s", 0.0), 3), "scanned": self.scanned,
+                "cancelled": self.cancelled,
+                "stages": {st.name: {k: (round(v, 3) if isinstance(v, float) else v)
+                                     for k, v in st.stats.items()}
+                           for st in self.stages}}
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# WZE-UAV workflow
+# ────────────────────────────────────────────────────────────────────────────
+DEFAULT_WORKERS = {"query": 4, "vrs": 2, "batch": 4, "images": 2}
+
+
+def _iter_flights(root: str) -> Iterator[Dict[str, Any]]:
+    """Flight items for every <root>/<date>/<TNR> folder, listed lazily."""
+    for date_folder, date_path in scan_subdirs(root):
+        for tnr, tnr_path in scan_subdirs(date_path):
+            yield {"flight": tnr_path, "date": date_folder, "tnr": tnr,
+                   "fplans": [os.path.join(tnr_path, e) for e in scan_fplan_entries(tnr_path)]}
+
+
+def run_wze_pipeline(
+    root: str,
+    vrs_root: str,
+    ppk_dest: str,
+    redtoolbox_dir: str,
+    log_dir: str,
+    master_out: Optional[str] = None,
+    epn_yr: str = '24',
+    merge_rinex_files: bool = False,
+    check_base: bool = False,
+    trim_base_margin_s: Optional[float] = None,
+    default_profile: Optional[str] = None,
+    workers: Optional[Dict[str, int]] = None,
+    queue_size: int = 8,
+    console_log: bool = False
+) -> Dict[str, Any]:
+    """
+    Run the WZE-UAV workflow for every <root>/<date>/<TNR> flight as one
+    pipeline:
+
+      query   `generate_sapos_queries_v2`; lines also go to *master_out*
+              (default all_sapos_queries_v2.txt in *log_dir*)
+      vrs     `stage_vrs_for_fplan` for each FPLAN folder, from one listing
+              of *vrs_root* made at start; a flight without VRS data yet
+              fails here and stops
+      batch   REDtoolbox lines (device detected per FPLAN, see
+              `generate_redtoolbox_batch_mixed`; FPLANs of unknown device
+              are logged and skipped) appended to one .bat in
+              *redtoolbox_dir*; with `check_base` an uncovered base file
+              fails the flight, `trim_base_margin_s` trims it, with
+              `console_log` REDtoolbox output goes to output_dir
+      images  MEDIA/EXIF_images folders copied to *ppk_dest* (same layout
+              as `copy_ppk_images`)
+
+    `workers` overrides DEFAULT_WORKERS per stage.  Log, JSON-lines events
+    and the output files are kept by one RunLog in *log_dir*.  Returns the
+    `Pipeline.report()` with "batch_file" and "log_file" added.
+    """
+    n_workers = dict(DEFAULT_WORKERS, **(workers or {}))
+    start_time = datetime.now()
+    log_fn, batch_fn = batch_filenames(redtoolbox_dir, log_dir, start_time)
+    if master_out is None:
+        master_out = os.path.join(log_dir, "all_sapos_queries_v2.txt")
+    lock = threading.Lock()
+
+    with RunLog(log_fn) as log:
+        log.write(f"Starting WZE-UAV pipeline for {root}")
+        log.event("start", root=root, vrs_root=vrs_root, ppk_dest=ppk_dest,
+                  batch_file=batch_fn, workers=n_workers)
+        master = log.open_output(master_out)
+        bf = log.open_output(batch_fn)
+        # one listing of vrs_root for all flights: {TNR: item names}
+        vrs_items = index_vrs(vrs_root)
+
+        def _event(kind: str, **fields: Any) -> None:
+            with lock:
+                log.event(kind, **fields)
+
+        def query(f: Dict) -> Dict:
+            lines = generate_sapos_queries_v2(f["flight"])
+            with lock:
+                master.writelines(line + "\n" for line in lines)
+            f["queries"] = lines
+            _event("query", flight=f["flight"], lines=len(lines))
+            return f
+
+        def vrs(f: Dict) -> Dict:
+            if not f["fplans"]:
+                raise FileNotFoundError("no FPLAN folder")
+            for fplan in f["fplans"]:
+                if not stage_vrs_for_fplan(fplan, f["tnr"], vrs_root,
+                                           merge_rinex_files=merge_rinex_files,
+                                           vrs_names=vrs_items.get(f["tnr"], [])):
+                    raise FileNotFoundError(f"no VRS items for TNR {f['tnr']} yet")
+            _event("vrs", flight=f["flight"], fplans=len(f["fplans"]))
+            return f
+
+        def batch(f: Dict) -> Dict:
+            lines: List[str] = []
+            for d in f["fplans"]:
+                with stage("scan"):
+                    listing = scan_mission(d)
+                with stage("parse"):
+                    key = detect_device(d, listing) or default_profile
+                if key is None:
+                    with lock:
+                        log.write(f"    ⚠️  Could not detect device for {d}, skipping")
+                    _event("mission_skipped", mission=d, device=None, reason="device_unknown")
+                    continue
+                profile = DEVICE_PROFILES[key]
+                if profile['device'] is None:
+                    _event("mission_skipped", mission=d, device=key)
+                    continue
+                with stage("batch_build"):
+                    files = find_ppk_files(d, epn_yr, listing)
+                if check_base:
+                    cov = check_base_coverage(d, epn_yr, listing, files)
+                    if not cov['covered']:
+                        raise ValueError(f"{files['O']} does not cover the flight")
+                if trim_base_margin_s is not None:
+                    files = trim_base_to_flight(d, files, listing, trim_base_margin_s)
+                with stage("batch_build"):
+                    lines += build_redtoolbox_commands(
+                        d, files, profile, console_log=CONSOLE_LOG if console_log else None)
+                _event("mission", mission=d, device=key, files=files)
+            with lock:
+                bf.writelines(line + "\n" for line in lines)
+            return f
+
+        def images(f: Dict) -> Dict:
+            n = 0
+            for src in flight_image_dirs(f["flight"]):
+                dst = os.path.join(ppk_dest, os.path.relpath(src, root))
+                with stage("image_copy"):
+                    shutil.copytree(src, dst, dirs_exist_ok=True)
+                n += 1
+            count("image_dirs", n)
+            _event("images", flight=f["flight"], dirs=n)
+            return f
+
+        pipe = Pipeline(
+            _iter_flights(root),
+            [Stage(name, func, n_workers[name]) for name, func in
+             (("query", query), ("vrs", vrs), ("batch", batch), ("images", images))],
+            queue_size=queue_size, key=lambda f: os.path.relpath(f["flight"], root),
+            label="wze_pipeline")
+        try:
+            rep = pipe.run()
+        finally:
+            if pipe.cancelled:
+                log.event("cancelled", scanned=pipe.scanned)
+        for name, st in rep["stages"].items():
+            log.write(f"{name:>7}: {st['out']} done, {len(st['failed'])} failed, "
+                      f"busy {st['busy_s']:.1f} s, waiting {st['wait_s']:.1f} s, "
+                      f"blocked {st['blocked_s']:.1f} s", VERBOSE)
+            for key, err in st["failed"]:
+                log.write(f"    ⚠️  [{name}] {key}: {err}")
+        log.event("done", **rep)
+        log.write(f"Batch file written to: {batch_fn}")
+    rep.update(batch_file=batch_fn, log_file=log_fn)
+    return rep
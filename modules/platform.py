@@ -8,17 +8,21 @@
 #
 # Every helper is written so that higher-level code (generate_sapos_query)
 # can call it and—critically—*get the query string back*.
+#
+# exifread and pytz are imported inside the helpers that need them, so
+# importing this module (and the CLI) stays fast.
 # ---------------------------------------------------------------------------
 
 import os
 import re
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from math import ceil
 from typing import Optional, Union, List
 from pathlib import Path
-import exifread
-import pytz
+
+from modules.progress import detail
+from modules.profiling import stage, count
 
 
 # ────────────────────────────────────────────────────────────────────────────
@@ -36,7 +40,8 @@ def find_json_file(directory: str) -> Optional[str]:
 def extract_coordinates(file_path: str) -> List[float]:
     """Return [lat, lon, alt] extracted from the Wingtra JSON."""
     coords: List[float] = []
-    with open(file_path, "r", encoding="utf-8") as fh:
+    count("json_reads")
+    with stage("parse"), open(file_path, "r", encoding="utf-8") as fh:
         for line in fh:
             if '"coordinate"' in line:
                 for _ in range(3):
@@ -53,10 +58,11 @@ def extract_coordinates(file_path: str) -> List[float]:
 def extract_timestamps(file_path: str):
     """Return (first_ts, last_ts) in GPS-milliseconds from the Wingtra JSON."""
     first, last = None, None
-    with open(file_path, "r", encoding="utf-8") as fh:
+    count("json_reads")
+    with stage("parse"), open(file_path, "r", encoding="utf-8") as fh:
         for line in fh:
             if '"timestamp"' in line:
-                m = re.search(r'"timestamp":\\s*"(\d+\\.\\d+)"', line)
+                m = re.search(r'"timestamp":\s*"(\d+\.\d+)"', line)
                 if m:
                     ts = float(m.group(1))
                     first = first or ts
@@ -93,55 +99,38 @@ def find_mrk_file(directory: str) -> Optional[str]:
 
 def get_sorted_jpg_files(directory: str):
     """Alphabetically sorted list of JPG filenames in *directory*."""
-    return sorted(f for f in os.listdir(directory) if f.lower().endswith(".jpg"))
+    count("dirs_listed")
+    with stage("scan"):
+        return sorted(f for f in os.listdir(directory) if f.lower().endswith(".jpg"))
 
 
 def convert_gps_time(gps_time_berlin: datetime) -> datetime:
-    """Convert naive Berlin-time datetime (GPS) → UTC datetime."""
-    gps_epoch = datetime(1980, 1, 6, tzinfo=pytz.utc)
-    leap_seconds = 18
-
-    berlin = pytz.timezone("Europe/Berlin")
-    gps_time_berlin = (
-        berlin.localize(gps_time_berlin)
-        if gps_time_berlin.tzinfo is None
-        else gps_time_berlin.astimezone(berlin)
-    )
-    gps_time_utc = gps_time_berlin.astimezone(pytz.utc)
-
-    delta = gps_time_utc - gps_epoch
-    return gps_epoch + timedelta(seconds=delta.total_seconds() - leap_seconds)
-
-
-def process_mrk_file_and_jpg(mrk_path: str) -> str:
     """
-    Build SAPOS query string from a DJI *.MRK file + JPGs,
-    write '@sapos_query.txt' next to the MRK,
-    and **return the string**.
+    Convert naive Berlin-time datetime (GPS) → UTC datetime.  The camera
+    clock convention is the one of `berlin_to_gps`.
     """
-    path = os.path.dirname(mrk_path)
-    jpg_files = get_sorted_jpg_files(path)
-    if not jpg_files:
-        raise FileNotFoundError("No JPG files next to the MRK file.")
+    import pytz
 
-    # start / end timestamps
-    def _dt_from_name(name: str) -> datetime:
-        m = re.search(r"DJI_(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})", name)
-        return datetime(*(int(m.group(i)) for i in range(1, 6)))
+    if gps_time_berlin.tzinfo is None:
+        gps = berlin_to_gps(gps_time_berlin)
+    else:
+        gps = gps_time_berlin.astimezone(pytz.utc).replace(tzinfo=None)
+    return pytz.utc.localize(gps - timedelta(seconds=LEAP_SECONDS))
 
-    start_dt = convert_gps_time(_dt_from_name(os.path.basename(mrk_path)))
-    end_dt   = convert_gps_time(_dt_from_name(jpg_files[-1]))
 
-    buffer_min = 10
-    duration = ceil((end_dt - start_dt).total_seconds() / 60 + 2 * buffer_min)
+# ── flight windows: one per flight log, formatted as SAPOS query line ─────
+QUERY_BUFFER_MIN = 10          # DJI: minutes added before and after the flight
+WINGTRA_BUFFER_MS = 300_000    # Wingtra: 5 min before and after
+WINGTRA_ALT_OFFSET = 120
 
-    start_dt_earlier = start_dt - timedelta(minutes=buffer_min)
-    formatted_date = start_dt_earlier.strftime("%d.%m.%Y")
-    formatted_time = start_dt_earlier.strftime("%H:%M:%S")
 
-    # coordinates & elevation
-    with open(mrk_path, "r", encoding="utf-8") as fh:
+def _mrk_position(mrk_path: str):
+    """(lat, lon, elevation): mean of first/last record, middle record's height."""
+    count("mrk_reads")
+    with stage("parse"), open(mrk_path, "r", encoding="utf-8") as fh:
         lines = fh.readlines()
+    if not lines:
+        raise ValueError(f"MRK file is empty: {mrk_path}")
 
     def _lat_lon(line: str):
         parts = line.split()
@@ -149,30 +138,149 @@ def process_mrk_file_and_jpg(mrk_path: str) -> str:
 
     lat_first, lon_first = _lat_lon(lines[0])
     lat_last, lon_last   = _lat_lon(lines[-1])
-
     latitude  = (lat_first + lat_last) / 2
     longitude = (lon_first + lon_last) / 2
     elevation = round(float(lines[len(lines) // 2].split()[8].split(",")[0]))
+    return latitude, longitude, elevation
+
+
+def dji_flight_window(mrk_path: str, start_dt: datetime, end_dt: datetime,
+                      flight_name: str) -> dict:
+    """Query window of a DJI flight: MRK position plus start/end (UTC)."""
+    lat, lon, elev = _mrk_position(mrk_path)
+    return {"style": "dji", "lat": lat, "lon": lon, "elev": elev,
+            "start": start_dt, "end": end_dt, "flight": flight_name}
+
 
-    flight_name = os.path.basename(mrk_path).split("_")[3]
+def wingtra_flight_window(json_fp: str, flight_name: str) -> dict:
+    """Query window of a Wingtra flight from its JSON log."""
+    lat, lon, alt = extract_coordinates(json_fp)
+    s_ts, e_ts = extract_timestamps(json_fp)
+    return {"style": "wingtra", "lat": lat, "lon": lon, "elev": alt + WINGTRA_ALT_OFFSET,
+            "start_ms": s_ts, "end_ms": e_ts, "flight": flight_name}
 
-    sapos_str = (
-        f"{str(latitude).replace('.', ',')}   "
-        f"{str(longitude).replace('.', ',')}   "
-        f"{elevation}   {formatted_date}   {formatted_time}   {duration}   1   R3   {flight_name}"
+
+def format_sapos_query(w: dict) -> str:
+    """SAPOS query line for a flight window (Wingtra or DJI layout)."""
+    if w["style"] == "wingtra":
+        s_ts = w["start_ms"] - WINGTRA_BUFFER_MS
+        e_ts = w["end_ms"] + WINGTRA_BUFFER_MS
+        duration = int(round((e_ts - s_ts) / 1000 / 60 + 1))
+        return (f"{w['lat']:.6f} {w['lon']:.6f} {int(w['elev'])} "
+                f"{gps_time_to_utc(s_ts)} {duration} 1 R3 {w['flight']}")
+
+    buffer_min = QUERY_BUFFER_MIN
+    duration = ceil((w["end"] - w["start"]).total_seconds() / 60 + 2 * buffer_min)
+    start_dt_earlier = w["start"] - timedelta(minutes=buffer_min)
+    formatted_date = start_dt_earlier.strftime("%d.%m.%Y")
+    formatted_time = start_dt_earlier.strftime("%H:%M:%S")
+    return (
+        f"{str(w['lat']).replace('.', ',')}   "
+        f"{str(w['lon']).replace('.', ',')}   "
+        f"{w['elev']}   {formatted_date}   {formatted_time}   {duration}   1   R3   {w['flight']}"
     )
 
+
+def merge_flight_windows(windows: List[dict], flight_name: str) -> dict:
+    """
+    One window covering all *windows*: mean position and height, earliest
+    start to latest end.  Wingtra-only input keeps the Wingtra layout;
+    otherwise Wingtra times are converted and the DJI layout is used.
+    """
+    if not windows:
+        raise ValueError("No flight windows to merge")
+    n = len(windows)
+    lat = sum(w["lat"] for w in windows) / n
+    lon = sum(w["lon"] for w in windows) / n
+    elev = sum(w["elev"] for w in windows) / n
+    if all(w["style"] == "wingtra" for w in windows):
+        return {"style": "wingtra", "lat": lat, "lon": lon, "elev": elev,
+                "start_ms": min(w["start_ms"] for w in windows),
+                "end_ms": max(w["end_ms"] for w in windows), "flight": flight_name}
+
+    def _span(w: dict):
+        if w["style"] == "wingtra":
+            return tuple(datetime.fromtimestamp(w[k] / 1000, timezone.utc).replace(tzinfo=None)
+                         for k in ("start_ms", "end_ms"))
+        return w["start"].replace(tzinfo=None), w["end"].replace(tzinfo=None)
+
+    spans = [_span(w) for w in windows]
+    return {"style": "dji", "lat": lat, "lon": lon, "elev": round(elev),
+            "start": min(a for a, _ in spans), "end": max(b for _, b in spans),
+            "flight": flight_name}
+
+
+def dji_name_time(name: str) -> datetime:
+    """Naive local time from a DJI_YYYYMMDDHHMM… file name."""
+    m = re.search(r"DJI_(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})", name)
+    if m is None:
+        raise ValueError(f"No DJI_YYYYMMDDHHMM time in {name}")
+    return datetime(*(int(m.group(i)) for i in range(1, 6)))
+
+
+def _exif_datetime(jpg_path) -> datetime:
+    """EXIF DateTimeOriginal of *jpg_path* (naive Berlin local time)."""
+    import exifread
+
+    count("exif_reads")
+    with stage("parse"), open(jpg_path, "rb") as f:
+        tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal")
+    dto = tags.get("EXIF DateTimeOriginal")
+    if dto is None:
+        raise ValueError(f"No EXIF DateTimeOriginal in: {jpg_path}")
+    return datetime.strptime(str(dto), "%Y:%m:%d %H:%M:%S")
+
+
+def dji_name_window(mrk_path: str, jpg_files: List[str],
+                    flight_name: Optional[str] = None) -> dict:
+    """
+    Window from file names: start from the MRK name, end from the last JPG
+    name (sorted *jpg_files*); flight name from the MRK name by default.
+    """
+    if not jpg_files:
+        raise FileNotFoundError("No JPG files next to the MRK file.")
+    start_dt = convert_gps_time(dji_name_time(os.path.basename(mrk_path)))
+    end_dt   = convert_gps_time(dji_name_time(os.path.basename(jpg_files[-1])))
+    if flight_name is None:
+        flight_name = os.path.basename(mrk_path).split("_")[3]
+    return dji_flight_window(mrk_path, start_dt, end_dt, flight_name)
+
+
+def dji_exif_window(mrk_path: str, jpg_paths: List, flight_name: str) -> dict:
+    """Window from EXIF DateTimeOriginal of the first and last (sorted) JPG."""
+    if not jpg_paths:
+        raise FileNotFoundError(f"No JPG files for {mrk_path}")
+    start_dt = convert_gps_time(_exif_datetime(jpg_paths[0]))
+    end_dt   = convert_gps_time(_exif_datetime(jpg_paths[-1]))
+    return dji_flight_window(mrk_path, start_dt, end_dt, flight_name)
+
+
+def process_mrk_file_and_jpg(mrk_path: str, jpg_files: Optional[List[str]] = None) -> str:
+    """
+    Build SAPOS query string from a DJI *.MRK file + JPGs,
+    write '@sapos_query.txt' next to the MRK,
+    and **return the string**.
+
+    `jpg_files` are the sorted JPG names next to the MRK, when the caller
+    already listed the folder.
+    """
+    path = os.path.dirname(mrk_path)
+    if jpg_files is None:
+        jpg_files = get_sorted_jpg_files(path)
+    sapos_str = format_sapos_query(dji_name_window(mrk_path, jpg_files))
+
     sapos_file = os.path.join(path, "@sapos_query.txt")
-    with open(sapos_file, "w", encoding="utf-8") as fh:
+    with stage("query_write"), open(sapos_file, "w", encoding="utf-8") as fh:
         fh.write(sapos_str.strip())
 
-    print("📄", sapos_str)
-    print("✅ SAPOS query written to", sapos_file)
+    detail(f"📄 {sapos_str}")
+    detail(f"✅ SAPOS query written to {sapos_file}")
     return sapos_str
 
 
 # ── New “EXIF‐based v2” helper ────────────────────────────────────────────────
-def process_mrk_file_and_jpg_v2(mrk_path: str, flight_dir: str) -> str:
+def process_mrk_file_and_jpg_v2(mrk_path: str, flight_dir: str,
+                                jpg_paths: Optional[List[Path]] = None) -> str:
     """
     EXIF‐based v2 helper that treats `flight_dir` itself as the flight folder.
     Steps:
@@ -185,72 +293,102 @@ def process_mrk_file_and_jpg_v2(mrk_path: str, flight_dir: str) -> str:
       7) Read MRK for lat/lon/elev (first, last, middle‐line).
       8) Write @sapos_query.txt into flight_dir.
       9) Use flight_dir.name as the SAPOS “flight” field.
+    `jpg_paths` (sorted) skips step 3 when the caller already listed the folder.
     """
     flight_folder = Path(flight_dir)
     if not flight_folder.is_dir():
         raise FileNotFoundError(f"{flight_folder} is not a directory")
 
     # 3) Gather all JPGs anywhere under flight_folder
-    jpg_paths = sorted(flight_folder.rglob("*.jpg"))
+    if jpg_paths is None:
+        with stage("scan"):
+            jpg_paths = sorted(p for p in flight_folder.rglob("*")
+                               if p.suffix.lower() == ".jpg")
+        count("files_seen", len(jpg_paths))
     if not jpg_paths:
         raise FileNotFoundError(f"No JPG files found under flight folder: {flight_folder}")
 
-    # 4) Read EXIF DateTimeOriginal from first & last JPG
-    def _get_exif_datetime(jpg_path: Path) -> datetime:
-        with open(jpg_path, "rb") as f:
-            tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal")
-        dto = tags.get("EXIF DateTimeOriginal")
-        if dto is None:
-            raise ValueError(f"No EXIF DateTimeOriginal in: {jpg_path}")
-        naive = datetime.strptime(str(dto), "%Y:%m:%d %H:%M:%S")
-        return naive  # Berlin local time
-
-    start_naive = _get_exif_datetime(jpg_paths[0])
-    end_naive   = _get_exif_datetime(jpg_paths[-1])
-
-    # 5) Convert both to GPS‐UTC via v2 converter
-    start_dt = convert_gps_time(start_naive)
-    end_dt   = convert_gps_time(end_naive)
-
-    # 6) Buffer and compute duration (minutes)
-    buffer_min = 10
-    duration = ceil((end_dt - start_dt).total_seconds() / 60 + 2 * buffer_min)
-
-    start_dt_earlier = start_dt - timedelta(minutes=buffer_min)
-    formatted_date  = start_dt_earlier.strftime("%d.%m.%Y")
-    formatted_time  = start_dt_earlier.strftime("%H:%M:%S")
-
-    # 7) Read MRK file (mrk_path) for coords & elevation
-    with open(mrk_path, "r", encoding="utf-8") as fh:
-        lines = fh.readlines()
-    if not lines:
-        raise ValueError(f"MRK file is empty: {mrk_path}")
-
-    def _lat_lon(line: str):
-        parts = line.split()
-        return float(parts[6].split(",")[0]), float(parts[7].split(",")[0])
-
-    lat_first, lon_first = _lat_lon(lines[0])
-    lat_last, lon_last   = _lat_lon(lines[-1])
-    latitude  = (lat_first + lat_last) / 2
-    longitude = (lon_first + lon_last) / 2
-    elevation = round(float(lines[len(lines) // 2].split()[8].split(",")[0]))
-
-    # 8) Flight name is flight_folder.name
-    flight_name = flight_folder.name
-
-    sapos_str = (
-        f"{str(latitude).replace('.', ',')}   "
-        f"{str(longitude).replace('.', ',')}   "
-        f"{elevation}   {formatted_date}   {formatted_time}   {duration}   1   R3   {flight_name}"
-    )
+    # 4-8) EXIF times of first & last JPG, MRK coords, flight_folder.name
+    sapos_str = format_sapos_query(
+        dji_exif_window(mrk_path, jpg_paths, flight_folder.name))
 
     # 9) Write into flight_folder/@sapos_query.txt
     sapos_file = flight_folder / "@sapos_query.txt"
-    with open(sapos_file, "w", encoding="utf-8") as fh:
+    with stage("query_write"), open(sapos_file, "w", encoding="utf-8") as fh:
         fh.write(sapos_str.strip())
 
-    print("📄", sapos_str)
-    print("✅ SAPOS query written to", sapos_file)
+    detail(f"📄 {sapos_str}")
+    detail(f"✅ SAPOS query written to {sapos_file}")
     return sapos_str
 
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  MRK records / flight time window
+# ────────────────────────────────────────────────────────────────────────────
+GPS_EPOCH = datetime(1980, 1, 6)
+LEAP_SECONDS = 18
+
+
+def parse_mrk_line(line: str) -> Optional[dict]:
+    """
+    Parse one DJI *_Timestamp.MRK record.
+
+    Returns {"index", "gps_time", "lat", "lon", "ellh", "q"} – gps_time is a
+    naive datetime in GPS time – or None for blank/garbled lines.
+    """
+    parts = line.split()
+    if len(parts) < 9:
+        return None
+    try:
+        sow = float(parts[1])
+        week = int(parts[2].strip("[]"))
+        return {
+            "index": int(parts[0]),
+            "gps_time": GPS_EPOCH + timedelta(weeks=week, seconds=sow),
+            "lat": float(parts[6].split(",")[0]),
+            "lon": float(parts[7].split(",")[0]),
+            "ellh": float(parts[8].split(",")[0]),
+            "q": int(parts[-1].split(",")[0]),
+        }
+    except (ValueError, IndexError):
+        return None
+
+
+def _first_last_lines(path: str, tail: int = 4096):
+    """First and last non-empty line of a text file, read from both ends."""
+    with open(path, "rb") as fh:
+        first = fh.readline()
+        while first and not first.strip():
+            first = fh.readline()
+        size = fh.seek(0, os.SEEK_END)
+        fh.seek(max(0, size - tail))
+        lines = [ln for ln in fh.read().splitlines() if ln.strip()]
+    last = lines[-1] if lines else first
+    return first.decode("utf-8", "replace"), last.decode("utf-8", "replace")
+
+
+def read_mrk_window(mrk_path: str) -> tuple:
+    """
+    (start, end) GPS time of the captures in *mrk_path*, read from its first
+    and last record only.
+    """
+    count("mrk_reads")
+    with stage("parse"):
+        first, last = (parse_mrk_line(ln) for ln in _first_last_lines(mrk_path))
+    if first is None or last is None:
+        raise ValueError(f"No MRK records in {mrk_path}")
+    return first["gps_time"], last["gps_time"]
+
+
+def berlin_to_gps(naive_berlin: datetime) -> datetime:
+    """
+    Naive Europe/Berlin camera time (EXIF, DJI file names) → naive GPS time.
+    The DJI camera clock runs on GPS time shown as Berlin local time, so
+    only the time zone is removed; UTC is LEAP_SECONDS earlier (see
+    `convert_gps_time`).
+    """
+    import pytz
+
+    utc = pytz.timezone("Europe/Berlin").localize(naive_berlin).astimezone(pytz.utc)
+    return utc.replace(tzinfo=None)
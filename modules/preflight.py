@@ -0,0 +1,217 @@
+"""
+preflight.py – check MRK records against the images before PPK
+
+For every *.MRK in a mission folder the records are indexed by capture
+number and matched with the sequence numbers in the image file names of the
+same folder (dict lookups, one pass each).  Reported per MRK:
+
+  • gaps         capture numbers missing inside the MRK's index range
+  • duplicates   capture numbers recorded more than once
+  • orphans      images without an MRK record
+  • missing      MRK records without an image
+  • non_fixed    records whose RTK flag is not 50 (fixed)
+
+`preflight_missions` runs the check over many missions on a thread pool and
+`write_preflight_report` writes one CSV row per MRK, so problems show up
+before a REDtoolbox batch is generated.
+"""
+
+import csv
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from modules.platform import parse_mrk_line
+from modules.progress import Progress
+from modules.profiling import stage, count
+
+__all__ = ["image_sequence", "check_mrk", "validate_mission", "preflight_missions",
+           "write_preflight_report"]
+
+RTK_FIXED = 50
+
+# (regex, divisor): P4M writes DJI_0010.JPG … (capture * 10 + band)
+_SEQ_PATTERNS = (
+    (re.compile(r"^DJI_\d{14}_(\d{4})_", re.IGNORECASE), 1),     # M3E / L2
+    (re.compile(r"^DJI_(\d{4})\.", re.IGNORECASE), 10),          # P4M
+)
+
+_IMAGE_EXT = (".jpg", ".jpeg")
+
+
+def image_sequence(name: str) -> Optional[int]:
+    """Capture number encoded in a DJI image file name, None if unknown."""
+    for rx, div in _SEQ_PATTERNS:
+        m = rx.match(name)
+        if m:
+            return int(m.group(1)) // div
+    return None
+
+
+def _ranges(numbers: Iterable[int]) -> str:
+    """'3-5, 9' style summary of sorted integers."""
+    out: List[str] = []
+    nums = sorted(numbers)
+    i = 0
+    while i < len(nums):
+        j = i
+        while j + 1 < len(nums) and nums[j + 1] == nums[j] + 1:
+            j += 1
+        out.append(str(nums[i]) if i == j else f"{nums[i]}-{nums[j]}")
+        i = j + 1
+    return ", ".join(out)
+
+
+def check_mrk(mrk_path: str, image_names: List[str]) -> Dict:
+    """
+    Compare one MRK file with the image names of its folder.
+
+    Returns a dict with "mrk", "records", "images", the problem lists
+    "gaps", "duplicates", "orphans", "missing", "non_fixed" and
+    "unnumbered" (images without a recognisable sequence number), and
+    "status": "ok", "warn" (non-fixed records, orphans, missing images)
+    or "error" (no records, gaps or duplicates in the MRK).
+    """
+    q_by_index: Dict[int, int] = {}
+    counts: Counter = Counter()
+    count("mrk_reads")
+    with stage("parse"), open(mrk_path, "r", encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            rec = parse_mrk_line(line)
+            if rec is None:
+                continue
+            counts[rec["index"]] += 1
+            q_by_index[rec["index"]] = rec["q"]
+
+    images: Dict[int, str] = {}
+    unnumbered: List[str] = []
+    for name in image_names:
+        seq = image_sequence(name)
+        if seq is None:
+            unnumbered.append(name)
+        else:
+            images.setdefault(seq, name)
+
+    indices = set(counts)
+    res = {
+        "mrk": mrk_path,
+        "records": sum(counts.values()),
+        "images": len(image_names),
+        "gaps": (sorted(set(range(min(indices), max(indices) + 1)) - indices)
+                 if indices else []),
+        "duplicates": sorted(i for i, n in counts.items() if n > 1),
+        "orphans": sorted(images[s] for s in images.keys() - indices),
+        "missing": sorted(indices - images.keys()),
+        "non_fixed": sorted(i for i, q in q_by_index.items() if q != RTK_FIXED),
+        "unnumbered": sorted(unnumbered),
+    }
+    if not indices or res["gaps"] or res["duplicates"]:
+        res["status"] = "error"
+    elif res["orphans"] or res["missing"] or res["non_fixed"] or unnumbered:
+        res["status"] = "warn"
+    else:
+        res["status"] = "ok"
+    return res
+
+
+def _no_mrk(d: str, images: int = 0, error: Optional[str] = None) -> Dict:
+    """Result entry for a mission that could not be checked."""
+    res = {"mission": d, "mrk": None, "status": "error", "records": 0, "images": images,
+           "gaps": [], "duplicates": [], "orphans": [], "missing": [], "non_fixed": [],
+           "unnumbered": []}
+    if error:
+        res["error"] = error
+    return res
+
+
+def validate_mission(d: str, listing: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Run `check_mrk` for every *.MRK below mission folder `d`, against the
+    images in the MRK's own folder.  `listing` is the output of
+    `wze_uav.scan_mission(d)`; the folder is walked here when not given.
+    A mission without any MRK yields one "error" entry.
+    """
+    if listing is None:
+        with stage("scan"):
+            listing = [os.path.join(r, f) for r, _, fs in os.walk(d) for f in fs]
+    by_dir: Dict[str, List[str]] = {}
+    mrks: List[str] = []
+    for path in listing:
+        name = os.path.basename(path)
+        low = name.lower()
+        if low.endswith(".mrk"):
+            mrks.append(path)
+        elif low.endswith(_IMAGE_EXT):
+            by_dir.setdefault(os.path.dirname(path), []).append(name)
+    if not mrks:
+        return [_no_mrk(d, sum(len(v) for v in by_dir.values()))]
+    results = []
+    for mrk in sorted(mrks):
+        res = check_mrk(mrk, by_dir.get(os.path.dirname(mrk), []))
+        res["mission"] = d
+        results.append(res)
+    return results
+
+
+def preflight_missions(dirs: List[str], workers: int = 8) -> List[Dict]:
+    """
+    `validate_mission` for every folder in `dirs` on `workers` threads.
+    Returns the per-MRK results in mission order and prints a summary.
+    """
+    prog = Progress("preflight", total=len(dirs), unit="missions")
+    results: List[Dict] = []
+
+    def _one(d: str) -> List[Dict]:
+        try:
+            return validate_mission(d)
+        except OSError as exc:
+            return [_no_mrk(d, error=str(exc))]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for res in ex.map(_one, dirs):
+            results.extend(res)
+            worst = "error" if any(r["status"] == "error" for r in res) else \
+                    "warn" if any(r["status"] == "warn" for r in res) else "ok"
+            if worst == "error":
+                prog.fail(f"❌ {res[0]['mission']}: {_describe(res)}")
+            else:
+                prog.advance()
+                if worst == "warn":
+                    prog.warn(f"⚠️  {res[0]['mission']}: {_describe(res)}")
+    n_err = sum(r["status"] == "error" for r in results)
+    n_warn = sum(r["status"] == "warn" for r in results)
+    prog.done(f"{len(results)} MRK file(s): {n_err} with errors, {n_warn} with warnings")
+    return results
+
+
+def _describe(results: List[Dict]) -> str:
+    parts = []
+    for r in results:
+        if r.get("error"):
+            parts.append(r["error"])
+        elif r["mrk"] is None:
+            parts.append("no MRK file")
+        for key in ("gaps", "duplicates", "missing", "non_fixed"):
+            if r[key]:
+                parts.append(f"{key} {_ranges(r[key])}")
+        for key in ("orphans", "unnumbered"):
+            if r[key]:
+                parts.append(f"{len(r[key])} {key}")
+    return "; ".join(parts) or "ok"
+
+
+def write_preflight_report(results: List[Dict], report_fn: str) -> None:
+    """One CSV row per MRK; problem lists are written as '3-5, 9' ranges."""
+    cols = ["mission", "mrk", "status", "records", "images", "gaps", "duplicates",
+            "missing", "non_fixed", "orphans", "unnumbered"]
+    with open(report_fn, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(cols)
+        for r in results:
+            w.writerow([
+                r["mission"], r["mrk"] or "", r["status"], r["records"], r["images"],
+                _ranges(r["gaps"]), _ranges(r["duplicates"]), _ranges(r["missing"]),
+                _ranges(r["non_fixed"]), len(r["orphans"]), len(r["unnumbered"]),
+            ])
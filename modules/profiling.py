@@ -0,0 +1,169 @@
+"""
+profiling.py – lightweight stage timers and counters for pipeline runs
+
+Library code marks its stages and counts what it touches:
+
+    with stage("scan"):
+        ...
+    count("files", len(files))
+
+Both are near no-ops unless a run is being profiled:
+
+    >>> from modules.profiling import profile_run
+    >>> with profile_run("run_report.json", cprofile=True):
+    ...     batch_generate_sapos_queries_v2(images_dir, sapos_out, recurse=True)
+
+The JSON report holds wall time per stage (calls, total, min, max), all
+counters and, if requested, the top cProfile functions and the tracemalloc
+peak/top allocation sites.
+
+Stage names used across the modules: scan, parse, query_write, vrs_copy,
+batch_build, image_copy, rinex_convert.
+"""
+
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+__all__ = ["RunProfile", "profile_run", "stage", "count", "active_profile"]
+
+_active: Optional["RunProfile"] = None
+
+
+class RunProfile:
+    """Collected timings and counters of one run (safe to update from worker threads)."""
+
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.started = datetime.now()
+        self._t0 = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.extra: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            st = self.stages.get(name)
+            if st is None:
+                self.stages[name] = {"calls": 1, "total_s": seconds,
+                                     "min_s": seconds, "max_s": seconds}
+            else:
+                st["calls"] += 1
+                st["total_s"] += seconds
+                st["min_s"] = min(st["min_s"], seconds)
+                st["max_s"] = max(st["max_s"], seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> Dict[str, Any]:
+        """Return the run as a JSON-serialisable dict."""
+        with self._lock:
+            stages = {
+                k: {kk: (round(vv, 6) if isinstance(vv, float) else vv) for kk, vv in v.items()}
+                for k, v in sorted(self.stages.items(), key=lambda kv: -kv[1]["total_s"])
+            }
+            counters = dict(sorted(self.counters.items()))
+        rep = {
+            "name": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self._t0, 6),
+            "stages": stages,
+            "counters": counters,
+        }
+        rep.update(self.extra)
+        return rep
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.report(), fh, indent=2)
+
+
+def active_profile() -> Optional[RunProfile]:
+    """The RunProfile currently collecting, or None."""
+    return _active
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block under stage *name* (if a run is profiled)."""
+    prof = _active
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add_time(name, time.perf_counter() - t0)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add *n* to counter *name* (if a run is profiled)."""
+    if _active is not None:
+        _active.count(name, n)
+
+
+@contextmanager
+def profile_run(report_fn: Optional[str] = None, name: str = "run",
+                cprofile: bool = False, trace_memory: bool = False,
+                top: int = 25) -> Iterator[RunProfile]:
+    """
+    Collect stage timings and counters for the enclosed block.
+
+    Parameters
+    ----------
+    report_fn : str | None
+        Write the JSON report here on exit.  With `cprofile=True` the raw
+        profile is also dumped next to it as `<report_fn>.prof`.
+    cprofile : bool
+        Run the block under cProfile and include the `top` functions by
+        cumulative time in the report.
+    trace_memory : bool
+        Run tracemalloc and include peak memory and the `top` allocation sites.
+    """
+    global _active
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    prev = _active
+    prof = RunProfile(name)
+    _active = prof
+
+    profiler = cProfile.Profile() if cprofile else None
+    started_tm = trace_memory and not tracemalloc.is_tracing()
+    if started_tm:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield prof
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(top)
+            prof.extra["cprofile_top"] = buf.getvalue().splitlines()
+            if report_fn:
+                profiler.dump_stats(os.path.splitext(report_fn)[0] + ".prof")
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            snap = tracemalloc.take_snapshot()
+            prof.extra["memory"] = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [str(s) for s in snap.statistics("lineno")[:top]],
+            }
+            if started_tm:
+                tracemalloc.stop()
+        _active = prev
+        if report_fn:
+            prof.save(report_fn)
@@ -0,0 +1,169 @@
+"""
+progress.py – shared, rate-limited progress reporting
+
+All helpers report through a `Progress` object instead of printing one line
+per file.  What is shown depends on the module-wide verbosity:
+
+    QUIET   (0) – only the end-of-run summary and warnings
+    NORMAL  (1) – plus a throttled status line every `interval` seconds
+    VERBOSE (2) – plus one line per item (the old per-file prints)
+
+    >>> from modules.progress import set_verbosity, VERBOSE
+    >>> set_verbosity(VERBOSE)
+"""
+
+import time
+from datetime import timedelta
+from typing import Optional
+
+__all__ = ["QUIET", "NORMAL", "VERBOSE", "set_verbosity", "get_verbosity",
+           "detail", "Progress", "format_bytes"]
+
+QUIET, NORMAL, VERBOSE = 0, 1, 2
+
+_verbosity = NORMAL
+
+
+def set_verbosity(level: int) -> None:
+    """Set the verbosity used by every Progress created afterwards."""
+    global _verbosity
+    _verbosity = int(level)
+
+
+def get_verbosity() -> int:
+    return _verbosity
+
+
+def detail(msg: str) -> None:
+    """Per-item message from helpers without a Progress; VERBOSE only."""
+    if _verbosity >= VERBOSE:
+        print(msg)
+
+
+def format_bytes(n: float) -> str:
+    """Human-readable byte count (binary units)."""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(n) < 1024 or unit == "TB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+class Progress:
+    """
+    Progress of one operation.
+
+    Parameters
+    ----------
+    label : str
+        Short name shown in front of every line, e.g. "copy_ppk_images".
+    total : int | None
+        Expected number of items, enables the ETA.
+    total_bytes : int | None
+        Expected number of bytes; when given, the ETA is projected from the
+        measured byte throughput instead of the item rate.
+    unit : str
+        What is counted ("files", "folders", ...).
+    interval : float
+        Minimum seconds between two status lines.
+    verbosity : int | None
+        Overrides the module-wide verbosity for this object.
+    """
+
+    def __init__(self, label: str, total: Optional[int] = None,
+                 unit: str = "items", interval: float = 5.0,
+                 verbosity: Optional[int] = None,
+                 total_bytes: Optional[int] = None):
+        self.label = label
+        self.total = total
+        self.total_bytes = total_bytes
+        self.unit = unit
+        self.interval = interval
+        self.verbosity = _verbosity if verbosity is None else verbosity
+        self.count = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+        self._t0 = time.monotonic()
+        self._last = self._t0
+        self._closed = False
+
+    # ── context manager ────────────────────────────────────────────────────
+    def __enter__(self) -> "Progress":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.done()
+
+    # ── messages ───────────────────────────────────────────────────────────
+    def detail(self, msg: str) -> None:
+        """Per-item message, shown only at VERBOSE."""
+        if self.verbosity >= VERBOSE:
+            print(msg)
+
+    def info(self, msg: str) -> None:
+        """Run-level message, shown at NORMAL and above."""
+        if self.verbosity >= NORMAL:
+            print(msg)
+
+    def warn(self, msg: str) -> None:
+        """Warnings are always shown."""
+        print(msg)
+
+    # ── counters ───────────────────────────────────────────────────────────
+    def advance(self, n: int = 1, nbytes: int = 0) -> None:
+        """Count `n` finished items (and `nbytes`); print a throttled status."""
+        self.count += n
+        self.bytes += nbytes
+        now = time.monotonic()
+        if self.verbosity >= NORMAL and now - self._last >= self.interval:
+            self._last = now
+            print(self.status())
+
+    def skip(self, n: int = 1) -> None:
+        self.skipped += n
+
+    def fail(self, msg: Optional[str] = None) -> None:
+        self.failed += 1
+        if msg:
+            self.warn(msg)
+
+    # ── formatting ─────────────────────────────────────────────────────────
+    def elapsed(self) -> float:
+        return time.monotonic() - self._t0
+
+    def status(self) -> str:
+        """One status line: count, bytes, rate and ETA."""
+        el = max(self.elapsed(), 1e-9)
+        rate = self.count / el
+        done = f"{self.count}/{self.total}" if self.total else f"{self.count}"
+        parts = [f"[{self.label}] {done} {self.unit}"]
+        if self.bytes:
+            parts.append(f"{format_bytes(self.bytes)} ({format_bytes(self.bytes / el)}/s)")
+        parts.append(f"{rate:.1f} {self.unit}/s")
+        if self.total_bytes and self.bytes and self.bytes < self.total_bytes:
+            eta = timedelta(seconds=round((self.total_bytes - self.bytes) * el / self.bytes))
+            parts.append(f"ETA {eta}")
+        elif self.total and rate > 0 and self.count < self.total:
+            eta = timedelta(seconds=round((self.total - self.count) / rate))
+            parts.append(f"ETA {eta}")
+        return ", ".join(parts)
+
+    def done(self, msg: Optional[str] = None) -> None:
+        """Print the end-of-run summary (once)."""
+        if self._closed:
+            return
+        self._closed = True
+        secs = self.elapsed()
+        el = f"{secs:.1f} s" if secs < 60 else str(timedelta(seconds=round(secs)))
+        line = f"[{self.label}] done: {self.count} {self.unit}"
+        if self.bytes:
+            line += f", {format_bytes(self.bytes)}"
+        if self.skipped:
+            line += f", {self.skipped} skipped"
+        if self.failed:
+            line += f", {self.failed} failed"
+        line += f" in {el}"
+        if msg:
+            line += f" – {msg}"
+        print(line)
@@ -0,0 +1,325 @@
+"""
+redtoolbox_report.py – collect REDtoolbox results after a batch run
+
+For every mission folder of a batch run the artifacts REDtoolbox leaves in
+`output_dir` are read back:
+
+  • redtoolbox_console.log   START/END timestamps written by the batch file
+                             (made with console_log / `batch --console-log`,
+                             see wze_uav.build_redtoolbox_commands) and the
+                             REDtoolbox console output (error lines)
+  • *.pos                    RTKLIB solution files; Q=1 counts as fixed
+  • images                   geotagged copies, compared with the mission's
+                             own images
+
+`collect_results` returns one row per mission (duration, images in/out, fix
+ratio, errors), `throughput_by_device` aggregates images/minute per device
+and `flag_outliers` marks missions that are unusually slow, poorly fixed or
+incomplete.  `write_results_report` writes both tables as CSV, so batch
+shard sizes and worker counts can be based on measured throughput.
+"""
+
+import csv
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+from modules.progress import Progress
+from modules.profiling import stage, count
+from modules.wze_uav import CONSOLE_LOG, detect_device, read_dirlist
+
+__all__ = ["parse_console_log", "read_pos_quality", "collect_mission", "collect_results",
+           "missions_from_events", "throughput_by_device", "flag_outliers",
+           "write_results_report"]
+
+OUTPUT_DIR = "output_dir"
+_IMAGE_EXT = (".jpg", ".jpeg", ".tif", ".tiff")
+
+# %date% %time% as printed by cmd.exe: German (19.10.2026), ISO or US (10/19/2026)
+_DATE_RES = (
+    (re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})"), ("d", "m", "y")),
+    (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"), ("y", "m", "d")),
+    (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})"), ("m", "d", "y")),
+)
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{2}):(\d{2})(?:[.,](\d{1,2}))?")
+_ERROR_RE = re.compile(r"\b(error|exception|failed|traceback)\b", re.IGNORECASE)
+
+# outlier thresholds
+MAD_Z = 3.5                 # robust z-score of images/minute within a device
+MIN_FIX_RATIO = 0.95
+
+
+def _parse_stamp(text: str) -> Optional[datetime]:
+    """Datetime from a '%date% %time%' string, None if not recognised."""
+    tm = _TIME_RE.search(text)
+    if tm is None:
+        return None
+    for rx, order in _DATE_RES:
+        dm = rx.search(text)
+        if dm:
+            parts = dict(zip(order, (int(g) for g in dm.groups())))
+            hh, mm, ss, cs = tm.groups()
+            return datetime(parts["y"], parts["m"], parts["d"], int(hh), int(mm), int(ss),
+                            int((cs or "0").ljust(2, "0")) * 10_000)
+    return None
+
+
+def parse_console_log(path: str) -> Dict:
+    """
+    {"start", "end", "seconds", "errors"} from a REDtoolbox console log.
+    Times are None when the START/END lines are missing (e.g. the run was
+    aborted); "errors" holds the console lines that mention an error.
+    """
+    start = end = None
+    errors: List[str] = []
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            line = line.strip()
+            if line.startswith("START "):
+                start = _parse_stamp(line[6:])
+            elif line.startswith("END "):
+                end = _parse_stamp(line[4:])
+            elif _ERROR_RE.search(line):
+                errors.append(line)
+    seconds = (end - start).total_seconds() if start and end else None
+    return {"start": start, "end": end, "seconds": seconds, "errors": errors}
+
+
+def read_pos_quality(path: str) -> Dict[int, int]:
+    """{Q: epochs} from an RTKLIB .pos file (1 fix, 2 float, 5 single …)."""
+    q_col = None
+    counts: Dict[int, int] = {}
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            if line.startswith("%"):
+                fields = line[1:].split()
+                if "Q" in fields:
+                    # date and time are two fields in the data lines
+                    q_col = fields.index("Q") + (1 if fields[0] == "GPST" else 0)
+                continue
+            fields = line.split()
+            if q_col is None or len(fields) <= q_col:
+                continue
+            try:
+                q = int(fields[q_col])
+            except ValueError:
+                continue
+            counts[q] = counts.get(q, 0) + 1
+    return counts
+
+
+def _images(folder: str, skip: Optional[str] = None) -> List[str]:
+    """Image files below *folder*, leaving out the sub-folder *skip*."""
+    out: List[str] = []
+    for root, dirs, files in os.walk(folder):
+        count("dirs_listed")
+        if skip is not None:
+            dirs[:] = [x for x in dirs if x != skip]
+        out.extend(os.path.join(root, f) for f in files if f.lower().endswith(_IMAGE_EXT))
+    return out
+
+
+def collect_mission(d: str, device: Optional[str] = None) -> Dict:
+    """
+    Result row for mission folder `d`: "mission", "device", "images_in",
+    "images_out", "seconds", "duration_source" ("log", "mtime" or ""),
+    "fixed", "epochs", "fix_ratio", "errors" and "status" ("ok",
+    "incomplete", "error" or "not_run").
+
+    Without console timestamps the duration falls back to the spread of
+    the output image mtimes (a lower bound).
+    """
+    out_dir = os.path.join(d, OUTPUT_DIR)
+    if device is None:
+        with stage("parse"):
+            device = detect_device(d)
+    with stage("scan"):
+        images_in = _images(d, skip=OUTPUT_DIR)
+        images_out = _images(out_dir) if os.path.isdir(out_dir) else []
+    row = {"mission": d, "device": device or "", "images_in": len(images_in),
+           "images_out": len(images_out), "seconds": None, "duration_source": "",
+           "fixed": 0, "epochs": 0, "fix_ratio": None, "errors": []}
+    if not os.path.isdir(out_dir):
+        row["status"] = "not_run"
+        return row
+
+    with stage("parse"):
+        log_fn = os.path.join(out_dir, CONSOLE_LOG)
+        if os.path.exists(log_fn):
+            con = parse_console_log(log_fn)
+            row["errors"] = con["errors"]
+            if con["seconds"] is not None:
+                row["seconds"], row["duration_source"] = con["seconds"], "log"
+            elif con["start"] is not None:
+                row["errors"].append("no END line in console log (aborted?)")
+        if row["seconds"] is None and len(images_out) > 1:
+            count("stat_calls", len(images_out))
+            mtimes = [os.path.getmtime(p) for p in images_out]
+            row["seconds"], row["duration_source"] = max(mtimes) - min(mtimes), "mtime"
+
+        for root, _, files in os.walk(out_dir):
+            for f in files:
+                if f.lower().endswith(".pos"):
+                    q = read_pos_quality(os.path.join(root, f))
+                    row["fixed"] += q.get(1, 0)
+                    row["epochs"] += sum(q.values())
+    if row["epochs"]:
+        row["fix_ratio"] = row["fixed"] / row["epochs"]
+
+    if row["errors"] or not images_out:
+        row["status"] = "error"
+    elif len(images_out) < len(images_in):
+        row["status"] = "incomplete"
+    else:
+        row["status"] = "ok"
+    return row
+
+
+def missions_from_events(events_fn: str) -> List[Tuple[str, str]]:
+    """(mission, device) of every "mission" event in a batch run's .jsonl."""
+    out: List[Tuple[str, str]] = []
+    with open(events_fn, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue
+            if ev.get("event") == "mission":
+                out.append((ev["mission"], ev.get("device")))
+    return out
+
+
+def collect_results(source, workers: int = 8) -> List[Dict]:
+    """
+    `collect_mission` for every mission of *source* on `workers` threads.
+
+    *source* is the .jsonl event file of a batch run (devices taken from
+    it), a mission list file as used for the batch, or a list of folders
+    or (folder, device) pairs.
+    """
+    if isinstance(source, str):
+        missions = (missions_from_events(source) if source.endswith(".jsonl")
+                    else [(d, None) for d in read_dirlist(source)])
+    else:
+        missions = [m if isinstance(m, tuple) else (m, None) for m in source]
+
+    prog = Progress("redtoolbox_results", total=len(missions), unit="missions")
+
+    def _one(m: Tuple[str, Optional[str]]) -> Dict:
+        try:
+            return collect_mission(*m)
+        except OSError as exc:
+            return {"mission": m[0], "device": m[1] or "", "images_in": 0, "images_out": 0,
+                    "seconds": None, "duration_source": "", "fixed": 0, "epochs": 0,
+                    "fix_ratio": None, "errors": [str(exc)], "status": "error"}
+
+    rows: List[Dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for row in ex.map(_one, missions):
+            rows.append(row)
+            if row["status"] == "error":
+                prog.fail(f"❌ {row['mission']}: {'; '.join(row['errors']) or 'no output'}")
+            else:
+                prog.advance()
+                if row["status"] != "ok":
+                    prog.warn(f"⚠️  {row['mission']}: {row['status']}")
+    flag_outliers(rows)
+    n_flag = sum(bool(r["flags"]) for r in rows)
+    prog.done(f"{len(rows)} mission(s), {n_flag} flagged")
+    return rows
+
+
+def _rate(row: Dict) -> Optional[float]:
+    """Images per minute of one mission, None without a duration or on error."""
+    if not row["seconds"] or not row["images_out"] or row["status"] == "error":
+        return None
+    return row["images_out"] / (row["seconds"] / 60)
+
+
+def throughput_by_device(rows: List[Dict]) -> Dict[str, Dict]:
+    """
+    {device: {"missions", "images", "minutes", "images_per_min",
+    "median_images_per_min"}}; rates use the missions with a known
+    duration and no errors.
+    """
+    out: Dict[str, Dict] = {}
+    for dev in sorted({r["device"] for r in rows}):
+        timed = [r for r in rows if r["device"] == dev and _rate(r) is not None]
+        images = sum(r["images_out"] for r in timed)
+        minutes = sum(r["seconds"] for r in timed) / 60
+        out[dev] = {
+            "missions": sum(r["device"] == dev for r in rows),
+            "images": images,
+            "minutes": minutes,
+            "images_per_min": images / minutes if minutes else None,
+            "median_images_per_min": median(_rate(r) for r in timed) if timed else None,
+        }
+    return out
+
+
+def flag_outliers(rows: List[Dict], mad_z: float = MAD_Z,
+                  min_fix_ratio: float = MIN_FIX_RATIO) -> List[Dict]:
+    """
+    Set row["flags"]: "slow"/"fast" when the images/minute of a mission is
+    more than `mad_z` robust z-scores (median/MAD within its device) off,
+    "low_fix" below `min_fix_ratio`, plus the status when it is not "ok".
+    """
+    for r in rows:
+        r["flags"] = []
+    for dev in {r["device"] for r in rows}:
+        timed = [(r, _rate(r)) for r in rows if r["device"] == dev and _rate(r) is not None]
+        if len(timed) < 3:
+            continue
+        med = median(v for _, v in timed)
+        mad = median(abs(v - med) for _, v in timed)
+        # MAD is 0 when most missions have the same rate: use the mean
+        # absolute deviation instead (Iglewicz & Hoaglin)
+        scale = mad / 0.6745 or 1.253314 * sum(abs(v - med) for _, v in timed) / len(timed)
+        if scale == 0:
+            continue
+        for r, v in timed:
+            z = (v - med) / scale
+            if z < -mad_z:
+                r["flags"].append("slow")
+            elif z > mad_z:
+                r["flags"].append("fast")
+    for r in rows:
+        if r["fix_ratio"] is not None and r["fix_ratio"] < min_fix_ratio:
+            r["flags"].append("low_fix")
+        if r["status"] != "ok":
+            r["flags"].append(r["status"])
+    return rows
+
+
+def _fmt(v: Optional[float], nd: int = 1) -> str:
+    return "" if v is None else f"{v:.{nd}f}"
+
+
+def write_results_report(rows: List[Dict], report_fn: str) -> str:
+    """
+    One CSV row per mission in *report_fn* and the per-device throughput
+    in `<report>_devices.csv`.  Returns the device table's filename.
+    """
+    with open(report_fn, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(["mission", "device", "status", "images_in", "images_out", "seconds",
+                    "duration_source", "images_per_min", "fix_ratio", "flags", "errors"])
+        for r in rows:
+            w.writerow([r["mission"], r["device"], r["status"], r["images_in"],
+                        r["images_out"], _fmt(r["seconds"]), r["duration_source"],
+                        _fmt(_rate(r)), _fmt(r["fix_ratio"], 3),
+                        ",".join(r.get("flags", [])), " | ".join(r["errors"])])
+
+    devices_fn = os.path.splitext(report_fn)[0] + "_devices.csv"
+    with open(devices_fn, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(["device", "missions", "images", "minutes", "images_per_min",
+                    "median_images_per_min"])
+        for dev, t in throughput_by_device(rows).items():
+            w.writerow([dev, t["missions"], t["images"], _fmt(t["minutes"]),
+                        _fmt(t["images_per_min"]), _fmt(t["median_images_per_min"])])
+    return devices_fn
@@ -1,14 +1,80 @@
 """
 rename_rinex_tool.py – minimal helpers for renaming *.25o and cloning to *.obs
+
+With merge=True, folders holding several *.25o for one .RPOS (a mission
+spanning more than one SAPOS delivery) get one merged *.obs instead of
+being skipped (see `modules.rinex.merge_obs`).
 """
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import fnmatch
 import os
 import shutil
 
+from modules.progress import Progress, detail
+from modules.profiling import stage, count
+from modules.rinex import merge_obs
+
 __all__ = ["process_folder", "batch_rename_convert"]
 
-def process_folder(folder: Path, ext: str = "25o", keep_original: bool = True):
+
+def _is_up_to_date(folder: Path, base: str, src_name: Optional[str], ext: str) -> bool:
+    """
+    True if `<base>.obs` exists and is not older than the RINEX source.
+    With no source left (renamed to .obs on an earlier run) an existing
+    .obs counts as up to date.
+    """
+    try:
+        obs_mtime = (folder / f"{base}.obs").stat().st_mtime
+    except FileNotFoundError:
+        return False
+    if src_name is None:
+        return True
+    # the source is renamed to <base>.<ext> on the first run
+    if src_name != f"{base}.{ext}":
+        return False
+    return obs_mtime >= (folder / src_name).stat().st_mtime
+
+
+def _convert(folder: Path, base: str, src_name: str, ext: str, keep_original: bool) -> None:
+    """Rename `src_name` to `<base>.<ext>` and copy/move it to `<base>.obs`."""
+    src = folder / src_name
+    renamed_25o = folder / f"{base}.{ext}"
+    obs_file    = folder / f"{base}.obs"
+
+    # 1) ensure *.25o has the same base name as *.RPOS
+    if src != renamed_25o:
+        detail(f"[rename] {src.name} → {renamed_25o.name}")
+        src.rename(renamed_25o)
+        src = renamed_25o
+
+    if keep_original:
+        detail(f"[copy ] {src.name} → {obs_file.name}")
+        shutil.copyfile(src, obs_file)
+    else:
+        detail(f"[mv   ] {src.name} → {obs_file.name}")
+        src.replace(obs_file)
+
+
+def _merged_up_to_date(folder: Path, base: str, src_names: List[str]) -> bool:
+    """True if `<base>.obs` exists and is not older than any merge input."""
+    try:
+        obs_mtime = (folder / f"{base}.obs").stat().st_mtime
+    except FileNotFoundError:
+        return False
+    return all(obs_mtime >= (folder / n).stat().st_mtime for n in src_names)
+
+
+def _merge(folder: Path, base: str, src_names: List[str]) -> None:
+    """Merge several RINEX observation files into `<base>.obs` (inputs kept)."""
+    detail(f"[merge] {', '.join(sorted(src_names))} → {base}.obs")
+    merge_obs([str(folder / n) for n in sorted(src_names)], str(folder / f"{base}.obs"))
+
+
+def process_folder(folder: Path, ext: str = "25o", keep_original: bool = True,
+                   merge: bool = False) -> bool:
     """
     Make *.25o → *.obs with matching base name.
 
@@ -17,38 +83,132 @@ def process_folder(folder: Path, ext: str = "25o", keep_original: bool = True):
     folder : pathlib.Path
     ext : str           File-extension to look for (default "25o")
     keep_original : bool
-        • True  → keep the renamed *.25o **and** make *.obs copy  
+        • True  → keep the renamed *.25o **and** make *.obs copy
         • False → rename in-place so the file itself becomes *.obs
+    merge : bool
+        Merge several *.{ext} into one *.obs instead of skipping the folder;
+        the inputs are kept.
+
+    Returns True if the folder was converted, False if it was skipped
+    (no unique .RPOS/.{ext} pair, or the .obs is already up to date).
     """
     rpos = list(folder.glob("*.RPOS"))
     rinx = list(folder.glob(f"*.{ext}"))
 
+    if merge and len(rpos) == 1 and len(rinx) > 1:
+        base = rpos[0].stem
+        names = [p.name for p in rinx]
+        if _merged_up_to_date(folder, base, names):
+            detail(f"[ok   ] {folder} – {base}.obs is up to date")
+            return False
+        _merge(folder, base, names)
+        return True
+
     if len(rpos) != 1 or len(rinx) != 1:
-        print(f"[skip] {folder} – need exactly one .RPOS & one .{ext}")
-        return
+        detail(f"[skip] {folder} – need exactly one .RPOS & one .{ext}")
+        return False
 
     base = rpos[0].stem                       # e.g. SITE0100
-    src  = rinx[0]
-    renamed_25o = folder / f"{base}.{ext}"
-    obs_file    = folder / f"{base}.obs"
+    if _is_up_to_date(folder, base, rinx[0].name, ext):
+        detail(f"[ok   ] {folder} – {base}.obs is up to date")
+        return False
+    _convert(folder, base, rinx[0].name, ext, keep_original)
+    return True
 
-    # 1) ensure *.25o has the same base name as *.RPOS
-    if src != renamed_25o:
-        print(f"[rename] {src.name} → {renamed_25o.name}")
-        src.rename(renamed_25o)
-        src = renamed_25o
 
-    if keep_original:
-        print(f"[copy ] {src.name} → {obs_file.name}")
-        shutil.copyfile(src, obs_file)
-    else:
-        print(f"[mv   ] {src.name} → {obs_file.name}")
-        src.rename(obs_file)
+def _find_pairs(master: Path, ext: str, merge: bool = False
+                ) -> Tuple[List[Tuple[Path, str, Optional[str]]],
+                           List[Tuple[Path, str, List[str]]], List[Path]]:
+    """
+    Walk *master* once and return
+      • (folder, rpos_stem, rinex_name | None) for folders with one .RPOS and
+        at most one .{ext}
+      • (folder, rpos_stem, [rinex_name, ...]) for folders with one .RPOS and
+        several .{ext} – only with `merge`
+      • folders with a .RPOS but several .RPOS or .{ext} files (ambiguous)
+    Folders without any .RPOS (e.g. image folders) are ignored silently.
+    """
+    pairs: List[Tuple[Path, str, Optional[str]]] = []
+    multi: List[Tuple[Path, str, List[str]]] = []
+    ambiguous: List[Path] = []
+    for root, _, files in os.walk(master):
+        count("dirs_listed")
+        rpos = [f for f in files if fnmatch.fnmatch(f, "*.RPOS")]
+        if not rpos:
+            continue
+        rinx = [f for f in files if fnmatch.fnmatch(f, f"*.{ext}")]
+        base = os.path.splitext(rpos[0])[0]
+        if len(rpos) == 1 and len(rinx) > 1 and merge:
+            multi.append((Path(root), base, rinx))
+        elif len(rpos) != 1 or len(rinx) > 1:
+            ambiguous.append(Path(root))
+        else:
+            pairs.append((Path(root), base, rinx[0] if rinx else None))
+    return pairs, multi, ambiguous
+
 
-def batch_rename_convert(master_folder, ext: str = "25o", keep_original: bool = True):
+def batch_rename_convert(master_folder, ext: str = "25o", keep_original: bool = True,
+                         workers: int = 4, merge: bool = False) -> Dict[str, List]:
     """
-    Walk *master_folder* recursively and call `process_folder` everywhere.
+    Walk *master_folder* once, collect the .RPOS/.{ext} pairs and convert
+    every folder whose .obs is missing or older than its .{ext} (see
+    `process_folder`).  Conversions run on `workers` threads.  With `merge`,
+    folders with several .{ext} for one .RPOS get a merged .obs.
+
+    Returns a summary {"converted", "merged", "up_to_date", "missing_rinex",
+    "ambiguous", "failed"} of folder lists (failed: (folder, error)).
+    Re-running over an already converted tree only costs the walk.
     """
     master = Path(master_folder).expanduser().resolve()
-    for root, _, _ in os.walk(master):
-        process_folder(Path(root), ext=ext, keep_original=keep_original)
+    with stage("scan"):
+        pairs, multi, ambiguous = _find_pairs(master, ext, merge)
+
+    summary: Dict[str, List] = {"converted": [], "merged": [], "up_to_date": [],
+                                "missing_rinex": [], "ambiguous": ambiguous, "failed": []}
+    todo: List[Tuple[Path, str, Union[str, List[str]]]] = []
+    for folder, base, src_name in pairs:
+        if _is_up_to_date(folder, base, src_name, ext):
+            summary["up_to_date"].append(folder)
+        elif src_name is None:
+            summary["missing_rinex"].append(folder)
+        else:
+            todo.append((folder, base, src_name))
+    for folder, base, src_names in multi:
+        if _merged_up_to_date(folder, base, src_names):
+            summary["up_to_date"].append(folder)
+        else:
+            todo.append((folder, base, src_names))
+
+    prog = Progress("batch_rename_convert", total=len(todo), unit="folders")
+    prog.skip(len(summary["up_to_date"]))
+
+    def _run(job: Tuple[Path, str, Union[str, List[str]]]) -> Tuple[Path, str, Optional[str]]:
+        folder, base, src = job
+        try:
+            if isinstance(src, list):
+                _merge(folder, base, src)
+                return folder, "merged", None
+            _convert(folder, base, src, ext, keep_original)
+            return folder, "converted", None
+        except (OSError, ValueError) as exc:
+            return folder, "failed", str(exc)
+
+    with stage("rinex_convert"), ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for folder, kind, err in ex.map(_run, todo):
+            if err is None:
+                summary[kind].append(folder)
+                prog.advance()
+            else:
+                summary["failed"].append((folder, err))
+                prog.fail(f"❌ {folder}: {err}")
+
+    for folder in summary["ambiguous"]:
+        prog.warn(f"⚠️  {folder} – need exactly one .RPOS & one .{ext}")
+    for folder in summary["missing_rinex"]:
+        prog.warn(f"⚠️  {folder} – .RPOS without .{ext} or .obs")
+    prog.done(f"{len(summary['converted'])} converted, "
+              f"{len(summary['merged'])} merged, "
+              f"{len(summary['up_to_date'])} up to date, "
+              f"{len(summary['ambiguous'])} ambiguous, "
+              f"{len(summary['missing_rinex'])} missing .{ext}")
+    return summary
@@ -0,0 +1,509 @@
+"""
+rinex.py – fast helpers for RINEX 2/3 observation files
+
+`rinex_time_span` memory-maps an observation file, parses the header and
+finds the first and last epoch by scanning forward from the header and
+backward from the end of the file; the middle is never read.  Results are
+cached per file (path, size, mtime), so repeated checks cost a stat call.
+
+`iter_obs_records` streams an observation file one epoch record at a time;
+`trim_obs` uses it to write a copy limited to a time window and `merge_obs`
+to k-way merge several files of one station, both in constant memory.
+`merge_nav` joins navigation files, dropping repeated ephemerides.
+
+All times are naive datetimes in the file's time system (GPS for SAPOS VRS
+and DJI rover files).
+"""
+
+import heapq
+import itertools
+import mmap
+import os
+import re
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ["EPOCH_RE_2", "EPOCH_RE_3", "read_header", "parse_epoch",
+           "rinex_time_span", "check_coverage", "read_header_lines",
+           "iter_obs_records", "format_obs_time", "trim_obs", "merge_obs",
+           "merge_nav", "merge_rinex"]
+
+# epoch lines of observation records (flag 0 = OK, 1 = power failure)
+EPOCH_RE_3 = re.compile(
+    rb"^> (\d{4}) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d\.\d{7})  [01]", re.M)
+EPOCH_RE_2 = re.compile(
+    rb"^ ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d\.\d{7})  [01]", re.M)
+
+_TAIL = 64 * 1024
+
+# {abspath: ((size, mtime_ns), span)}
+_SPAN_CACHE: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+
+
+def read_header(buf) -> Tuple[Dict, int]:
+    """
+    Parse the RINEX header at the start of *buf* (bytes or mmap).
+
+    Returns
+    -------
+    (header, data_offset)
+        header holds "version", "type", "marker", "approx_xyz" (m, or None),
+        "interval" (s or None), "first_obs"/"last_obs" (datetime or None),
+        "time_system" and the raw "lines"; data_offset is the byte offset just after END OF HEADER.
+    """
+    end = buf.find(b"END OF HEADER")
+    if end < 0:
+        raise ValueError("No END OF HEADER found – not a RINEX file?")
+    data_offset = buf.find(b"\n", end) + 1 or len(buf)
+    lines = bytes(buf[:data_offset]).decode("ascii", "replace").splitlines()
+
+    hdr: Dict = {"version": None, "type": None, "marker": None, "approx_xyz": None,
+                 "interval": None, "first_obs": None, "last_obs": None, "time_system": None,
+                 "lines": lines}
+    for line in lines:
+        label = line[60:].strip()
+        body = line[:60]
+        if label == "RINEX VERSION / TYPE":
+            hdr["version"] = float(body[:9])
+            hdr["type"] = body[20:21]
+        elif label == "MARKER NAME":
+            hdr["marker"] = body.strip()
+        elif label == "APPROX POSITION XYZ":
+            try:
+                hdr["approx_xyz"] = tuple(float(body[i:i + 14]) for i in (0, 14, 28))
+            except ValueError:
+                pass
+        elif label == "INTERVAL":
+            hdr["interval"] = float(body[:10])
+        elif label in ("TIME OF FIRST OBS", "TIME OF LAST OBS"):
+            f = body.split()
+            t = datetime(*(int(x) for x in f[:5])) + timedelta(seconds=float(f[5]))
+            hdr["first_obs" if "FIRST" in label else "last_obs"] = t
+            if len(f) > 6:
+                hdr["time_system"] = f[6]
+    return hdr, data_offset
+
+
+def parse_epoch(m: "re.Match") -> datetime:
+    """datetime of an EPOCH_RE_2/EPOCH_RE_3 match."""
+    y, mo, d, h, mi = (int(g) for g in m.groups()[:5])
+    if y < 100:                         # RINEX 2: two-digit year
+        y += 2000 if y < 80 else 1900
+    return datetime(y, mo, d, h, mi) + timedelta(seconds=float(m.group(6)))
+
+
+def _last_epoch(buf, start: int, epoch_re: "re.Pattern") -> Optional["re.Match"]:
+    """Last epoch match in buf[start:], reading backwards in growing windows."""
+    size = len(buf)
+    window = _TAIL
+    while True:
+        lo = max(start, size - window)
+        if lo > start:
+            # begin at a line boundary so '^' cannot match mid-line
+            lo = buf.find(b"\n", lo) + 1 or size
+        last = None
+        for last in epoch_re.finditer(buf, lo, size):
+            pass
+        if last is not None or lo <= start:
+            return last
+        window *= 4
+
+
+def rinex_time_span(path: str) -> Dict:
+    """
+    First/last epoch and interval of a RINEX 2/3 observation file.
+
+    Returns
+    -------
+    dict
+        {"path", "version", "marker", "first", "last", "interval",
+         "n_epochs"} – n_epochs is estimated from span and interval.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (st.st_size, st.st_mtime_ns)
+    hit = _SPAN_CACHE.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        hdr, pos = read_header(mm)
+        epoch_re = EPOCH_RE_3 if (hdr["version"] or 2) >= 3 else EPOCH_RE_2
+        first_m = epoch_re.search(mm, pos)
+        if first_m is None:
+            raise ValueError(f"No observation epochs in {path}")
+        first = parse_epoch(first_m)
+        last = parse_epoch(_last_epoch(mm, first_m.end(), epoch_re) or first_m)
+
+        interval = hdr["interval"]
+        if not interval:
+            second_m = epoch_re.search(mm, first_m.end())
+            interval = ((parse_epoch(second_m) - first).total_seconds()
+                        if second_m else None)
+
+    span = {
+        "path": path,
+        "version": hdr["version"],
+        "marker": hdr["marker"],
+        "first": first,
+        "last": last,
+        "interval": interval,
+        "n_epochs": (int(round((last - first).total_seconds() / interval)) + 1
+                     if interval else 1),
+    }
+    _SPAN_CACHE[path] = (key, span)
+    return span
+
+
+def check_coverage(path: str, start: datetime, end: datetime,
+                   margin_s: float = 0.0) -> Dict:
+    """
+    Check that observation file *path* covers [start - margin, end + margin].
+
+    Returns
+    -------
+    dict
+        the `rinex_time_span` fields plus "covered" (bool), "window"
+        (start, end incl. margin) and "missing_start_s"/"missing_end_s"
+        (seconds of the window not covered at either end, 0 if covered).
+    """
+    span = rinex_time_span(path)
+    w0 = start - timedelta(seconds=margin_s)
+    w1 = end + timedelta(seconds=margin_s)
+    miss0 = max(0.0, (span["first"] - w0).total_seconds())
+    miss1 = max(0.0, (w1 - span["last"]).total_seconds())
+    res = dict(span)
+    res.update({"covered": miss0 == 0 and miss1 == 0, "window": (w0, w1),
+                "missing_start_s": miss0, "missing_end_s": miss1})
+    return res
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Streaming epoch records
+# ────────────────────────────────────────────────────────────────────────────
+def read_header_lines(fh: BinaryIO) -> Tuple[List[bytes], Dict]:
+    """
+    Read the header from binary file *fh* (positioned at its start).
+
+    Returns the raw header lines (incl. END OF HEADER) and the parsed header
+    (see `read_header`) with "n_obs", the RINEX 2 observation type count.
+    """
+    lines: List[bytes] = []
+    for line in fh:
+        lines.append(line)
+        if line[60:].strip() == b"END OF HEADER":
+            break
+    else:
+        raise ValueError("No END OF HEADER found – not a RINEX file?")
+    hdr, _ = read_header(b"".join(lines))
+    hdr["n_obs"] = next((int(ln[:6]) for ln in lines
+                         if ln[60:].strip() == b"# / TYPES OF OBSERV"), 0)
+    return lines, hdr
+
+
+def _int(field: bytes) -> int:
+    return int(field) if field.strip() else 0
+
+
+def _record_time(line: bytes, v3: bool) -> Optional[datetime]:
+    """Epoch time of a record header line, None if the time field is blank."""
+    f = line[2:29] if v3 else line[1:26]
+    if not f.strip():
+        return None
+    if v3:
+        y, mo, d, h, mi, sec = (int(f[0:4]), int(f[5:7]), int(f[8:10]),
+                                int(f[11:13]), int(f[14:16]), float(f[16:27]))
+    else:
+        y, mo, d, h, mi, sec = (int(f[0:2]), int(f[3:5]), int(f[6:8]),
+                                int(f[9:11]), int(f[12:14]), float(f[14:25]))
+        y += 2000 if y < 80 else 1900
+    return datetime(y, mo, d, h, mi) + timedelta(seconds=sec)
+
+
+def iter_obs_records(fh: BinaryIO, hdr: Dict
+                     ) -> Iterator[Tuple[Optional[datetime], int, List[bytes]]]:
+    """
+    Yield (time, flag, lines) for every epoch record after the header.
+
+    *fh* must be positioned right after the header (see `read_header_lines`).
+    Records are read one at a time: RINEX 3 records run until the next '>'
+    line, RINEX 2 records are sized from the satellite count and the number
+    of observation types.  Event records (flag 2-5) keep their special
+    records; their time is None when the file leaves it blank.
+    """
+    v3 = (hdr["version"] or 2) >= 3
+    if v3:
+        rec: List[bytes] = []
+        for line in fh:
+            if line[:1] == b">":
+                if rec:
+                    yield _record_time(rec[0], True), _int(rec[0][31:32]), rec
+                rec = [line]
+            elif rec:
+                rec.append(line)
+        if rec:
+            yield _record_time(rec[0], True), _int(rec[0][31:32]), rec
+        return
+
+    per_sat = max(1, -(-hdr.get("n_obs", 0) // 5))
+    for line in fh:
+        if not line.strip():
+            continue
+        flag = _int(line[28:29])
+        n = _int(line[29:32])
+        if flag in (0, 1, 6):
+            extra = (n - 1) // 12 + n * per_sat if n else 0
+        else:
+            extra = n
+        rec = [line]
+        for _ in range(extra):
+            nxt = fh.readline()
+            if not nxt:
+                break
+            rec.append(nxt)
+        yield _record_time(line, False), flag, rec
+
+
+def format_obs_time(t: datetime, system: Optional[str]) -> bytes:
+    """60-column value of a TIME OF FIRST/LAST OBS header line."""
+    sec = t.second + t.microsecond / 1e6
+    text = (f"{t.year:6d}{t.month:6d}{t.day:6d}{t.hour:6d}{t.minute:6d}"
+            f"{sec:13.7f}     {system or '':<3}")
+    return text.ljust(60).encode("ascii")
+
+
+def trim_obs(src: str, dst: str, start: datetime, end: datetime,
+             margin_s: float = 0.0) -> Dict:
+    """
+    Write a copy of observation file *src* to *dst* holding only the epochs
+    within [start - margin, end + margin].
+
+    The file is streamed record by record (constant memory); the header is
+    copied with TIME OF FIRST/LAST OBS updated.  *dst* is written to a
+    temporary name and renamed when complete.
+
+    Returns
+    -------
+    dict
+        {"kept", "dropped", "first", "last"} – epoch counts and the times of
+        the first/last kept epoch (None if nothing was kept).
+    """
+    w0 = start - timedelta(seconds=margin_s)
+    w1 = end + timedelta(seconds=margin_s)
+    kept = dropped = 0
+    first = last = None
+    tmp = dst + ".part"
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        lines, hdr = read_header_lines(fin)
+        system = hdr["time_system"]
+        patch: Dict[bytes, int] = {}
+        for line in lines:
+            label = line[60:].strip()
+            if label in (b"TIME OF FIRST OBS", b"TIME OF LAST OBS"):
+                patch[label] = fout.tell()
+            fout.write(line)
+
+        t = None
+        for rec_t, flag, rec in iter_obs_records(fin, hdr):
+            t = rec_t or t               # events without time follow the last epoch
+            if t is None or not (w0 <= t <= w1):
+                dropped += flag in (0, 1)
+                continue
+            fout.writelines(rec)
+            if flag in (0, 1) and rec_t is not None:
+                kept += 1
+                first = first or rec_t
+                last = rec_t
+
+        for label, off in patch.items():
+            value = first if label == b"TIME OF FIRST OBS" else last
+            if value is not None:
+                fout.seek(off)
+                fout.write(format_obs_time(value, system))
+    os.replace(tmp, dst)
+    return {"kept": kept, "dropped": dropped, "first": first, "last": last}
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Merging files of one station
+# ────────────────────────────────────────────────────────────────────────────
+_OBS_TYPE_LABELS = (b"SYS / # / OBS TYPES", b"# / TYPES OF OBSERV")
+# APPROX POSITION XYZ of files merged as one station may differ by this (m)
+POSITION_TOL_M = 0.01
+
+
+def _label(line: bytes) -> bytes:
+    return line[60:].strip()
+
+
+def _check_same_station(paths: List[str], headers: List[Dict],
+                        header_lines: List[List[bytes]]) -> None:
+    """
+    Raise ValueError unless all files share version, marker, approximate
+    position (within POSITION_TOL_M) and obs types.  SAPOS VRS deliveries
+    often share a generic marker name, so only the position tells files
+    computed for different virtual stations apart.
+    """
+    ref = headers[0]
+    ref_types = [ln for ln in header_lines[0] if _label(ln) in _OBS_TYPE_LABELS]
+    for path, hdr, lines in zip(paths[1:], headers[1:], header_lines[1:]):
+        if int(hdr["version"] or 0) != int(ref["version"] or 0):
+            raise ValueError(f"RINEX version differs: {paths[0]} vs {path}")
+        if (hdr["marker"] or "") != (ref["marker"] or ""):
+            raise ValueError(f"Different stations: {ref['marker']!r} in {paths[0]}, "
+                             f"{hdr['marker']!r} in {path}")
+        xyz, ref_xyz = hdr["approx_xyz"], ref["approx_xyz"]
+        if (xyz is None) != (ref_xyz is None) or (
+                xyz is not None and max(abs(a - b) for a, b in zip(xyz, ref_xyz))
+                > POSITION_TOL_M):
+            raise ValueError(f"Different station positions: {ref_xyz} in {paths[0]}, "
+                             f"{xyz} in {path}")
+        types = [ln for ln in lines if _label(ln) in _OBS_TYPE_LABELS]
+        if [t.rstrip() for t in types] != [t.rstrip() for t in ref_types]:
+            raise ValueError(f"Observation types differ: {paths[0]} vs {path}")
+
+
+def _keyed(idx: int, records: Iterator[Tuple[Optional[datetime], int, List[bytes]]]):
+    """(time, idx, flag, lines) per record; events without time follow the last epoch."""
+    t = datetime.min
+    for rec_t, flag, rec in records:
+        t = rec_t or t
+        yield t, idx, flag, rec
+
+
+def merge_obs(srcs: List[str], dst: str) -> Dict:
+    """
+    K-way merge of observation files of one station into *dst*.
+
+    Each input is streamed record by record and the records are merged by
+    epoch time (`heapq.merge`), so memory does not grow with file size.
+    Epochs present in several files (overlapping deliveries) are written
+    once.  The header of the earliest file is used with TIME OF FIRST/LAST
+    OBS updated, INTERVAL dropped if the inputs disagree and a COMMENT line
+    naming the merge.  Raises ValueError if the files are not from the same
+    station (marker name and approximate position) or record different
+    observation types.
+
+    Returns
+    -------
+    dict
+        {"epochs", "duplicates", "first", "last"}
+    """
+    fhs = [open(p, "rb") for p in srcs]
+    tmp = dst + ".part"
+    try:
+        parsed = [read_header_lines(fh) for fh in fhs]
+        header_lines = [p[0] for p in parsed]
+        headers = [p[1] for p in parsed]
+        _check_same_station(srcs, headers, header_lines)
+
+        streams = [_keyed(i, iter_obs_records(fh, hdr))
+                   for i, (fh, hdr) in enumerate(zip(fhs, headers))]
+        merged = heapq.merge(*streams, key=lambda r: (r[0], r[1]))
+        first_rec = next(merged, None)
+        if first_rec is None:
+            raise ValueError("No observation epochs in " + ", ".join(srcs))
+        intervals = {h["interval"] for h in headers}
+
+        epochs = dups = 0
+        first = last = None
+        last_t, last_src = None, None
+        with open(tmp, "wb") as fout:
+            patch: Dict[bytes, int] = {}
+            for line in header_lines[first_rec[1]]:
+                label = _label(line)
+                if label == b"INTERVAL" and len(intervals) > 1:
+                    continue
+                if label == b"END OF HEADER":
+                    fout.write(f"{'MERGED FROM %d FILES' % len(srcs):<60}COMMENT\n"
+                               .encode("ascii"))
+                if label in (b"TIME OF FIRST OBS", b"TIME OF LAST OBS"):
+                    patch[label] = fout.tell()
+                fout.write(line)
+
+            for t, i, flag, rec in itertools.chain([first_rec], merged):
+                if t == last_t and i != last_src:
+                    dups += flag in (0, 1)
+                    continue
+                fout.writelines(rec)
+                if flag in (0, 1):
+                    epochs += 1
+                    first = first or t
+                    last, last_t, last_src = t, t, i
+
+            system = headers[first_rec[1]]["time_system"]
+            for label, off in patch.items():
+                value = first if label == b"TIME OF FIRST OBS" else last
+                if value is not None:
+                    fout.seek(off)
+                    fout.write(format_obs_time(value, system))
+        os.replace(tmp, dst)
+    finally:
+        for fh in fhs:
+            fh.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {"epochs": epochs, "duplicates": dups, "first": first, "last": last}
+
+
+def _iter_nav_records(fh: BinaryIO) -> Iterator[List[bytes]]:
+    """Navigation records after the header; continuation lines start blank."""
+    rec: List[bytes] = []
+    for line in fh:
+        if not line.strip():
+            continue
+        if line[:3].strip():
+            if rec:
+                yield rec
+            rec = [line]
+        elif rec:
+            rec.append(line)
+    if rec:
+        yield rec
+
+
+def merge_nav(srcs: List[str], dst: str) -> Dict:
+    """
+    Join navigation files into *dst*, writing each ephemeris (satellite and
+    time of clock) once.  Records are streamed; only their keys are kept.
+    The first file's header is used.  Raises ValueError on mixed versions
+    or file types.
+
+    Returns {"records", "duplicates"}.
+    """
+    seen = set()
+    n = dups = 0
+    tmp = dst + ".part"
+    ref = None
+    try:
+        with open(tmp, "wb") as fout:
+            for path in srcs:
+                with open(path, "rb") as fh:
+                    lines, hdr = read_header_lines(fh)
+                    kind = (int(hdr["version"] or 0), hdr["type"])
+                    if ref is None:
+                        ref = kind
+                        fout.writelines(lines)
+                    elif kind != ref:
+                        raise ValueError(f"Navigation file type differs: {srcs[0]} vs {path}")
+                    width = 23 if kind[0] >= 3 else 22
+                    for rec in _iter_nav_records(fh):
+                        key = rec[0][:width]
+                        if key in seen:
+                            dups += 1
+                            continue
+                        seen.add(key)
+                        fout.writelines(rec)
+                        n += 1
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {"records": n, "duplicates": dups}
+
+
+def merge_rinex(srcs: List[str], dst: str) -> Dict:
+    """`merge_obs` or `merge_nav`, depending on the first file's header type."""
+    with open(srcs[0], "rb") as fh:
+        _, hdr = read_header_lines(fh)
+    return merge_obs(srcs, dst) if hdr["type"] == "O" else merge_nav(srcs, dst)
@@ -0,0 +1,136 @@
+"""
+run_log.py – run-scoped, buffered log and output files
+
+One RunLog keeps the human-readable log, a JSON-lines event stream and any
+number of output files (e.g. the REDtoolbox .bat) open for the whole run.
+Writes are buffered and flushed every `flush_interval` seconds, on close and
+at interpreter exit, instead of re-opening the file for every line.
+"""
+
+import atexit
+import json
+import os
+import time
+import weakref
+from datetime import datetime
+from typing import IO, Any, Dict, List, Optional
+
+from modules.progress import NORMAL, get_verbosity
+
+__all__ = ["RunLog"]
+
+_BUFSIZE = 64 * 1024
+
+# open RunLogs, flushed at interpreter exit
+_OPEN_LOGS: "weakref.WeakSet[RunLog]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_all() -> None:
+    for log in list(_OPEN_LOGS):
+        log.close()
+
+
+class RunLog:
+    """
+    Buffered log for one run.
+
+    Parameters
+    ----------
+    log_fn : str
+        Human-readable log; lines are appended.
+    events_fn : str | None
+        JSON-lines event file.  Defaults to `log_fn` with a `.jsonl` suffix;
+        pass "" to disable events.
+    flush_interval : float
+        Seconds between automatic flushes of all handles.
+    echo : bool
+        Also print log lines (like `write2log`), subject to the verbosity
+        set in modules.progress.
+    """
+
+    def __init__(self, log_fn: str, events_fn: Optional[str] = None,
+                 flush_interval: float = 5.0, echo: bool = True):
+        if events_fn is None:
+            events_fn = os.path.splitext(log_fn)[0] + ".jsonl"
+        self.log_fn = log_fn
+        self.events_fn = events_fn or None
+        self.flush_interval = flush_interval
+        self.echo = echo
+        self._t0 = time.monotonic()
+        self._last_flush = self._t0
+        self._log = open(log_fn, "a+", encoding="utf-8", buffering=_BUFSIZE)
+        self._events = (open(self.events_fn, "a+", encoding="utf-8", buffering=_BUFSIZE)
+                        if self.events_fn else None)
+        self._outputs: List[IO[str]] = []
+        _OPEN_LOGS.add(self)
+
+    # ── context manager ────────────────────────────────────────────────────
+    def __enter__(self) -> "RunLog":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.event("error", error=f"{exc_type.__name__}: {exc}")
+        self.close()
+
+    # ── writing ────────────────────────────────────────────────────────────
+    def write(self, entry: str, level: int = NORMAL) -> None:
+        """
+        Append one line to the log; print it if `echo` and the current
+        verbosity is at least `level`.
+        """
+        self._log.write(entry + "\n")
+        if self.echo and get_verbosity() >= level:
+            print(entry)
+        self._maybe_flush()
+
+    def event(self, kind: str, **fields: Any) -> None:
+        """Append one JSON event {"ts", "elapsed_s", "event", **fields}."""
+        if self._events is None:
+            return
+        rec: Dict[str, Any] = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "elapsed_s": round(self.elapsed(), 3),
+            "event": kind,
+        }
+        rec.update(fields)
+        self._events.write(json.dumps(rec, default=str) + "\n")
+        self._maybe_flush()
+
+    def open_output(self, path: str, mode: str = "w") -> IO[str]:
+        """
+        Open an output file that stays open (buffered) for the whole run and
+        is flushed/closed together with the log.
+        """
+        fh = open(path, mode, encoding="utf-8", buffering=_BUFSIZE)
+        self._outputs.append(fh)
+        return fh
+
+    def elapsed(self) -> float:
+        """Seconds since the log was opened."""
+        return time.monotonic() - self._t0
+
+    # ── flushing ───────────────────────────────────────────────────────────
+    def _handles(self) -> List[IO[str]]:
+        hs = [self._log] + self._outputs
+        if self._events is not None:
+            hs.append(self._events)
+        return [h for h in hs if not h.closed]
+
+    def _maybe_flush(self) -> None:
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Flush all handles."""
+        for h in self._handles():
+            h.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """Flush and close all handles (safe to call more than once)."""
+        for h in self._handles():
+            h.close()
+        _OPEN_LOGS.discard(self)
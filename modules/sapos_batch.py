@@ -1,17 +1,24 @@
 # modules/sapos_batch.py
+import os
 from pathlib import Path
-from typing import Union            
+from typing import Iterator, Optional, Union
 
-from modules.sapos_query import generate_sapos_query, generate_sapos_query_v2
+from modules.sapos_query import generate_sapos_queries, generate_sapos_queries_v2
+from modules.progress import Progress
+from modules.profiling import stage, count
+from modules.streaming import sorted_stream
+from modules.work_queue import WorkQueue, claimed
 
 def batch_generate_sapos_queries(
         root_dir: str,
         master_out: Union[str, Path] = "all_sapos_queries.txt",
         *,
-        recurse: bool = False) -> None:
+        recurse: bool = False,
+        merge: bool = False) -> None:
     """
-    Run generate_sapos_query on every flight folder inside *root_dir*
-    and collect their lines into *master_out*.
+    Run generate_sapos_queries on every flight folder inside *root_dir*
+    and collect their lines (one per flight log) into *master_out*.
+    With *merge*, each folder contributes one merged window instead.
 
     *master_out* can be:
       • a filename   -> that exact file is created/overwritten
@@ -25,67 +32,117 @@ def batch_generate_sapos_queries(
         master_out = master_out / "all_sapos_queries.txt"
     # ◄───────────────────────────────────────────────────────────────────────
 
-    folders = (
-        (p for p in root_dir.rglob("*") if p.is_dir()) if recurse
-        else (p for p in root_dir.iterdir() if p.is_dir())
-    )
+    with stage("scan"):
+        folders = [
+            p for p in (root_dir.rglob("*") if recurse else root_dir.iterdir())
+            if p.is_dir()
+        ]
+    count("folders", len(folders))
 
     lines_written = 0
+    prog = Progress("sapos_queries", total=len(folders), unit="folders")
     with master_out.open("w", encoding="utf-8") as master:
         for fld in folders:
             try:
-                line = generate_sapos_query(fld)    # <- must return str
-                master.write(line + "\n")
-                lines_written += 1
-                print(f"✅ {fld.name}")
+                lines = generate_sapos_queries(str(fld), merge=merge)
+                master.writelines(line + "\n" for line in lines)
+                lines_written += len(lines)
+                prog.detail(f"✅ {fld.name}")
             except Exception as exc:
-                print(f"❌ skipping {fld.name}: {exc}")
+                prog.fail(f"❌ skipping {fld.name}: {exc}")
+            prog.advance()
 
-    print(f"\n📝  {lines_written} query line(s) saved to {master_out.resolve()}")
+    prog.done(f"📝  {lines_written} query line(s) saved to {master_out.resolve()}")
 
 
 # for nested folder structure
 
+def iter_flight_folders_v2(root: Path, recurse: bool = False,
+                           sort: bool = False) -> Iterator[Path]:
+    """
+    Yield the flight folders two levels below *root* (date_folder →
+    flight_folder) as they are listed.  *recurse* is kept for callers of
+    the old signature: the folders at depth two are the same either way, so
+    deeper levels are never walked.  With *sort*, folders come out sorted
+    by path via `modules.streaming.sorted_stream`.
+    """
+    def _walk() -> Iterator[Path]:
+        with os.scandir(root) as dates:
+            date_dirs = [Path(e.path) for e in dates if e.is_dir()]
+        count("dirs_listed")
+        for date_folder in date_dirs:
+            count("dirs_listed")
+            with os.scandir(date_folder) as it:
+                flights = [Path(e.path) for e in it if e.is_dir()]
+            yield from flights
+
+    return sorted_stream(_walk(), key=str) if sort else _walk()
+
+
 def batch_generate_sapos_queries_v2(
         root_dir: str,
         master_out: Union[str, Path] = "all_sapos_queries_v2.txt",
         *,
-        recurse: bool = False) -> None:
+        recurse: bool = False,
+        merge: bool = False,
+        queue_dir: Optional[Union[str, Path]] = None,
+        sort: bool = False) -> None:
+    """
+    Like `batch_generate_sapos_queries`, for the nested date/flight layout
+    (one line per flight log, or one merged line per folder with *merge*).
+
+    With *queue_dir* (a folder on the shared drive, see modules.work_queue)
+    several workstations can run this at the same time: each flight is
+    claimed before its query is generated, flights done or claimed
+    elsewhere are skipped, and *master_out* receives the lines of every
+    flight finished so far by any of them (give each workstation its own
+    *master_out*).
+
+    Flight folders are streamed from `iter_flight_folders_v2`, so the first
+    queries are written while the tree is still being listed (sorted by
+    path with *sort*).  With *queue_dir* the folder list is kept, as it is
+    read twice.
+    """
     root = Path(root_dir)
     master_out = Path(master_out).expanduser()
     if master_out.is_dir() or master_out.suffix == "":
         master_out = master_out / "all_sapos_queries_v2.txt"
 
-    folders = []
-    if not recurse:
-        # Only two levels: date_folder → flight_folder
-        for date_folder in root.iterdir():
-            if not date_folder.is_dir():
-                continue
-            for flight_folder in date_folder.iterdir():
-                if flight_folder.is_dir():
-                    folders.append(flight_folder)
-    else:
-        # Walk all subfolders but select exactly those at depth two under root:
-        for p in root.rglob("*"):
-            if not p.is_dir():
-                continue
-            try:
-                rel = p.relative_to(root).parts
-            except Exception:
-                continue
-            if len(rel) == 2:
-                folders.append(p)
-
+    queue = WorkQueue(str(queue_dir)) if queue_dir is not None else None
+    folders = iter_flight_folders_v2(root, recurse, sort)
+    if queue is not None:
+        with stage("scan"):
+            folders = list(folders)
     lines_written = 0
+    prog = Progress("sapos_queries_v2", total=len(folders) if queue is not None else None,
+                    unit="folders")
     with master_out.open("w", encoding="utf-8") as master:
         for fld in folders:
-            try:
-                line = generate_sapos_query_v2(str(fld))
-                master.write(line + "\n")
-                lines_written += 1
-                print(f"✅ {fld.relative_to(root)}")
-            except Exception as exc:
-                print(f"❌ skipping {fld.relative_to(root)}: {exc}")
+            with claimed(queue, str(fld)) as lease:
+                if not lease:
+                    prog.skip()
+                    continue
+                try:
+                    lines = generate_sapos_queries_v2(str(fld), merge=merge)
+                    if queue is not None:
+                        lease.complete({"lines": lines})
+                    else:
+                        master.writelines(line + "\n" for line in lines)
+                        lines_written += len(lines)
+                    prog.detail(f"✅ {fld.relative_to(root)}")
+                except Exception as exc:
+                    lease.fail(str(exc))
+                    prog.fail(f"❌ skipping {fld.relative_to(root)}: {exc}")
+            prog.advance()
+        count("folders", prog.count + prog.skipped)
+
+        if queue is not None:
+            # every flight finished so far, by this or any other process
+            for fld in folders:
+                rec = queue.result(str(fld))
+                if rec is not None:
+                    lines = rec["result"]["lines"]
+                    master.writelines(line + "\n" for line in lines)
+                    lines_written += len(lines)
 
-    print(f"\n📝  {lines_written} query line(s) saved to {master_out.resolve()}")
\ No newline at end of file
+    prog.done(f"📝  {lines_written} query line(s) saved to {master_out.resolve()}")
@@ -0,0 +1,178 @@
+"""
+sapos_ingest.py – stream SAPOS delivery archives straight into flight folders
+
+SAPOS downloads arrive as zip archives.  Instead of unpacking them into
+02_SAPOS and copying every "{TNR}_*" item again with `copy_vrs_for_fplans`,
+`ingest_sapos_archives` reads the archives with `zipfile` and writes each
+member once, directly to where REDtoolbox needs it:
+
+  • members whose name starts with "{TNR}_" go into that TNR's FPLAN folder
+    (from the FPLAN list written by `extract_fplans`)
+  • members whose name starts with a SAPOS query flight name go into the
+    folder holding that flight's @sapos_query.txt
+
+Members are streamed in chunks (constant memory) to a temporary name and
+renamed when complete; several archives are processed in parallel.
+"""
+
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from modules.progress import Progress
+from modules.profiling import stage, count
+from modules.flight_index import load_flight_index
+
+__all__ = ["tnr_targets", "query_flight_targets", "ingest_sapos_archives"]
+
+CHUNK = 1024 * 1024
+
+
+def tnr_targets(fplan_list_fn: str) -> Dict[str, str]:
+    """
+    {TNR: FPLAN folder} for an FPLAN list (see `extract_fplans`), read from
+    its flight index (`modules.flight_index.load_flight_index`).
+    """
+    targets: Dict[str, str] = {}
+    for row in load_flight_index(fplan_list_fn):
+        targets.setdefault(row["tnr"], row["fplan_dir"])
+    return targets
+
+
+def query_flight_targets(flights_root: str) -> Dict[str, str]:
+    """
+    {flight name: folder} for every @sapos_query.txt below *flights_root*;
+    the flight name is the last field of each query line (a folder with
+    several flights has one line per flight).
+    """
+    targets: Dict[str, str] = {}
+    for root, _, files in os.walk(flights_root):
+        if "@sapos_query.txt" not in files:
+            continue
+        with open(os.path.join(root, "@sapos_query.txt"), encoding="utf-8") as fh:
+            for line in fh:
+                fields = line.split()
+                if fields:
+                    targets.setdefault(fields[-1], root)
+    return targets
+
+
+def _route(member: str, tnrs: Dict[str, str], flights: List[Tuple[str, str]]
+           ) -> Optional[str]:
+    """
+    Destination path for zip *member*, or None if it matches nothing.  The
+    first path component that starts with "{TNR}_" or "{flight}_" (or equals
+    the flight name) decides the target; the path from there on is kept.
+    """
+    parts = [p for p in member.replace("\\", "/").split("/") if p]
+    if not parts or any(p == ".." for p in parts):
+        return None
+    for i, part in enumerate(parts):
+        tnr = part.split("_", 1)[0]
+        if "_" in part and tnr in tnrs:
+            return os.path.join(tnrs[tnr], *parts[i:])
+        for flight, folder in flights:      # longest names first
+            stem = os.path.splitext(part)[0]
+            if part.startswith(flight + "_") or stem == flight:
+                return os.path.join(folder, *parts[i:])
+    return None
+
+
+def _extract_archive(archive: str, tnrs: Dict[str, str], flights: List[Tuple[str, str]],
+                     overwrite: bool, chunk_size: int, prog: Progress
+                     ) -> Dict[str, List]:
+    res: Dict[str, List] = {"extracted": [], "skipped": [], "unmatched": []}
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            dest = _route(info.filename, tnrs, flights)
+            if dest is None:
+                res["unmatched"].append((archive, info.filename))
+                continue
+            if (not overwrite and os.path.exists(dest)
+                    and os.path.getsize(dest) == info.file_size):
+                res["skipped"].append(dest)
+                prog.skip()
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = dest + ".part"
+            with zf.open(info) as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+            os.replace(tmp, dest)
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            os.utime(dest, (mtime, mtime))
+            res["extracted"].append(dest)
+            count("ingest_bytes", info.file_size)
+            prog.advance(1, info.file_size)
+            prog.detail(f"📦 {os.path.basename(archive)}:{info.filename} -> {dest}")
+    return res
+
+
+def ingest_sapos_archives(
+    archives: Union[str, Iterable[str]],
+    fplan_list_fn: Optional[str] = None,
+    flights_root: Optional[str] = None,
+    workers: int = 4,
+    overwrite: bool = True,
+    chunk_size: int = CHUNK
+) -> Dict[str, List]:
+    """
+    Extract SAPOS delivery zip archives directly into their flight folders.
+
+    Parameters
+    ----------
+    archives : str | iterable of str
+        Zip files, or one directory whose *.zip files are all ingested.
+    fplan_list_fn : str | None
+        FPLAN list from `extract_fplans`; routes "{TNR}_*" members (WZE-UAV).
+    flights_root : str | None
+        Root holding flights with @sapos_query.txt; routes members by the
+        query's flight name.
+    workers : int
+        Archives processed in parallel.
+    overwrite : bool
+        If False, members whose destination already exists with the same
+        size are skipped.
+
+    Returns
+    -------
+    dict
+        {"extracted": [dest, ...], "skipped": [dest, ...],
+         "unmatched": [(archive, member), ...]}
+    """
+    if isinstance(archives, (str, Path)) and os.path.isdir(archives):
+        archives = sorted(str(p) for p in Path(archives).glob("*.zip"))
+    elif isinstance(archives, (str, Path)):
+        archives = [str(archives)]
+    archives = list(archives)
+    if fplan_list_fn is None and flights_root is None:
+        raise ValueError("Pass fplan_list_fn and/or flights_root to route members")
+
+    with stage("scan"):
+        tnrs = tnr_targets(fplan_list_fn) if fplan_list_fn else {}
+        flights = query_flight_targets(flights_root) if flights_root else {}
+    flight_list = sorted(flights.items(), key=lambda kv: -len(kv[0]))
+
+    prog = Progress("ingest_sapos_archives", unit="files")
+    summary: Dict[str, List] = {"extracted": [], "skipped": [], "unmatched": []}
+    with stage("vrs_copy"), ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futures = [ex.submit(_extract_archive, a, tnrs, flight_list, overwrite, chunk_size, prog)
+                   for a in archives]
+        for a, fut in zip(archives, futures):
+            try:
+                res = fut.result()
+            except (OSError, zipfile.BadZipFile) as exc:
+                prog.fail(f"❌ {a}: {exc}")
+                continue
+            for k in summary:
+                summary[k].extend(res[k])
+
+    for archive, member in summary["unmatched"]:
+        prog.warn(f"⚠️  No FPLAN/flight for {os.path.basename(archive)}:{member}")
+    prog.done(f"{len(archives)} archive(s), {len(summary['unmatched'])} unmatched member(s)")
+    return summary
@@ -1,44 +1,73 @@
 """
 sapos_query.py – to create strings for SAPOS queries
+
+generate_sapos_query(_v2) return one line per folder (the first flight log
+found); the platform, and with it the query builder in QUERY_BUILDERS, comes
+from the detector registry in modules.detectors.  generate_sapos_queries(_v2)
+scan the folder once, return one line per flight log (every Wingtra JSON and
+every DJI *.MRK) and can merge them into a single window per folder.
 """
 
 import os
+from typing import Callable, Dict, List
+from modules.detectors import REGISTRY, detect_platform, scan_folder
 from modules.platform import *
+from modules.progress import detail
+from modules.profiling import stage
 
-def generate_sapos_query(data_dir: str) -> str:
-    """Return one SAPOS query line for *data_dir*."""
+def _wingtra_query(data_dir: str, listing: List[str], v2: bool) -> str:
+    json_fp = min(f for f in listing if f.lower().endswith(".json"))
+    if v2:
+        flight = "_".join(Path(data_dir).name.split())
+    else:
+        flight = "_".join(Path(json_fp).parents[1].name.split())
+    line = format_sapos_query(wingtra_flight_window(json_fp, flight))
+    with stage("query_write"):
+        Path(data_dir, "@sapos_query.txt").write_text(line + "\n", encoding="utf-8")
+    detail(f"📄 {line}")
+    detail("✅ SAPOS query written")
+    return line
+
+
+def _dji_query(data_dir: str, listing: List[str], v2: bool) -> str:
+    mrk_fp = min(f for f in listing if f.lower().endswith(".mrk"))
+    jpgs = [f for f in listing if f.lower().endswith(".jpg")]
+    if v2:
+        # EXIF times of all JPGs below the flight folder
+        return process_mrk_file_and_jpg_v2(mrk_fp, data_dir, sorted(Path(f) for f in jpgs))
+    mrk_dir = os.path.dirname(mrk_fp)
+    return process_mrk_file_and_jpg(
+        mrk_fp, sorted(os.path.basename(f) for f in jpgs if os.path.dirname(f) == mrk_dir))
+
+
+# query builder of each detector (`modules.detectors.Detector.query`)
+QUERY_BUILDERS: Dict[str, Callable[[str, List[str], bool], str]] = {
+    "wingtra": _wingtra_query,
+    "dji": _dji_query,
+}
+
+
+def _detect_and_query(data_dir: str, v2: bool) -> str:
+    """List *data_dir* once, detect the platform, run its query builder."""
     if not os.path.isdir(data_dir):
         raise FileNotFoundError(f"{data_dir} is not a directory")
+    with stage("scan"):
+        listing = scan_folder(data_dir)
+        det = detect_platform(data_dir, listing)
+    if det is None:
+        raise FileNotFoundError("No Wingtra JSON or DJI MRK found"
+                                + (" (v2)" if v2 else " in folder"))
+    detail(f"{det.icon} Detected {det.label} dataset{' (v2)' if v2 else ''}")
+    return QUERY_BUILDERS[det.query](data_dir, listing, v2)
 
-    # ── 1) Wingtra ────────────────────────────────────────────────────────
-    json_fp = find_json_file(data_dir)
-    if json_fp:
-        print("🛩 Detected Wingtra dataset")
-        lat, lon, alt = extract_coordinates(json_fp)
-        alt += 120
-        s_ts, e_ts = extract_timestamps(json_fp)
-        s_ts -= 300_000;  e_ts += 300_000
-        duration  = int(round((e_ts - s_ts) / 1000 / 60 + 1))
-        dt_str    = gps_time_to_utc(s_ts)
-        flight    = "_".join(Path(json_fp).parents[1].name.split())
-        line = f"{lat:.6f} {lon:.6f} {int(alt)} {dt_str} {duration} 1 R3 {flight}"
-        Path(data_dir, "@sapos_query.txt").write_text(line + "\n", encoding="utf-8")
-        print("📄", line);  print("✅ SAPOS query written");  return line
-
-    # ── 2) DJI MRK-based flights ─────────────────────────────────────────
-    #     • .LDR present  →  Zenmuse L2
-    #     • no .LDR       →  Mavic 3 Enterprise (same MRK parser)
-    ldr_fp = find_ldr_file(data_dir)
-    mrk_fp = find_mrk_file(data_dir)
-    if mrk_fp:
-        if ldr_fp:
-            print("🚁 Detected DJI Zenmuse L2 dataset")
-        else:
-            print("🛸 Detected DJI Mavic 3 Enterprise dataset")
-        return process_mrk_file_and_jpg(mrk_fp)
 
-    # ── 3) nothing matched ───────────────────────────────────────────────
-    raise FileNotFoundError("No Wingtra JSON or DJI MRK found in folder")
+def generate_sapos_query(data_dir: str) -> str:
+    """
+    Return one SAPOS query line for *data_dir*.  The platform is detected
+    from one listing of the folder (see `modules.detectors`); DJI times come
+    from the JPG names next to the MRK.
+    """
+    return _detect_and_query(data_dir, v2=False)
 
 
 # ────────────────────────────────────────────────────────────────────────────
@@ -48,38 +77,188 @@ def generate_sapos_query_v2(data_dir: str) -> str:
     """
     Like the original, but always uses process_mrk_file_and_jpg_v2 for DJI.
     """
+    return _detect_and_query(data_dir, v2=True)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# All flights of a folder in one scan
+# ────────────────────────────────────────────────────────────────────────────
+def scan_flight_logs(data_dir: str) -> Dict:
+    """
+    Walk *data_dir* once and collect Wingtra JSONs, DJI MRKs, whether an
+    .LDR is present and the JPG names per folder; "files" keeps the whole
+    listing for `detect_platform`.
+    """
+    found: Dict = {"json": [], "mrk": [], "ldr": False, "jpgs": {}, "files": []}
+    with stage("scan"):
+        found["files"] = scan_folder(data_dir)
+        for fp in found["files"]:
+            low = fp.lower()
+            if low.endswith(".json"):
+                found["json"].append(fp)
+            elif low.endswith(".mrk"):
+                found["mrk"].append(fp)
+            elif low.endswith(".ldr"):
+                found["ldr"] = True
+            elif low.endswith(".jpg"):
+                root, f = os.path.split(fp)
+                found["jpgs"].setdefault(root, []).append(f)
+    found["json"].sort()
+    found["mrk"].sort()
+    for names in found["jpgs"].values():
+        names.sort()
+    return found
+
+
+def _wingtra_windows(jsons: List[str], name_of) -> List[dict]:
+    """Windows of all JSONs that parse as Wingtra logs (others are skipped)."""
+    windows, names = [], set()
+    for fp in jsons:
+        flight = name_of(fp)
+        if flight in names:
+            flight = "_".join(Path(fp).stem.split())
+        try:
+            windows.append(wingtra_flight_window(fp, flight))
+        except (ValueError, StopIteration) as exc:
+            detail(f"⚠️  {fp} is not a Wingtra log ({exc}), skipping")
+            continue
+        names.add(flight)
+    return windows
+
+
+def _dji_named(names: List[str]) -> List[str]:
+    """The JPG names with a DJI_YYYYMMDDHHMM time (thumbnails etc. left out)."""
+    out = []
+    for name in names:
+        try:
+            dji_name_time(name)
+        except ValueError:
+            continue
+        out.append(name)
+    return out
+
+
+def _mrk_record_window(mrk: str, flight: str) -> dict:
+    """Window from the first/last record of *mrk* (one of several in a folder)."""
+    start, end = read_mrk_window(mrk)
+    lag = timedelta(seconds=LEAP_SECONDS)
+    return dji_flight_window(mrk, start - lag, end - lag, flight)
+
+
+def _mrks_by_dir(mrks: List[str]) -> Dict[str, List[str]]:
+    by_dir: Dict[str, List[str]] = {}
+    for m in mrks:
+        by_dir.setdefault(os.path.dirname(m), []).append(m)
+    return by_dir
+
+
+def _detail_dji(data_dir: str, found: Dict) -> None:
+    """Name the DJI platform of the MRK flights (Wingtra detectors left out)."""
+    det = detect_platform(data_dir, found["files"],
+                          [d for d in REGISTRY if d.query == "dji"])
+    if det is not None:
+        detail(f"{det.icon} {det.label} flight(s)")
+
+
+def _write_queries(target_dir: str, lines: List[str]) -> None:
+    """Write *lines* to target_dir/@sapos_query.txt, one query per line."""
+    with stage("query_write"):
+        Path(target_dir, "@sapos_query.txt").write_text("\n".join(lines) + "\n",
+                                                        encoding="utf-8")
+
+
+def _finish(data_dir: str, windows: List[dict], targets: List[str], merge: bool) -> List[str]:
+    """Format (or merge) *windows*, write the query files, return the lines."""
+    if not windows:
+        raise FileNotFoundError("No Wingtra JSON or DJI MRK found in folder")
+    if merge and len(windows) > 1:
+        merged = merge_flight_windows(windows, "_".join(Path(data_dir).name.split()))
+        line = format_sapos_query(merged)
+        _write_queries(data_dir, [line])
+        detail(f"📄 {line}  (merged {len(windows)} flights)")
+        return [line]
+
+    lines = [format_sapos_query(w) for w in windows]
+    per_target: Dict[str, List[str]] = {}
+    for t, line in zip(targets, lines):
+        per_target.setdefault(t, []).append(line)
+    for t, ls in per_target.items():
+        _write_queries(t, ls)
+    for line in lines:
+        detail(f"📄 {line}")
+    detail(f"✅ {len(lines)} SAPOS quer{'y' if len(lines) == 1 else 'ies'} written")
+    return lines
+
+
+def generate_sapos_queries(data_dir: str, merge: bool = False) -> List[str]:
+    """
+    One SAPOS query line per flight log in *data_dir* (all Wingtra JSONs and
+    all DJI *.MRK, found in one scan).  Query files are written like
+    `generate_sapos_query` does: Wingtra lines to *data_dir*, DJI lines next
+    to their MRK.  Several MRKs in one folder use their record times; an MRK
+    that gives no window is reported and skipped.  With `merge`, all flights are combined into one window
+    (see `merge_flight_windows`) written to *data_dir*.
+    """
     if not os.path.isdir(data_dir):
         raise FileNotFoundError(f"{data_dir} is not a directory")
+    found = scan_flight_logs(data_dir)
 
-    # 1) Wingtra (unchanged)
-    json_fp = find_json_file(data_dir)
-    if json_fp:
-        print("🛩 Detected Wingtra dataset (v2)")
-        lat, lon, alt = extract_coordinates(json_fp)
-        alt += 120
-        s_ts, e_ts = extract_timestamps(json_fp)
-        s_ts -= 300_000
-        e_ts += 300_000
-        duration = int(round((e_ts - s_ts) / 1000 / 60 + 1))
-        dt_str = gps_time_to_utc(s_ts)
+    windows = _wingtra_windows(found["json"],
+                               lambda fp: "_".join(Path(fp).parents[1].name.split()))
+    targets = [data_dir] * len(windows)
+    for mrk_dir, mrks in _mrks_by_dir(found["mrk"]).items():
+        jpgs = _dji_named(found["jpgs"].get(mrk_dir, []))
+        for mrk in mrks:
+            try:
+                if len(mrks) > 1:
+                    window = _mrk_record_window(mrk, os.path.basename(mrk).split("_")[3])
+                else:
+                    window = dji_name_window(mrk, jpgs)
+            except (FileNotFoundError, ValueError, IndexError) as exc:
+                detail(f"⚠️  {mrk}: {exc}, skipping")
+                continue
+            windows.append(window)
+            targets.append(mrk_dir)
+    if found["mrk"]:
+        _detail_dji(data_dir, found)
+    return _finish(data_dir, windows, targets, merge)
 
-        flight = "_".join(Path(data_dir).name.split())
-        line = f"{lat:.6f} {lon:.6f} {int(alt)} {dt_str} {duration} 1 R3 {flight}"
-        Path(data_dir, "@sapos_query.txt").write_text(line + "\n", encoding="utf-8")
-        print("📄", line)
-        print("✅ SAPOS query written")
-        return line
-
-    # 2) DJI MRK (always EXIF-based v2)
-    ldr_fp = find_ldr_file(data_dir)
-    mrk_fp = find_mrk_file(data_dir)
-    if mrk_fp:
-        if ldr_fp:
-            print("🚁 Detected DJI Zenmuse L2 dataset (v2)")
-        else:
-            print("🛸 Detected DJI Phantom 3 Multispectral dataset (v2)")
-        # Only one call: the two-argument v2 helper
-        return process_mrk_file_and_jpg_v2(mrk_fp, data_dir)
-
-    # 3) Nothing matched
-    raise FileNotFoundError("No Wingtra JSON or DJI MRK found (v2)")
+
+def generate_sapos_queries_v2(data_dir: str, merge: bool = False) -> List[str]:
+    """
+    Like `generate_sapos_queries` for the nested WZE-UAV layout: DJI times
+    come from the EXIF of the first/last JPG below each MRK's folder, and
+    all query lines go to *data_dir*.  Flights are named after *data_dir*,
+    with the MRK's sub-folder (or a counter) appended when there are
+    several.  Several MRKs in one folder use the MRK record times instead.
+    """
+    flight_folder = Path(data_dir)
+    if not flight_folder.is_dir():
+        raise FileNotFoundError(f"{flight_folder} is not a directory")
+    found = scan_flight_logs(data_dir)
+    base = "_".join(flight_folder.name.split())
+
+    windows = _wingtra_windows(found["json"], lambda fp: base)
+    by_dir = _mrks_by_dir(found["mrk"])
+    several = len(found["mrk"]) > 1
+    for i, mrk in enumerate(found["mrk"], start=1):
+        mrk_dir = os.path.dirname(mrk)
+        flight = flight_folder.name
+        if several:
+            sub = os.path.relpath(mrk_dir, data_dir)
+            flight = f"{flight}_{'_'.join(Path(sub).parts) if sub != '.' else i}"
+        try:
+            if len(by_dir[mrk_dir]) > 1:
+                windows.append(_mrk_record_window(mrk, flight))
+                continue
+            if several:
+                jpgs = sorted(Path(r, f) for r, fs in found["jpgs"].items()
+                              if r == mrk_dir or r.startswith(mrk_dir + os.sep) for f in fs)
+            else:
+                jpgs = sorted(Path(r, f) for r, fs in found["jpgs"].items() for f in fs)
+            windows.append(dji_exif_window(mrk, jpgs, flight))
+        except (FileNotFoundError, ValueError) as exc:
+            detail(f"⚠️  {mrk}: {exc}, skipping")
+    if found["mrk"]:
+        _detail_dji(data_dir, found)
+    return _finish(data_dir, windows, [data_dir] * len(windows), merge)
@@ -0,0 +1,104 @@
+"""
+streaming.py – bounded-memory sorting for generator-based listings
+
+The listing and planning helpers (`wze_uav.iter_folders`, `iter_fplans`,
+`move_files.iter_moves`, `move_files_las.iter_las_moves`,
+`sapos_batch.iter_flight_folders_v2`) yield results as they are found.
+When sorted output is wanted, `sorted_stream` sorts them in chunks of
+`chunk_size` items; full chunks are spilled to temporary files as sorted
+runs and merged lazily, so memory stays bounded by one chunk plus one item
+per run.  Inputs that fit into a single chunk never touch the disk.
+"""
+
+import heapq
+import os
+import pickle
+import tempfile
+from typing import IO, Any, Callable, Iterable, Iterator, List, Optional
+
+from modules.profiling import count
+
+__all__ = ["CHUNK_SIZE", "sorted_stream", "write_lines"]
+
+# items held in memory before a sorted run is spilled to disk
+CHUNK_SIZE = 100_000
+
+
+def _spill(items: List[Any], tmp_dir: Optional[str]) -> IO[bytes]:
+    """Write sorted *items* to an anonymous temporary file, rewound."""
+    fh = tempfile.TemporaryFile(dir=tmp_dir)
+    pickler = pickle.Pickler(fh, protocol=pickle.HIGHEST_PROTOCOL)
+    for item in items:
+        pickler.dump(item)
+        pickler.clear_memo()
+    fh.seek(0)
+    count("sort_runs_spilled")
+    return fh
+
+
+def _read_run(fh: IO[bytes]) -> Iterator[Any]:
+    unpickler = pickle.Unpickler(fh)
+    try:
+        while True:
+            yield unpickler.load()
+    except EOFError:
+        return
+    finally:
+        fh.close()
+
+
+def sorted_stream(
+    items: Iterable[Any],
+    key: Optional[Callable[[Any], Any]] = None,
+    reverse: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    tmp_dir: Optional[str] = None
+) -> Iterator[Any]:
+    """
+    Yield *items* in sorted order (like `sorted`, stable) while holding at
+    most `chunk_size` of them in memory.
+
+    Items must be picklable when the input is larger than one chunk.  The
+    temporary run files live in `tmp_dir` (default: the system temp folder)
+    and are removed once the merge finishes or the generator is closed.
+    """
+    runs: List[IO[bytes]] = []
+    chunk: List[Any] = []
+    try:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                chunk.sort(key=key, reverse=reverse)
+                runs.append(_spill(chunk, tmp_dir))
+                chunk = []
+        chunk.sort(key=key, reverse=reverse)
+        if not runs:
+            yield from chunk
+            return
+        runs.append(_spill(chunk, tmp_dir))
+        chunk = []
+        # heapq.merge takes from the earlier run on ties, which keeps it stable
+        yield from heapq.merge(*(_read_run(fh) for fh in runs), key=key, reverse=reverse)
+    finally:
+        for fh in runs:
+            fh.close()
+
+
+def write_lines(path: str, lines: Iterable[str]) -> int:
+    """
+    Write *lines* to *path* as they arrive (UTF-8, one per line) and return
+    how many were written.  The file is replaced only once the input is
+    exhausted, so a failed scan leaves any previous list untouched.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    n = 0
+    try:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for line in lines:
+                fh.write(f"{line}\n")
+                n += 1
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n
@@ -0,0 +1,338 @@
+"""
+watch.py – generate SAPOS queries for flights as they land on the share
+
+`FlightWatcher` keeps an eye on the flight folders below a root (directly
+below it, or <date>/<flight> with `nested=True` as for
+batch_generate_sapos_queries_v2) and runs query generation only for new or
+changed flights, adding their lines to the master query file:
+
+  • change detection   with the optional `watchdog` package, file-system
+                       events (inotify, ReadDirectoryChangesW) mark flights
+                       dirty; without it, each poll stats the directories
+                       recorded for every known flight (a snapshot diff of
+                       directory mtimes, no walk of unchanged flights)
+  • debounce           a dirty flight is walked on every poll; it counts as
+                       complete once file count, total size and newest mtime
+                       have not changed for `settle_s` seconds
+  • state              <master>.watch.json records what was processed and
+                       the query lines of every flight, so a restarted
+                       watcher does not add flights again and a changed
+                       flight replaces its earlier lines in the master file
+
+Flights whose query fails (e.g. no flight log yet) are retried when their
+files change.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from modules.progress import Progress
+from modules.profiling import stage, count
+from modules.sapos_query import generate_sapos_queries, generate_sapos_queries_v2
+
+__all__ = ["FlightWatcher", "watch_sapos_queries"]
+
+QUERY_FILE = "@sapos_query.txt"
+
+# (number of files, total bytes, newest mtime) of a flight folder
+Signature = Tuple[int, int, float]
+
+
+def _snapshot(flight: str) -> Tuple[Signature, Dict[str, float]]:
+    """Signature of *flight* (query files left out) and the mtime of every folder."""
+    n = size = 0
+    newest = 0.0
+    dirs: Dict[str, float] = {}
+    stack = [flight]
+    while stack:
+        cur = stack.pop()
+        count("dirs_listed")
+        try:
+            dirs[cur] = os.stat(cur).st_mtime
+            with os.scandir(cur) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file() and e.name != QUERY_FILE:
+                        st = e.stat()
+                        n += 1
+                        size += st.st_size
+                        newest = max(newest, st.st_mtime)
+        except FileNotFoundError:
+            continue
+    count("files_seen", n)
+    return (n, size, newest), dirs
+
+
+class FlightWatcher:
+    """
+    Incremental SAPOS query generation for the flights below *root*.
+
+    Parameters
+    ----------
+    root : str
+        Folder with the flight folders (or date folders with `nested`).
+    master_out : str
+        Master query file; lines of new flights are appended, those of
+        changed flights replace their earlier lines.
+    nested : bool
+        <root>/<date>/<flight> layout, queries via generate_sapos_queries_v2.
+    merge : bool
+        One merged query line per flight folder (see generate_sapos_queries).
+    settle_s : float
+        Seconds without change before a flight counts as complete.
+    use_events : bool | None
+        Use file-system events through `watchdog`; None: if installed.
+    """
+
+    def __init__(self, root: str, master_out: str, nested: bool = False,
+                 merge: bool = False, settle_s: float = 120.0,
+                 use_events: Optional[bool] = None):
+        self.root = os.path.abspath(root)
+        self.master_out = master_out
+        self.nested = nested
+        self.merge = merge
+        self.settle_s = settle_s
+        self.state_fn = master_out + ".watch.json"
+        self.state: Dict[str, Dict] = {}
+        if os.path.exists(self.state_fn):
+            with open(self.state_fn, encoding="utf-8") as fh:
+                self.state = json.load(fh)
+        # flights being debounced: {flight: (signature, time it was first seen)}
+        self.pending: Dict[str, Tuple[Signature, float]] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._observer = None
+        if use_events is None or use_events:
+            self._observer = self._start_observer(required=bool(use_events))
+
+    # ── file-system events ─────────────────────────────────────────────────
+    def _start_observer(self, required: bool):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            if required:
+                raise
+            return None
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for p in (event.src_path, getattr(event, "dest_path", "")):
+                    flight = watcher._flight_of(p)
+                    if flight is not None and os.path.basename(p) != QUERY_FILE:
+                        with watcher._lock:
+                            watcher._dirty.add(flight)
+
+        obs = Observer()
+        obs.schedule(_Handler(), self.root, recursive=True)
+        obs.start()
+        return obs
+
+    def _flight_of(self, path: str) -> Optional[str]:
+        """Flight folder containing *path*, None for paths above the flights."""
+        rel = os.path.relpath(os.path.abspath(path), self.root).split(os.sep)
+        depth = 2 if self.nested else 1
+        if rel[0] in (".", "..") or len(rel) < depth:
+            return None
+        return os.path.join(self.root, *rel[:depth])
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    # ── polling ────────────────────────────────────────────────────────────
+    def flights(self) -> List[str]:
+        """Current flight folders (one or two scandir levels, no deep walk)."""
+        def _dirs(path: str) -> List[str]:
+            count("dirs_listed")
+            with os.scandir(path) as it:
+                return sorted(e.path for e in it if e.is_dir() and not e.name.startswith("."))
+        with stage("scan"):
+            tops = _dirs(self.root)
+            if not self.nested:
+                return tops
+            return [f for d in tops for f in _dirs(d)]
+
+    def _changed(self, flight: str) -> bool:
+        """Did any folder recorded for a processed flight change its mtime?"""
+        for d, mtime in self.state[flight]["dirs"].items():
+            try:
+                if os.stat(d).st_mtime != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def poll(self, now: Optional[float] = None) -> List[str]:
+        """
+        Update the debounce state; return the flights that are complete and
+        new or changed since they were last processed.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        candidates = set(self.pending) | dirty
+        for f in self.flights():
+            if f not in self.state:
+                candidates.add(f)
+            elif self._observer is None and f not in candidates and self._changed(f):
+                candidates.add(f)
+
+        ready = []
+        for f in sorted(candidates):
+            if not os.path.isdir(f):
+                self.pending.pop(f, None)
+                continue
+            sig, dirs = _snapshot(f)
+            rec = self.state.get(f)
+            if rec is not None and tuple(rec["sig"]) == sig:
+                self.pending.pop(f, None)
+                rec["dirs"] = dirs                  # only folder mtimes moved
+                continue
+            prev = self.pending.get(f)
+            if prev is None or prev[0] != sig:
+                self.pending[f] = (sig, now)        # new or still changing
+            elif now - prev[1] >= self.settle_s:
+                ready.append(f)
+        return ready
+
+    # ── processing ─────────────────────────────────────────────────────────
+    def _read_master(self) -> List[str]:
+        if not os.path.exists(self.master_out):
+            return []
+        with open(self.master_out, encoding="utf-8") as fh:
+            return [ln.rstrip("\n") for ln in fh if ln.strip()]
+
+    def _rewrite_master(self, lines: List[str]) -> None:
+        tmp = self.master_out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.writelines(line + "\n" for line in lines)
+        os.replace(tmp, self.master_out)
+
+    def process(self, flights: List[str], prog: Optional[Progress] = None) -> int:
+        """
+        Generate queries for *flights* and add them to the master file;
+        returns lines written.  The lines of every flight are kept in the
+        state: when a flight is processed again, its earlier lines are
+        removed from the master file (which is then rewritten) before the
+        new ones are added, and lines already in the master file are never
+        added twice.  A flight whose query now fails keeps its old lines.
+        """
+        gen = generate_sapos_queries_v2 if self.nested else generate_sapos_queries
+        master = self._read_master()
+        present = set(master)
+        written = 0
+        for f in flights:
+            self.pending.pop(f, None)
+            old = (self.state.get(f) or {}).get("queries") or []
+            try:
+                lines = gen(f, merge=self.merge)
+                status, error = "done", None
+            except Exception as exc:
+                lines, status, error = old, "failed", str(exc)
+            stale = Counter(ln for ln in old if ln not in lines)
+            rewrite = bool(stale)
+            if rewrite:
+                kept = []
+                for ln in master:
+                    if stale[ln] > 0:
+                        stale[ln] -= 1          # one earlier line of this flight
+                    else:
+                        kept.append(ln)
+                master, present = kept, set(kept)
+            new = [ln for ln in dict.fromkeys(lines) if ln not in present]
+            master += new
+            present.update(new)
+            if rewrite:
+                self._rewrite_master(master)
+            elif new:
+                with open(self.master_out, "a", encoding="utf-8") as fh:
+                    fh.writelines(line + "\n" for line in new)
+            written += len(new)
+            sig, dirs = _snapshot(f)            # after the query files were written
+            self.state[f] = {"sig": list(sig), "dirs": dirs, "status": status,
+                             "lines": len(lines), "queries": lines, "error": error,
+                             "at": time.time()}
+            self._save_state()
+            if prog is not None:
+                rel = os.path.relpath(f, self.root)
+                if error:
+                    prog.fail(f"❌ {rel}: {error}")
+                else:
+                    prog.advance()
+                    prog.info(f"✅ {rel}: {len(lines)} query line(s)")
+        return written
+
+    def _save_state(self) -> None:
+        tmp = self.state_fn + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self.state_fn)
+
+    def mark_existing(self) -> int:
+        """Record all current flights as processed without querying them."""
+        n = 0
+        for f in self.flights():
+            if f not in self.state:
+                sig, dirs = _snapshot(f)
+                self.state[f] = {"sig": list(sig), "dirs": dirs, "status": "skipped",
+                                 "lines": 0, "error": None, "at": time.time()}
+                n += 1
+        self._save_state()
+        return n
+
+
+def watch_sapos_queries(
+    root: str,
+    master_out: str,
+    nested: bool = False,
+    merge: bool = False,
+    interval: float = 15.0,
+    settle_s: float = 120.0,
+    skip_existing: bool = False,
+    use_events: Optional[bool] = None,
+    max_cycles: Optional[int] = None,
+    stop: Optional[threading.Event] = None
+) -> None:
+    """
+    Poll *root* every `interval` seconds and append the SAPOS queries of
+    new or changed flights to *master_out* (see `FlightWatcher`).
+
+    With `skip_existing`, flights already present at start are recorded
+    without being queried (use when the master file is already complete).
+    Runs until Ctrl-C, `stop` is set or `max_cycles` polls were done.
+    """
+    watcher = FlightWatcher(root, master_out, nested, merge, settle_s, use_events)
+    prog = Progress("watch_sapos_queries", unit="flights")
+    prog.info(f"👀 Watching {watcher.root} "
+              f"({'file-system events' if watcher._observer else 'polling'}, "
+              f"settle {settle_s:.0f} s) → {master_out}")
+    if skip_existing:
+        prog.info(f"{watcher.mark_existing()} existing flight(s) skipped")
+    cycles = 0
+    try:
+        while True:
+            ready = watcher.poll()
+            if ready:
+                watcher.process(ready, prog)
+            cycles += 1
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+            if stop is not None:
+                if stop.wait(interval):
+                    break
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        prog.done(f"{len(watcher.pending)} flight(s) still settling")
@@ -0,0 +1,376 @@
+"""
+work_queue.py – lease-based work queue on a shared folder
+
+Several processes or workstations that mount the same share can split a
+list of flights/missions between them without double work:
+
+    q = WorkQueue(r"D:\\Drohnendaten\\_queue\\sapos_v2")
+    for key in flights:
+        with q.claim(key) as lease:          # None if done or leased elsewhere
+            if lease:
+                lease.complete({"line": make_query(key)})
+
+Queue layout below the queue folder:
+
+    leases/<id>.lease   one per item in progress (owner, key; mtime = heartbeat)
+    done/<id>.json      result of a finished item
+    failed/<id>.json    error of a failed item
+
+Leases are created by writing a temporary file and linking/renaming it to
+its final name, which fails if another owner got there first.  An owner
+refreshes the lease mtime (heartbeat) while working; a lease whose
+heartbeat is older than `ttl` seconds is taken over by the next claimer
+that gets the lease's `.takeover` guard file.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+__all__ = ["WorkQueue", "Lease", "run_queued", "claimed"]
+
+DEFAULT_TTL = 300.0
+
+
+def _item_id(key: str) -> str:
+    """Stable file-name-safe id for an item key (e.g. a flight path)."""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def _default_owner() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _write_json_atomic(path: str, obj: Dict) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def _create_exclusive(path: str, data: bytes) -> bool:
+    """
+    Create *path* with *data* unless it exists.  The content is written to a
+    temporary file first, then hard-linked (POSIX, NTFS) or – where links are
+    not supported – renamed into place (exclusive on Windows).
+    """
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    try:
+        try:
+            os.link(tmp, path)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            if os.name != "nt":
+                raise
+        try:
+            os.rename(tmp, path)
+            return True
+        except FileExistsError:
+            return False
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class Lease:
+    """
+    A claimed queue item.  Use as a context manager: a background thread
+    refreshes the heartbeat every ttl/3 seconds, and leaving the block
+    without `complete` marks the item failed (exception) or releases it.
+    """
+
+    def __init__(self, queue: "WorkQueue", key: str, owner: str):
+        self.queue = queue
+        self.key = key
+        self.owner = owner
+        self.path = queue._lease_path(key)
+        self.closed = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ── heartbeat ──────────────────────────────────────────────────────────
+    def heartbeat(self) -> bool:
+        """Refresh the lease; False if it was lost (expired and taken over)."""
+        if not self.still_owned():
+            return False
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def still_owned(self) -> bool:
+        info = self.queue._read_lease(self.path)
+        return info is not None and info.get("owner") == self.owner
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.queue.ttl / 3):
+            if not self.heartbeat():
+                return
+
+    def start_heartbeat(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._beat, daemon=True,
+                                            name=f"lease-{self.key[-20:]}")
+            self._thread.start()
+
+    def _stop_heartbeat(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # ── outcome ────────────────────────────────────────────────────────────
+    def complete(self, result: Optional[Dict] = None) -> None:
+        """Record the result under done/ and drop the lease."""
+        self._finish("done", {"result": result})
+
+    def fail(self, error: str) -> None:
+        """Record the error under failed/ and drop the lease."""
+        self._finish("failed", {"error": error})
+
+    def release(self) -> None:
+        """Give the item back without a result (another owner may claim it)."""
+        if self.closed:
+            return
+        self._stop_heartbeat()
+        self.closed = True
+        if self.still_owned():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _finish(self, kind: str, payload: Dict) -> None:
+        if self.closed:
+            return
+        self._stop_heartbeat()
+        payload.update({"key": self.key, "owner": self.owner, "finished": time.time()})
+        _write_json_atomic(self.queue._record_path(kind, self.key), payload)
+        self.closed = True
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "Lease":
+        self.start_heartbeat()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.fail(f"{exc_type.__name__}: {exc}")
+        else:
+            self.release()
+
+
+class _NoLease:
+    """Context manager returned by `WorkQueue.claim` when nothing was claimed."""
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def __bool__(self) -> bool:
+        return False
+
+
+class WorkQueue:
+    """
+    Work queue in folder *root* (created if missing), shared by all
+    processes that use the same folder.
+
+    Parameters
+    ----------
+    root : str
+        Queue folder on the shared filesystem.
+    ttl : float
+        Seconds without heartbeat after which a lease counts as abandoned.
+    owner : str | None
+        Name recorded in leases and results (default host-pid-random).
+    retry_failed : bool
+        Let `claim` hand out items that failed before.
+    """
+
+    def __init__(self, root: str, ttl: float = DEFAULT_TTL, owner: Optional[str] = None,
+                 retry_failed: bool = False):
+        self.root = root
+        self.ttl = ttl
+        self.owner = owner or _default_owner()
+        self.retry_failed = retry_failed
+        for sub in ("leases", "done", "failed"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _lease_path(self, key: str) -> str:
+        return os.path.join(self.root, "leases", _item_id(key) + ".lease")
+
+    def _record_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, _item_id(key) + ".json")
+
+    @staticmethod
+    def _read_lease(path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # ── state ──────────────────────────────────────────────────────────────
+    def is_done(self, key: str) -> bool:
+        return os.path.exists(self._record_path("done", key))
+
+    def is_failed(self, key: str) -> bool:
+        return os.path.exists(self._record_path("failed", key))
+
+    def result(self, key: str) -> Optional[Dict]:
+        """The done/ record of *key* ({"key", "owner", "result", ...}) or None."""
+        try:
+            with open(self._record_path("done", key), encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _expired(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) > self.ttl
+        except FileNotFoundError:
+            return True
+
+    # ── claiming ───────────────────────────────────────────────────────────
+    def try_claim(self, key: str) -> Optional[Lease]:
+        """
+        Claim *key*, or return None if it is done (or failed, unless
+        retry_failed) or leased by a live owner.  Expired leases are taken
+        over under a guard file, so only one claimer can win each of them.
+        """
+        if self.is_done(key) or (self.is_failed(key) and not self.retry_failed):
+            return None
+        path = self._lease_path(key)
+        data = json.dumps({"key": key, "owner": self.owner,
+                           "claimed": time.time()}).encode("utf-8")
+        if _create_exclusive(path, data):
+            return self._confirm(key, path)
+        if not self._expired(path):
+            return None
+        # One claimer at a time takes an expired lease over, holding the
+        # guard file; the lease is then re-checked and replaced atomically,
+        # so its path never is empty for a concurrent `_create_exclusive`.
+        guard = path + ".takeover"
+        if not _create_exclusive(guard, data):
+            if self._expired(guard):            # left behind by a crashed claimer
+                try:
+                    os.remove(guard)
+                except FileNotFoundError:
+                    pass
+            return None
+        try:
+            if self._read_lease(path) is None or not self._expired(path):
+                return None             # finished, released or refreshed meanwhile
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        finally:
+            try:
+                os.remove(guard)
+            except FileNotFoundError:
+                pass
+        return self._confirm(key, path)
+
+    def _confirm(self, key: str, path: str) -> Optional[Lease]:
+        # an owner that finished between our done-check and the claim
+        if self.is_done(key):
+            os.remove(path)
+            return None
+        return Lease(self, key, self.owner)
+
+    def claim(self, key: str):
+        """`try_claim` usable in a with-statement (yields None if not claimed)."""
+        lease = self.try_claim(key)
+        return lease if lease is not None else _NoLease()
+
+    def pending(self, keys: Iterable[str]) -> Iterator[str]:
+        """Keys without a done (or failed) record."""
+        for key in keys:
+            if not self.is_done(key) and (self.retry_failed or not self.is_failed(key)):
+                yield key
+
+
+def run_queued(queue: WorkQueue, keys: Iterable[str],
+               func: Callable[[str], Optional[Dict]]) -> Dict[str, List[str]]:
+    """
+    Run *func(key)* for every key this process can claim; its return value
+    is stored as the item result.  Exceptions mark the item failed.
+
+    Returns {"done": [...], "failed": [...], "skipped": [...]} for this
+    process (skipped: done, failed or leased elsewhere).
+    """
+    summary: Dict[str, List[str]] = {"done": [], "failed": [], "skipped": []}
+    for key in keys:
+        lease = queue.try_claim(key)
+        if lease is None:
+            summary["skipped"].append(key)
+            continue
+        with lease:
+            try:
+                result = func(key)
+            except Exception as exc:
+                lease.fail(f"{type(exc).__name__}: {exc}")
+                summary["failed"].append(key)
+                continue
+            lease.complete(result)
+            summary["done"].append(key)
+    return summary
+
+
+class _Unqueued:
+    """Stand-in lease yielded by `claimed` without a queue; outcomes are no-ops."""
+
+    def complete(self, result: Optional[Dict] = None) -> None:
+        pass
+
+    def fail(self, error: str) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+@contextmanager
+def claimed(queue: Optional[WorkQueue], key: str):
+    """
+    Wrap one item of an existing loop:
+
+        with claimed(queue, mission) as lease:
+            if not lease:
+                continue
+            ...
+            lease.complete({...})
+
+    Yields the Lease of *key* (a no-op stand-in with queue=None), or None
+    when it is done or leased elsewhere.  The heartbeat runs for the whole
+    block.  Only `complete` records the item as done: leaving the block
+    without it – also via `continue` – releases the item for a later run,
+    an exception marks it failed.
+    """
+    if queue is None:
+        yield _Unqueued()
+        return
+    lease = queue.try_claim(key)
+    if lease is None:
+        yield None
+        return
+    with lease:
+        yield lease
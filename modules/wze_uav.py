@@ -1,83 +1,220 @@
 
 import os
 import re
-import pandas as pd
 import shutil
 import errno
 import ntpath
+import fnmatch
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
-from typing import List, Dict, Optional, Union, Iterable
+from typing import List, Dict, Optional, Union, Iterable, Iterator, Tuple
 
+from modules.detectors import REGISTRY, detect_platform, scan_folder
+from modules.disk_space import (RESERVE_BYTES, link_or_copy, plan_transfers, report_plan,
+                                 transfer_method)
+from modules.flight_index import (build_flight_index, flight_index_path, load_flight_index,
+                                  read_fplan_list, report_unmatched, write_flight_index)
+from modules.jpeg_meta import read_datetime_original
+from modules.platform import read_mrk_window, berlin_to_gps
+from modules.rinex import check_coverage, trim_obs, merge_rinex
+from modules.run_log import RunLog
+from modules.streaming import CHUNK_SIZE, sorted_stream, write_lines
+from modules.work_queue import WorkQueue, claimed
+from modules.progress import Progress, VERBOSE, detail
+from modules.profiling import stage, count
+
+
+
+def scan_subdirs(path: str) -> List[Tuple[str, str]]:
+    """(name, path) of the subdirectories of `path`, in listing order."""
+    count("dirs_listed")
+    with os.scandir(path) as it:
+        return [(e.name, e.path) for e in it if e.is_dir()]
+
+
+def scan_fplan_entries(tnr_path: str) -> List[str]:
+    """Names of non-hidden entries in `tnr_path` containing "FPLAN"."""
+    count("dirs_listed")
+    with os.scandir(tnr_path) as it:
+        return [e.name for e in it if not e.name.startswith('.') and 'FPLAN' in e.name]
+
+
+def iter_fplans(
+    dir_path: str,
+    workers: int = 1
+) -> Iterator[Tuple[str, int, str]]:
+    """
+    Yield (date_str, tnr, fplan_path) for every FPLAN entry below
+    `dir_path`, laid out as <date_folder>/<TNR folder>/<*FPLAN*>.
+
+    TNR folders must have purely numeric names; `date_str` is the date
+    folder name without its last "_<suffix>".  With `workers` > 1 the
+    date and TNR folders are listed concurrently on a thread pool, which
+    hides the round-trip latency of network shares.  Output order is the
+    same as a serial scan.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        mapper = ex.map if workers > 1 else map
+        date_folders = scan_subdirs(dir_path)
+        tnr_lists = mapper(scan_subdirs, [p for _, p in date_folders])
+
+        jobs: List[Tuple[str, int, str]] = []
+        for (date_folder, _), tnr_folders in zip(date_folders, tnr_lists):
+            date_str = date_folder.rsplit('_', 1)[0]
+            for tnr_folder, tnr_path in tnr_folders:
+                try:
+                    tnr_int = int(tnr_folder)
+                except ValueError:
+                    # skip folders whose names aren’t pure integers
+                    continue
+                jobs.append((date_str, tnr_int, tnr_path))
+
+        entry_lists = mapper(scan_fplan_entries, [j[2] for j in jobs])
+        for (date_str, tnr_int, tnr_path), entries in zip(jobs, entry_lists):
+            for entry in entries:
+                yield date_str, tnr_int, os.path.join(tnr_path, entry)
 
 
 def extract_fplans(
     sapos_fn: str,
     dir_path: str,
-    output_fn: str
+    output_fn: str,
+    workers: int = 1,
+    sort: bool = False
 ) -> None:
     """
     Scan through `dir_path` (and its subfolders) for files containing "FPLAN"
     in their names and write their full paths to `output_fn`, one per line.
+    Paths are written as they are found (see `iter_fplans`); `output_fn`
+    is replaced once the scan has finished.  The FPLAN folders are then
+    joined with the query flights of `sapos_fn` by TNR and the result is
+    written to `<output_fn>_index.csv` (see `modules.flight_index`);
+    flights and FPLANs without partner are reported.
 
     Parameters
     ----------
     sapos_fn : str
-        Path to the SAPOS queries file.
+        Path to the SAPOS queries file (master file of the nested layout).
     dir_path : str
         Root directory under which to search for FPLAN files.
     output_fn : str
         Path to the text file where results will be written.
+    workers : int, default 1
+        Number of threads listing folders concurrently (see `iter_fplans`);
+        use 8–32 on high-latency network shares.
+    sort : bool, default False
+        Write the paths sorted (bounded-memory, see
+        `modules.streaming.sorted_stream`) instead of in scan order.
     """
-    # (Optional) read the SAPOS file if you need to filter or augment:
-    df_sapos = pd.read_table(sapos_fn)
-
-    fplan_list = []
-    # Iterate over each date-folder
-    for date_folder in os.listdir(dir_path):
-        sub_path = os.path.join(dir_path, date_folder)
-        if not os.path.isdir(sub_path):
-            continue
+    if not os.path.isfile(sapos_fn):
+        raise FileNotFoundError(f"SAPOS query file not found: {sapos_fn}")
 
-        # Iterate over each TNR folder
-        for tnr_folder in os.listdir(sub_path):
-            tnr_path = os.path.join(sub_path, tnr_folder)
-            if not os.path.isdir(tnr_path):
-                continue
+    prog = Progress("extract_fplans", unit="FPLAN entries")
 
-            # Extract integer TNR and date string if needed:
-            try:
-                tnr_int = int(tnr_folder)
-            except ValueError:
-                # skip folders whose names aren’t pure integers
-                continue
-            date_str = date_folder.rsplit('_', 1)[0]
+    def _paths() -> Iterator[str]:
+        for _, _, path in iter_fplans(dir_path, workers):
+            prog.advance()
+            yield path
 
-            # Scan files (skipping hidden ones)
-            for entry in os.listdir(tnr_path):
-                if entry.startswith('.'):
-                    continue
-                if 'FPLAN' in entry:
-                    fplan_list.append(os.path.join(tnr_path, entry))
+    paths = sorted_stream(_paths()) if sort else _paths()
+    with stage("scan"):
+        n = write_lines(output_fn, paths)
+    count("fplans", n)
 
-    # Write results
-    with open(output_fn, 'w') as fp:
-        for path in fplan_list:
-            fp.write(f"{path}\n")
+    index = build_flight_index(read_fplan_list(output_fn), sapos_fn=sapos_fn)
+    write_flight_index(index, flight_index_path(output_fn))
+    report_unmatched(index, prog)
 
     # Print summary
-    print(f"Found {len(fplan_list)} FPLAN entries.")
-    print(f"Saved list to: {output_fn}")
+    prog.done(f"saved list to: {output_fn}")
 
 
+_RINEX_OBS_RE = re.compile(r'\.\d\d[oO]$')
+_RINEX_NAV_RE = re.compile(r'\.\d\d[nNpPgG]$')
 
 
+def _rinex_groups(folder: str, names: List[str]) -> List[List[str]]:
+    """
+    Groups of ≥ 2 RINEX observation or navigation files in `names` that can
+    be merged (same extension), oldest first.
+    """
+    groups: Dict[str, List[str]] = {}
+    for n in names:
+        if (_RINEX_OBS_RE.search(n) or _RINEX_NAV_RE.search(n)) \
+                and os.path.isfile(os.path.join(folder, n)):
+            groups.setdefault(os.path.splitext(n)[1].lower(), []).append(n)
+    return [sorted(g, key=lambda n: os.path.getmtime(os.path.join(folder, n)))
+            for g in groups.values() if len(g) > 1]
+
+
+def stage_vrs_for_fplan(
+    fplan_dir: str,
+    tnr_code: str,
+    vrs_root: str,
+    ignore_existing: bool = True,
+    merge_rinex_files: bool = False,
+    prog: Optional[Progress] = None,
+    vrs_names: Optional[List[str]] = None
+) -> int:
+    """
+    Copy every item in `vrs_root` starting with "{tnr_code}_" into
+    `fplan_dir` (see `copy_vrs_for_fplans` for the options).  Returns the
+    number of items copied or merged; 0 means no VRS data for the TNR yet.
+    `vrs_names` is a listing of `vrs_root` the caller already made.
+    """
+    # find _all_ VRS items that start with "{tnr_code}_"
+    if vrs_names is None:
+        with stage("scan"):
+            vrs_names = os.listdir(vrs_root)
+        count("dirs_listed")
+    candidates: List[str] = [itm for itm in vrs_names if itm.startswith(f"{tnr_code}_")]
+    if not candidates:
+        return 0
+    n_items = len(candidates)
+
+    # ensure the FPLAN directory exists
+    os.makedirs(fplan_dir, exist_ok=True)
+
+    # merge split RINEX deliveries, copy everything else
+    if merge_rinex_files:
+        for group in _rinex_groups(vrs_root, candidates):
+            dst = os.path.join(fplan_dir, f"{tnr_code}_merged{os.path.splitext(group[0])[1]}")
+            with stage("vrs_copy"):
+                try:
+                    res = merge_rinex([os.path.join(vrs_root, g) for g in group], dst)
+                except ValueError as exc:
+                    if prog is not None:
+                        prog.warn(f"⚠️  Not merging {', '.join(group)}: {exc}")
+                    continue
+            count("vrs_bytes", os.path.getsize(dst))
+            detail(f"🔗 Merged {', '.join(group)} -> {dst} ({res})")
+            candidates = [c for c in candidates if c not in group]
+            n_items -= len(group) - 1
+
+    for itm in candidates:
+        src = os.path.join(vrs_root, itm)
+        dst = os.path.join(fplan_dir, itm)
+        with stage("vrs_copy"):
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, dirs_exist_ok=ignore_existing)
+                detail(f"📁 Copied dir : {src} -> {dst}")
+            else:
+                shutil.copy2(src, dst)
+                count("vrs_bytes", os.path.getsize(dst))
+                detail(f"📄 Copied file: {src} -> {dst}")
+        count("vrs_items")
+    return n_items
 
 
 def copy_vrs_for_fplans(
     fplan_list_fn: str,
     vrs_root: str,
-    ignore_existing: bool = True
+    ignore_existing: bool = True,
+    merge_rinex_files: bool = False,
+    queue_dir: Optional[str] = None,
+    check_space: bool = True,
+    reserve_bytes: int = RESERVE_BYTES
 ) -> None:
     """
     Read a list of FPLAN file paths.  For each one:
@@ -86,6 +223,10 @@ def copy_vrs_for_fplans(
       • Copy _all_ files/dirs in vrs_root starting with "{TNR}_" into
         that FPLAN folder, preserving names and reporting each copy.
 
+    The links FPLAN folder → TNR → VRS items come from one join (see
+    `modules.flight_index`), stored with the query flights in
+    `<fplan_list>_index.csv`; VRS items without FPLAN folder are reported.
+
     Parameters
     ----------
     fplan_list_fn : str
@@ -96,47 +237,70 @@ def copy_vrs_for_fplans(
     ignore_existing : bool
         If True, existing files/dirs in the target will be merged/overwritten
         instead of throwing an error.
+    merge_rinex_files : bool
+        If True and a TNR has several RINEX observation (or navigation)
+        files, e.g. from a split reorder, they are streamed into one
+        "{TNR}_merged.<ext>" in the FPLAN folder instead of being copied
+        one by one (see `modules.rinex.merge_rinex`).
+    queue_dir : str | None
+        Shared work-queue folder (see `modules.work_queue`); FPLAN folders
+        done or claimed by another process are skipped, so several
+        workstations can run the copy at the same time.
+    check_space : bool
+        Size the VRS items of every TNR from the index listing and copy only
+        to FPLAN folders that still fit into the free space of their drive
+        (see `modules.disk_space`); the others are reported.
+    reserve_bytes : int
+        Free space to leave on each target drive.
     """
-    # 1) read and clean your FPLAN paths
-    with open(fplan_list_fn, 'r', encoding='utf-8') as fp:
-        fplan_paths = [ln.strip() for ln in fp if ln.strip()]
-
-    for fplan_path in fplan_paths:
-        # 2) split into parts, look for the folder containing "FPLAN"
-        parts = fplan_path.split(os.sep)
-        try:
-            idx = next(i for i, p in enumerate(parts) if 'FPLAN' in p.upper())
-        except StopIteration:
-            print(f"⚠️  No FPLAN folder in path, skipping: {fplan_path}")
-            continue
-
-        # the FPLAN directory itself:
-        fplan_dir = os.sep.join(parts[:idx+1])
-        # assume the TNR code is the directory just above it:
-        tnr_code = parts[idx-1]
-
-        # 3) find _all_ VRS items that start with "{tnr_code}_"
-        candidates: List[str] = [
-            itm for itm in os.listdir(vrs_root)
-            if itm.startswith(f"{tnr_code}_")
-        ]
-        if not candidates:
-            print(f"⚠️  No VRS items for TNR {tnr_code}, skipping.")
-            continue
+    # 1) join FPLAN folders, TNRs and VRS items once (one listing of vrs_root);
+    #    flights/queries come from the index written by `extract_fplans`
+    known = {r["fplan_dir"]: r for r in load_flight_index(fplan_list_fn)}
+    index = build_flight_index(read_fplan_list(fplan_list_fn), vrs_root=vrs_root)
+    for r in index["rows"]:
+        if r["fplan_dir"] in known:
+            r["flights"] = known[r["fplan_dir"]]["flights"]
+            r["queries"] = known[r["fplan_dir"]]["queries"]
+    write_flight_index(index, flight_index_path(fplan_list_fn))
+    rows = index["rows"]
+
+    queue = WorkQueue(queue_dir) if queue_dir else None
+    prog = Progress("copy_vrs_for_fplans", total=len(rows), unit="FPLANs")
+    report_unmatched(index, prog, keys=("paths", "vrs"))
+    for _ in index["unmatched"]["paths"]:
+        prog.fail()
+
+    if check_space:
+        # sizes come from the DirEntries of the index listing, no second walk
+        sizes = {}
+        for r in rows:
+            items = [index["vrs_sizes"][n] for n in r["vrs"]]
+            sizes[r["fplan_dir"]] = (sum(n for n, _ in items), sum(b for _, b in items))
+        plan = plan_transfers(((r["fplan_dir"], vrs_root, r["fplan_dir"]) for r in rows),
+                              reserve_bytes=reserve_bytes, sizes=sizes)
+        report_plan(plan, prog)
+        for _ in plan["deferred"]:
+            prog.fail()
+        fits = {u["name"] for u in plan["units"]}
+        rows = [r for r in rows if r["fplan_dir"] in fits]
+
+    for r in rows:
+        fplan_dir, tnr_code = r["fplan_dir"], r["tnr"]
+        with claimed(queue, fplan_dir) as lease:
+            if not lease:
+                prog.skip()
+                continue
 
-        # ensure the FPLAN directory exists
-        os.makedirs(fplan_dir, exist_ok=True)
+            # 3) copy (or merge) _all_ VRS items that start with "{tnr_code}_"
+            n_items = stage_vrs_for_fplan(fplan_dir, tnr_code, vrs_root, ignore_existing,
+                                          merge_rinex_files, prog, r["vrs"])
+            if not n_items:
+                prog.fail(f"⚠️  No VRS items for TNR {tnr_code}, skipping.")
+                continue            # released: VRS data may arrive later
+            lease.complete({"tnr": tnr_code, "items": n_items})
+        prog.advance()
 
-        # 4) copy each one
-        for itm in candidates:
-            src = os.path.join(vrs_root, itm)
-            dst = os.path.join(fplan_dir, itm)
-            if os.path.isdir(src):
-                shutil.copytree(src, dst, dirs_exist_ok=ignore_existing)
-                print(f"📁 Copied dir : {src} -> {dst}")
-            else:
-                shutil.copy2(src, dst)
-                print(f"📄 Copied file: {src} -> {dst}")
+    prog.done()
 
 
 
@@ -144,7 +308,10 @@ def copy_vrs_for_fplans(
 # SAPOS .batch generation
 
 def write2log(entry: str, log_fn: str) -> None:
-    """Append one line to the log file and also print it."""
+    """
+    Append one line to the log file and also print it.
+    Opens the file per call; long runs should use `RunLog` instead.
+    """
     with open(log_fn, 'a+', encoding='utf-8') as lf:
         lf.write(entry + '\n')
     print(entry)
@@ -159,24 +326,45 @@ def read_dirlist(dirlist_fn: str) -> List[str]:
         lines = f.readlines()
     return remove_comments(lines)
 
-def find_ppk_files(d: str, epn_yr: str) -> Dict[str, str]:
+def scan_mission(d: str) -> List[str]:
+    """
+    Walk mission directory `d` once and return every file path below it.
+    The result is shared by `find_ppk_files` and `detect_device` so a
+    mission folder is only listed a single time.
+    """
+    return scan_folder(d)
+
+def find_ppk_files(
+    d: str,
+    epn_yr: str,
+    listing: Optional[List[str]] = None,
+    trim_margin_s: Optional[float] = None
+) -> Dict[str, str]:
     """
     Find REDtoolbox inputs in directory `d`.
     Returns keys: 'MRK', 'OBS' (optional), 'O', 'P'.
-    Chooses the newest match when multiple exist.
+    Chooses the newest match when multiple exist; trimmed base copies
+    written by `trim_base_to_flight` are never picked.
+
+    `listing` is the output of `scan_mission(d)`; it is computed here
+    when not given.  With `trim_margin_s`, 'O' points to a copy of the base
+    file trimmed to the flight window (see `trim_base_to_flight`).
     """
-    def _first_match(base: Path, pats: Union[str, Iterable[str]]):
+    def _first_match(paths: List[str], pats: Union[str, Iterable[str]]):
         pat_list = pats if isinstance(pats, (list, tuple)) else (pats,)
         for p in pat_list:
-            hits = list(base.rglob(p))
+            hits = [f for f in paths if fnmatch.fnmatch(ntpath.basename(f), p)
+                    and not _TRIMMED.search(ntpath.basename(f))]
             if hits:
-                hits.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+                count("stat_calls", len(hits))
+                hits.sort(key=os.path.getmtime, reverse=True)
                 return hits[0]
         return None
 
-    base = Path(d)
-    if not base.is_dir():
+    if not os.path.isdir(d):
         raise FileNotFoundError(f"Not a folder: {d}")
+    if listing is None:
+        listing = scan_mission(d)
 
     patterns = {
         # MRK: be tolerant (Timestamp.MRK vs .MRK/.mrk)
@@ -190,31 +378,187 @@ def find_ppk_files(d: str, epn_yr: str) -> Dict[str, str]:
 
     found: Dict[str, str] = {}
     for key, pats in patterns.items():
-        m = _first_match(base, pats)
+        m = _first_match(listing, pats)
         if not m:
             raise FileNotFoundError(f"No files matching {pats} in {d}")
-        found[key] = ntpath.basename(str(m))
+        found[key] = ntpath.basename(m)
 
+    if trim_margin_s is not None:
+        found = trim_base_to_flight(d, found, listing, trim_margin_s)
     return found
 
-def build_batch_commands(
+
+def _listed_path(d: str, name: str, listing: List[str]) -> str:
+    """Full path of basename `name` from a `scan_mission` listing."""
+    for f in listing:
+        if ntpath.basename(f) == name:
+            return f
+    return os.path.join(d, name)
+
+
+def flight_window(
     d: str,
     files: Dict[str, str],
-    redtoolbox_exe: str = 'REDtoolboxCLI.exe'
+    listing: List[str]
+) -> Tuple[datetime, datetime]:
+    """
+    (start, end) GPS time of the flight in `d`: from the MRK named in
+    `files`, falling back to EXIF DateTimeOriginal of the first and last JPG.
+    """
+    if files.get('MRK'):
+        try:
+            return read_mrk_window(_listed_path(d, files['MRK'], listing))
+        except (OSError, ValueError):
+            pass
+    jpgs = sorted(f for f in listing if f.lower().endswith('.jpg'))
+    times = [read_datetime_original(f) for f in (jpgs[:1] + jpgs[-1:])]
+    if not jpgs or None in times:
+        raise ValueError(f"No MRK records or EXIF times in {d}")
+    return berlin_to_gps(times[0]), berlin_to_gps(times[-1])
+
+
+def check_base_coverage(
+    d: str,
+    epn_yr: str,
+    listing: Optional[List[str]] = None,
+    files: Optional[Dict[str, str]] = None,
+    margin_s: float = 60.0
+) -> Dict:
+    """
+    Check that the base-station observation file picked by `find_ppk_files`
+    covers the flight window (MRK/EXIF times) plus `margin_s` seconds.
+
+    Only the RINEX header and the first/last epochs are read (see
+    `modules.rinex.rinex_time_span`), so this costs milliseconds per
+    mission.  Returns the `modules.rinex.check_coverage` result.
+    """
+    if listing is None:
+        listing = scan_mission(d)
+    if files is None:
+        files = find_ppk_files(d, epn_yr, listing)
+    start, end = flight_window(d, files, listing)
+    return check_coverage(_listed_path(d, files['O'], listing), start, end, margin_s)
+
+
+TRIM_SUFFIX = '_trim'
+# trimmed copies: "<base>_trim<margin>s.<ext>" (earlier runs wrote "<base>_trim.<ext>")
+_TRIMMED = re.compile(re.escape(TRIM_SUFFIX) + r'(\d+(\.\d+)?s)?\.[^.]+$', re.IGNORECASE)
+
+
+def trim_base_to_flight(
+    d: str,
+    files: Dict[str, str],
+    listing: List[str],
+    margin_s: float = 120.0
+) -> Dict[str, str]:
+    """
+    Write `<base>_trim<margin>s.<ext>` next to the base observation file,
+    holding only the epochs of the flight window (see `flight_window`) plus
+    `margin_s` seconds, and return a copy of `files` with 'O' pointing to it.
+
+    The copy is streamed (see `modules.rinex.trim_obs`) and reused while it
+    is newer than both the base file and the MRK; the margin is part of
+    the name, so another margin writes another copy.  `find_ppk_files`
+    skips these copies, so runs without trimming keep the full base file;
+    a base file that already is a trimmed copy is returned unchanged.
+    """
+    src = _listed_path(d, files['O'], listing)
+    if _TRIMMED.search(ntpath.basename(src)):
+        return files
+    stem, ext = os.path.splitext(src)
+    dst = f"{stem}{TRIM_SUFFIX}{margin_s:g}s{ext}"
+    deps = [src] + ([_listed_path(d, files['MRK'], listing)] if files.get('MRK') else [])
+    count("stat_calls", len(deps) + 1)
+    if (os.path.exists(dst)
+            and os.path.getmtime(dst) >= max(os.path.getmtime(p) for p in deps)):
+        detail(f"✂️  {ntpath.basename(dst)} is up to date")
+    else:
+        start, end = flight_window(d, files, listing)
+        with stage("rinex_trim"):
+            res = trim_obs(src, dst, start, end, margin_s)
+        count("rinex_epochs_dropped", res['dropped'])
+        detail(f"✂️  {ntpath.basename(src)} → {ntpath.basename(dst)}: "
+               f"{res['kept']} epochs kept, {res['dropped']} dropped")
+    trimmed = dict(files)
+    trimmed['O'] = ntpath.basename(dst)
+    return trimmed
+
+
+GEOID_FILE = r"D:\Ecke_Simon\de_bkg_GCG2016v2023.tif"
+
+# REDtoolbox device profiles, keyed by a short platform name.
+#   device      : value for REDtoolbox `--device` (None → not processed by REDtoolbox)
+#   extra_args  : additional CLI arguments inserted after `--output-format`
+# Which missions use a profile is decided by the detector naming it in
+# `modules.detectors.REGISTRY`; add both to support another platform.
+DEVICE_PROFILES: Dict[str, Dict] = {
+    'L2': {
+        'device': None,             # Zenmuse L2 is processed in DJI Terra
+        'extra_args': (),
+    },
+    'P4M': {
+        'device': 'dji_multispectral',
+        'extra_args': (),
+    },
+    'M3E': {
+        'device': 'dji',
+        'extra_args': (f'--geoid-file "{GEOID_FILE}"',),
+    },
+}
+
+def detect_device(
+    d: str,
+    listing: Optional[List[str]] = None,
+    profiles: Optional[Dict[str, Dict]] = None
+) -> Optional[str]:
+    """
+    Return the key of the matching entry in `profiles` (default
+    DEVICE_PROFILES) for mission directory `d`, or None if nothing matches.
+
+    Only detectors whose profile is in `profiles` take part; their probes
+    run cheapest first (see `modules.detectors.detect_platform`), so the
+    camera EXIF is read only when no marker file or MRK name decides.
+    """
+    profiles = DEVICE_PROFILES if profiles is None else profiles
+    if listing is None:
+        listing = scan_mission(d)
+    det = detect_platform(d, listing, [x for x in REGISTRY if x.profile in profiles])
+    return det.profile if det is not None else None
+
+# REDtoolbox console output of each mission, bracketed by START/END
+# timestamps; read back by modules.redtoolbox_report
+CONSOLE_LOG = 'redtoolbox_console.log'
+
+
+def build_redtoolbox_commands(
+    d: str,
+    files: Dict[str, str],
+    profile: Dict,
+    redtoolbox_exe: str = 'REDtoolboxCLI.exe',
+    console_log: Optional[str] = None
 ) -> List[str]:
     """
-    Given directory `d` and a dict of filenames, return the list of batch lines
-    that call REDtoolbox.
+    Given directory `d`, a dict of filenames and a device profile (see
+    DEVICE_PROFILES), return the list of batch lines that call REDtoolbox.
+
+    With `console_log` (e.g. CONSOLE_LOG), REDtoolbox output goes to that
+    file in output_dir, between START and END lines with the batch's
+    %date% %time%; otherwise it stays on the console.
     """
     batch = [
         '@ECHO OFF',
         fr'SET _directory="{d}"',
         'md "%_directory%\\output_dir"',
     ]
+    log = f'"%_directory%\\output_dir\\{console_log}"' if console_log else None
+    if log:
+        batch.append(f'echo START %date% %time% > {log}')
+    extra = ''.join(f'{arg} ' for arg in profile['extra_args'])
     red_str = (
         f'{redtoolbox_exe} mapping '
-        f'--device dji_multispectral --correction-type ppk '
+        f'--device {profile["device"]} --correction-type ppk '
         f'--output-format "exif" '
+        f'{extra}'
         f'--log-file "%_directory%\\{files["MRK"]}" '
         f'--rover-file "%_directory%\\{files["OBS"]}" '
         f'--base-file "%_directory%\\{files["O"]}" '
@@ -222,51 +566,38 @@ def build_batch_commands(
         f'--output-dir "%_directory%\\output_dir" '
         f'-i "%_directory%"'
     )
-    batch.append(red_str)
+    if log:
+        batch.append(f'{red_str} >> {log} 2>&1')
+        batch.append(f'echo END %date% %time% >> {log}')
+    else:
+        batch.append(red_str)
     return batch
 
-
-def build_batch_commands_M3E(
+def build_batch_commands(
     d: str,
     files: Dict[str, str],
     redtoolbox_exe: str = 'REDtoolboxCLI.exe'
 ) -> List[str]:
     """
     Given directory `d` and a dict of filenames, return the list of batch lines
-    that call REDtoolbox.
+    that call REDtoolbox (Phantom 4 Multispectral).
     """
-    batch = [
-        '@ECHO OFF',
-        fr'SET _directory="{d}"',
-        'md "%_directory%\\output_dir"',
-    ]
-    red_str = (
-        f'{redtoolbox_exe} mapping '
-        f'--device dji --correction-type ppk '
-        f'--output-format "exif" '
-        f'--geoid-file "D:\\Ecke_Simon\\de_bkg_GCG2016v2023.tif" '
-        f'--log-file "%_directory%\\{files["MRK"]}" '
-        f'--rover-file "%_directory%\\{files["OBS"]}" '
-        f'--base-file "%_directory%\\{files["O"]}" '
-        f'--nav-file "%_directory%\\{files["P"]}" '
-        f'--output-dir "%_directory%\\output_dir" '
-        f'-i "%_directory%"'
-    )
-    batch.append(red_str)
-    return batch
+    return build_redtoolbox_commands(d, files, DEVICE_PROFILES['P4M'], redtoolbox_exe)
 
-def generate_redtoolbox_batch(
-    dirlist_fn: str,
-    redtoolbox_dir: str,
-    log_dir: str,
-    epn_yr: str = '24'
-) -> None:
+
+def build_batch_commands_M3E(
+    d: str,
+    files: Dict[str, str],
+    redtoolbox_exe: str = 'REDtoolboxCLI.exe'
+) -> List[str]:
     """
-    Orchestrate: read mission list, create log & batch filenames, then
-    process each directory in turn, writing both log entries and
-    accumulating/appending batch commands.
+    Given directory `d` and a dict of filenames, return the list of batch lines
+    that call REDtoolbox (Mavic 3 Enterprise, with geoid file).
     """
-    start_time = datetime.now()
+    return build_redtoolbox_commands(d, files, DEVICE_PROFILES['M3E'], redtoolbox_exe)
+
+def batch_filenames(redtoolbox_dir: str, log_dir: str, start_time: datetime):
+    """Return (log_fn, batch_fn) for a batch run started at `start_time`."""
     today = date.today().isoformat()
     log_fn = os.path.join(
         log_dir,
@@ -276,80 +607,264 @@ def generate_redtoolbox_batch(
         redtoolbox_dir,
         f'REDToolBox_CMD_Start_batch_ALL_{today}_{start_time:%H%M%S}.bat'
     )
+    return log_fn, batch_fn
 
-    # initialize files
-    write2log(f"Starting batch generation", log_fn)
-    # ensure batch file is empty to start
-    open(batch_fn, 'w').close()
 
-    dir_li = read_dirlist(dirlist_fn)
-    for d in dir_li:
-        write2log(f"Processing {d}", log_fn)
-        files = find_ppk_files(d, epn_yr)
-        for key, fn in files.items():
-            write2log(f"    Found {key} file: {fn}", log_fn)
+def _write_redtoolbox_batch(
+    dirlist_fn: str,
+    redtoolbox_dir: str,
+    log_dir: str,
+    epn_yr: str,
+    profiles: Dict[str, Dict],
+    profile_key: Optional[str] = None,
+    default_profile: Optional[str] = None,
+    check_base: bool = False,
+    base_margin_s: float = 60.0,
+    trim_base_margin_s: Optional[float] = None,
+    preflight: bool = False,
+    queue_dir: Optional[str] = None,
+    console_log: bool = False
+) -> str:
+    """
+    Shared loop behind the generate_redtoolbox_batch* functions.
+
+    With `profile_key` every mission uses that profile; otherwise the device
+    is detected per mission.  With `check_base`, missions whose base file
+    does not cover the flight window (see `check_base_coverage`) are logged
+    and left out of the batch.  With `trim_base_margin_s`, REDtoolbox gets a
+    base file trimmed to the flight window (see `trim_base_to_flight`).
+    With `preflight`, MRK records and images of all missions are checked
+    first (see `modules.preflight`); the report is written next to the log
+    and missions with errors are left out.  With `queue_dir`, each mission
+    is claimed in that shared work queue (see `modules.work_queue`) first,
+    so several workstations can split one mission list; each writes the
+    missions it claimed to its own batch file.  A mission is marked done
+    once its lines are flushed to the batch file; skipped missions are
+    released, so a later run picks them up again (e.g. once the base data
+    arrived).  With `console_log`, each mission's REDtoolbox output goes to
+    output_dir/redtoolbox_console.log for `modules.redtoolbox_report`.
+    Log, JSON-lines events and the batch file are kept open for the whole
+    run (see RunLog).  Returns the batch filename.
+    """
+    start_time = datetime.now()
+    log_fn, batch_fn = batch_filenames(redtoolbox_dir, log_dir, start_time)
+
+    with RunLog(log_fn) as log:
+        log.write("Starting batch generation" if profile_key
+                  else "Starting mixed-device batch generation")
+        bf = log.open_output(batch_fn)
+        log.event("start", dirlist=dirlist_fn, batch_file=batch_fn,
+                  profile=profile_key, epn_yr=epn_yr)
+
+        counts: Dict[str, int] = {}
+        dir_li = read_dirlist(dirlist_fn)
+        queue = WorkQueue(queue_dir) if queue_dir else None
+        if preflight:
+            from modules.preflight import preflight_missions, write_preflight_report
+            results = preflight_missions(dir_li)
+            report_fn = os.path.splitext(log_fn)[0] + '_preflight.csv'
+            write_preflight_report(results, report_fn)
+            failed = {r['mission'] for r in results if r['status'] == 'error'}
+            log.write(f"Preflight: {len(failed)} mission(s) with MRK/image errors, "
+                      f"report: {report_fn}")
+            log.event("preflight", report=report_fn, failed=sorted(failed))
+            for d in failed:
+                log.write(f"    ⚠️  Skipping {d} (see preflight report)")
+            dir_li = [d for d in dir_li if d not in failed]
+        for d in dir_li:
+            with claimed(queue, d) as lease:
+                if not lease:
+                    log.write(f"    {d} is done or claimed elsewhere, skipping", VERBOSE)
+                    continue
+                t0 = log.elapsed()
+                log.write(f"Processing {d}", VERBOSE)
+                with stage("scan"):
+                    listing = scan_mission(d)
+                key = profile_key
+                if key is None:
+                    with stage("parse"):
+                        key = detect_device(d, listing, profiles) or default_profile
+                    if key is None:
+                        log.write(f"    ⚠️  Could not detect device for {d}, skipping "
+                                  f"(pass default_profile to force one)")
+                        log.event("mission_skipped", mission=d, device=None,
+                                  reason="device_unknown")
+                        continue
+                    log.write(f"    Detected device: {key}", VERBOSE)
+                profile = profiles[key]
+                if profile['device'] is None:
+                    log.write(f"    No REDtoolbox device for {key}, skipping")
+                    log.event("mission_skipped", mission=d, device=key)
+                    continue            # released: not done, later runs see it again
+
+                with stage("batch_build"):
+                    files = find_ppk_files(d, epn_yr, listing)
+                    for k, fn in files.items():
+                        log.write(f"    Found {k} file: {fn}", VERBOSE)
+
+                if check_base:
+                    try:
+                        cov = check_base_coverage(d, epn_yr, listing, files, base_margin_s)
+                    except (OSError, ValueError) as exc:
+                        log.write(f"    ⚠️  Could not check base coverage: {exc}")
+                    else:
+                        if not cov['covered']:
+                            log.write(f"    ⚠️  {files['O']} does not cover the flight "
+                                      f"(missing {cov['missing_start_s']:.0f} s at start, "
+                                      f"{cov['missing_end_s']:.0f} s at end), skipping")
+                            log.event("mission_skipped", mission=d, device=key,
+                                      reason="base_coverage",
+                                      missing_start_s=cov['missing_start_s'],
+                                      missing_end_s=cov['missing_end_s'])
+                            continue
+
+                if trim_base_margin_s is not None:
+                    files = trim_base_to_flight(d, files, listing, trim_base_margin_s)
+                    log.write(f"    Trimmed base file: {files['O']}", VERBOSE)
+
+                with stage("batch_build"):
+                    for line in build_redtoolbox_commands(
+                            d, files, profile,
+                            console_log=CONSOLE_LOG if console_log else None):
+                        bf.write(line + '\n')
+                bf.flush()              # done only once its lines are in the batch file
+                lease.complete({'batch_file': batch_fn})
+                counts[key] = counts.get(key, 0) + 1
+                log.event("mission", mission=d, device=key, files=files,
+                          n_listed=len(listing),
+                          seconds=round(log.elapsed() - t0, 3))
+
+        elapsed = datetime.now() - start_time
+        if profile_key is None:
+            summary = ', '.join(f"{k}: {n}" for k, n in sorted(counts.items())) or 'none'
+            log.write(f"\nMissions per device: {summary}")
+        log.write(f"\nTotal time elapsed: {elapsed}")
+        log.write(f"Batch file written to: {batch_fn}")
+        log.event("done", missions=counts, seconds=round(elapsed.total_seconds(), 3))
+    return batch_fn
 
-        batch_lines = build_batch_commands(d, files)
-        # append to batch file
-        with open(batch_fn, 'a+', encoding='utf-8') as bf:
-            for line in batch_lines:
-                bf.write(line + '\n')
 
-    elapsed = datetime.now() - start_time
-    write2log(f"\nTotal time elapsed: {elapsed}", log_fn)
-    write2log(f"Batch file written to: {batch_fn}", log_fn)
+def generate_redtoolbox_batch(
+    dirlist_fn: str,
+    redtoolbox_dir: str,
+    log_dir: str,
+    epn_yr: str = '24',
+    check_base: bool = False,
+    trim_base_margin_s: Optional[float] = None,
+    preflight: bool = False,
+    queue_dir: Optional[str] = None,
+    console_log: bool = False
+) -> None:
+    """
+    Orchestrate: read mission list, create log & batch filenames, then
+    process each directory in turn, writing both log entries and
+    accumulating/appending batch commands (Phantom 4 Multispectral).
+    """
+    _write_redtoolbox_batch(dirlist_fn, redtoolbox_dir, log_dir, epn_yr,
+                            DEVICE_PROFILES, profile_key='P4M',
+                            check_base=check_base,
+                            trim_base_margin_s=trim_base_margin_s,
+                            preflight=preflight, queue_dir=queue_dir,
+                            console_log=console_log)
 
 
 def generate_redtoolbox_batch_M3E(
     dirlist_fn: str,
     redtoolbox_dir: str,
     log_dir: str,
-    epn_yr: str = '24'
+    epn_yr: str = '24',
+    check_base: bool = False,
+    trim_base_margin_s: Optional[float] = None,
+    preflight: bool = False,
+    queue_dir: Optional[str] = None,
+    console_log: bool = False
 ) -> None:
     """
     Orchestrate: read mission list, create log & batch filenames, then
     process each directory in turn, writing both log entries and
-    accumulating/appending batch commands.
+    accumulating/appending batch commands (Mavic 3 Enterprise).
     """
-    start_time = datetime.now()
-    today = date.today().isoformat()
-    log_fn = os.path.join(
-        log_dir,
-        f'REDToolBox_CMD_Start_batch_v02_LOG_{today}_{start_time:%H%M%S}.txt'
-    )
-    batch_fn = os.path.join(
-        redtoolbox_dir,
-        f'REDToolBox_CMD_Start_batch_ALL_{today}_{start_time:%H%M%S}.bat'
-    )
+    _write_redtoolbox_batch(dirlist_fn, redtoolbox_dir, log_dir, epn_yr,
+                            DEVICE_PROFILES, profile_key='M3E',
+                            check_base=check_base,
+                            trim_base_margin_s=trim_base_margin_s,
+                            preflight=preflight, queue_dir=queue_dir,
+                            console_log=console_log)
 
-    # initialize files
-    write2log(f"Starting batch generation", log_fn)
-    # ensure batch file is empty to start
-    open(batch_fn, 'w').close()
 
-    dir_li = read_dirlist(dirlist_fn)
-    for d in dir_li:
-        write2log(f"Processing {d}", log_fn)
-        files = find_ppk_files(d, epn_yr)
-        for key, fn in files.items():
-            write2log(f"    Found {key} file: {fn}", log_fn)
+def generate_redtoolbox_batch_mixed(
+    dirlist_fn: str,
+    redtoolbox_dir: str,
+    log_dir: str,
+    epn_yr: str = '24',
+    profiles: Optional[Dict[str, Dict]] = None,
+    default_profile: Optional[str] = None,
+    check_base: bool = False,
+    trim_base_margin_s: Optional[float] = None,
+    preflight: bool = False,
+    queue_dir: Optional[str] = None,
+    console_log: bool = False
+) -> None:
+    """
+    Like `generate_redtoolbox_batch`, but for mission lists that mix
+    platforms.  Each mission folder is scanned once; the listing is used
+    both to find the PPK inputs and to detect the device (see
+    `detect_device`).  The REDtoolbox call is built from the matching entry
+    in `profiles` (default DEVICE_PROFILES) and all missions end up in a
+    single batch file.
+
+    Missions whose profile has no REDtoolbox device (Zenmuse L2) are logged
+    and skipped.  If detection fails, `default_profile` is used when given,
+    otherwise the mission is logged and skipped as well (event
+    "mission_skipped", reason "device_unknown").  `check_base` skips missions whose
+    base file does not cover the flight (see `check_base_coverage`);
+    `trim_base_margin_s` trims base files to the flight window (see
+    `trim_base_to_flight`), `preflight` checks MRK records against the
+    images first (see `modules.preflight`), `queue_dir` shares the
+    mission list between workstations (see `modules.work_queue`) and
+    `console_log` keeps the REDtoolbox output for `modules.redtoolbox_report`.
+    """
+    profiles = DEVICE_PROFILES if profiles is None else profiles
+    _write_redtoolbox_batch(dirlist_fn, redtoolbox_dir, log_dir, epn_yr,
+                            profiles, default_profile=default_profile,
+                            check_base=check_base,
+                            trim_base_margin_s=trim_base_margin_s,
+                            preflight=preflight, queue_dir=queue_dir,
+                            console_log=console_log)
 
-        batch_lines = build_batch_commands_M3E(d, files)
-        # append to batch file
-        with open(batch_fn, 'a+', encoding='utf-8') as bf:
-            for line in batch_lines:
-                bf.write(line + '\n')
 
-    elapsed = datetime.now() - start_time
-    write2log(f"\nTotal time elapsed: {elapsed}", log_fn)
-    write2log(f"Batch file written to: {batch_fn}", log_fn)
+# copy PPK corrected images to a separate folder
+def flight_image_dirs(flight_path: str) -> Iterator[str]:
+    """Yield every folder below `flight_path` named like *MEDIA* or *EXIF_images*."""
+    for root, dirs, files in os.walk(flight_path):
+        for dir_name in dirs:
+            if 'MEDIA' in dir_name or 'EXIF_images' in dir_name:
+                yield os.path.join(root, dir_name)
+
+
+def iter_ppk_image_dirs(source_folder: str) -> Iterator[str]:
+    """
+    Yield every folder below <source_folder>/<date>/<flight> whose name
+    contains "MEDIA" or "EXIF_images" (the images Metashape needs).
+    """
+    for date_folder in os.listdir(source_folder):
+        date_path = os.path.join(source_folder, date_folder)
+        if not os.path.isdir(date_path):
+            continue
+
+        for flight_folder in os.listdir(date_path):
+            flight_path = os.path.join(date_path, flight_folder)
+            if os.path.isdir(flight_path):
+                yield from flight_image_dirs(flight_path)
 
 
-# copy PPK corrected images to a separate folder
 def copy_ppk_images(
     source_folder: str,
     destination_folder: str,
-    dirs_exist_ok: bool = True
+    dirs_exist_ok: bool = True,
+    check_space: bool = True,
+    allow_link: bool = False,
+    reserve_bytes: int = RESERVE_BYTES
 ) -> None:
     """
     Traverse `source_folder`, find any subdirectories whose names contain
@@ -365,40 +880,74 @@ def copy_ppk_images(
     dirs_exist_ok : bool, default True
         If True, existing directories in the destination will be merged;
         otherwise an error is raised when a target already exists.
+    check_space : bool, default True
+        Size the image folders first and copy only those that fit into the
+        free space of the destination drive (see `modules.disk_space`);
+        the others are reported and not started.
+    allow_link : bool, default False
+        Hard-link instead of copying when source and destination are on
+        the same volume (no extra space; the images must not be edited).
+    reserve_bytes : int
+        Free space to leave on the destination drive.
+
+    For moving the images to another machine, `modules.image_pack` packs
+    the same folders into a few size-capped archives instead.
     """
-    for date_folder in os.listdir(source_folder):
-        date_path = os.path.join(source_folder, date_folder)
-        if not os.path.isdir(date_path):
-            continue
-
-        for flight_folder in os.listdir(date_path):
-            flight_path = os.path.join(date_path, flight_folder)
-            if not os.path.isdir(flight_path):
-                continue
-
-            # Walk the flight folder tree
-            for root, dirs, files in os.walk(flight_path):
-                for dir_name in dirs:
-                    if 'MEDIA' in dir_name or 'EXIF_images' in dir_name:
-                        full_dir_path = os.path.join(root, dir_name)
-
-                        # Compute relative path from source_folder
-                        relative_path = os.path.relpath(full_dir_path, source_folder)
-                        target_path = os.path.join(destination_folder, relative_path)
-
-                        # Copy the directory tree
-                        shutil.copytree(full_dir_path, target_path, dirs_exist_ok=dirs_exist_ok)
-                        print(f"Copied: {full_dir_path} -> {target_path}")
+    prog = Progress("copy_ppk_images", unit="files")
+
+    def _copy(src, dst):
+        shutil.copy2(src, dst)
+        nbytes = os.path.getsize(dst)
+        prog.advance(1, nbytes)
+        count("image_files")
+        count("image_bytes", nbytes)
+        return dst
+
+    def _link(src, dst):
+        link_or_copy(src, dst)
+        prog.advance(1, os.path.getsize(dst))
+        count("image_files")
+        return dst
+
+    units = ((os.path.relpath(d, source_folder), d,
+              os.path.join(destination_folder, os.path.relpath(d, source_folder)))
+             for d in iter_ppk_image_dirs(source_folder))
+    if check_space:
+        with stage("scan"):
+            plan = plan_transfers(units, allow_link=allow_link, reserve_bytes=reserve_bytes)
+        report_plan(plan, prog)
+        prog.total, prog.total_bytes = plan["files"], plan["bytes"]
+        for _ in plan["deferred"]:
+            prog.fail()
+        todo = plan["units"]
+    else:
+        todo = ({"src": src, "dst": dst,
+                 "method": transfer_method(src, dst, False, allow_link)}
+                for _, src, dst in units)
+
+    for unit in todo:
+        # Copy the directory tree
+        with stage("image_copy"):
+            shutil.copytree(unit["src"], unit["dst"],
+                            copy_function=_link if unit["method"] == "link" else _copy,
+                            dirs_exist_ok=dirs_exist_ok)
+        prog.detail(f"Copied: {unit['src']} -> {unit['dst']}")
+
+    prog.done(f"copied into {destination_folder}")
 
 
 def move_files_like_subfolders(master_folder, dest_root,
                                ignore_folder_name="output_dir",
-                               recursive=False, dry_run=False):
+                               recursive=False, dry_run=False,
+                               check_space=True, reserve_bytes=RESERVE_BYTES):
     """
     For each immediate subfolder of `master_folder`, move its files to
     `dest_root/<subfolder_name>`. Skip any folder named `output_dir`.
     If `recursive=True`, also move files from nested subfolders while skipping
     any path that has a folder named `output_dir` in it (preserves relative structure).
+    With `check_space`, subfolders are sized first; a move to another drive
+    only starts for subfolders that fit into its free space (see
+    `modules.disk_space`), moves on the same drive are renames.
     """
     master = Path(master_folder)
     dest_root = Path(dest_root)
@@ -422,11 +971,37 @@ def move_files_like_subfolders(master_folder, dest_root,
             i += 1
 
     moved_count = 0
-    for sub in sorted([p for p in master.iterdir() if p.is_dir()]):
-        if sub.name.lower() == ignore_folder_name.lower():
-            # ignore top-level output_dir
-            continue
-
+    prog = Progress("move_files_like_subfolders", unit="files")
+    # ignore top-level output_dir
+    subs = [p for p in sorted(p for p in master.iterdir() if p.is_dir())
+            if p.name.lower() != ignore_folder_name.lower()]
+    if check_space:
+        # size exactly the files the move below takes along
+        sizes = {}
+        for sub in subs:
+            st: List[int] = []
+            stack = [] if recursive and has_ignored_part(sub) else [str(sub)]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            if recursive and e.name.lower() != ignore_folder_name.lower():
+                                stack.append(e.path)
+                        elif e.is_file():
+                            st.append(e.stat().st_size)
+            sizes[sub.name] = (len(st), sum(st))
+        with stage("scan"):
+            plan = plan_transfers(((sub.name, str(sub), str(dest_root / sub.name))
+                                   for sub in subs),
+                                  move=True, reserve_bytes=reserve_bytes, sizes=sizes)
+        report_plan(plan, prog)
+        prog.total, prog.total_bytes = plan["files"], None
+        for _ in plan["deferred"]:
+            prog.fail()
+        fits = {u["name"] for u in plan["units"]}
+        subs = [sub for sub in subs if sub.name in fits]
+
+    for sub in subs:
         target_dir = dest_root / sub.name
         target_dir.mkdir(parents=True, exist_ok=True)
 
@@ -436,10 +1011,11 @@ def move_files_like_subfolders(master_folder, dest_root,
             for f in files:
                 dest = unique_path(target_dir / f.name)
                 if dry_run:
-                    print(f"[DRY] move {f} -> {dest}")
+                    prog.detail(f"[DRY] move {f} -> {dest}")
                 else:
                     shutil.move(str(f), str(dest))
                     moved_count += 1
+                prog.advance()
         else:
             # move files from sub and all nested subfolders, skipping any path containing output_dir
             for f in sub.rglob("*"):
@@ -448,12 +1024,54 @@ def move_files_like_subfolders(master_folder, dest_root,
                     dest = unique_path((target_dir / rel).parent / rel.name)
                     dest.parent.mkdir(parents=True, exist_ok=True)
                     if dry_run:
-                        print(f"[DRY] move {f} -> {dest}")
+                        prog.detail(f"[DRY] move {f} -> {dest}")
                     else:
                         shutil.move(str(f), str(dest))
                         moved_count += 1
+                    prog.advance()
 
-    print(f"Done. Moved {moved_count} file(s).")
+    prog.done(f"Moved {moved_count} file(s).")
+
+
+def iter_folders(master_folder: Union[str, Path],
+                 recursive: bool = False,
+                 sort: bool = False,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the absolute folder paths inside `master_folder` as they are
+    listed (os.scandir, one folder at a time).
+
+    Only the base folder and symlinked entries are resolved; every other
+    path is joined onto the resolved base, which gives the same result
+    without a `resolve()` per folder.  With `sort`, paths come out sorted
+    case-insensitively via `modules.streaming.sorted_stream`, holding at
+    most `chunk_size` paths in memory.
+    """
+    base = Path(master_folder).expanduser()
+    if not base.exists() or not base.is_dir():
+        raise ValueError(f"Not a folder: {base}")
+
+    def _walk() -> Iterator[str]:
+        stack = [str(base.resolve())]
+        while stack:
+            cur = stack.pop()
+            count("dirs_listed")
+            with os.scandir(cur) as it:
+                subdirs = []
+                for e in it:
+                    if not e.is_dir():
+                        continue
+                    if e.is_symlink():
+                        yield str(Path(e.path).resolve())  # not descended into, as rglob
+                        continue
+                    yield e.path
+                    if recursive:
+                        subdirs.append(e.path)
+            stack.extend(reversed(subdirs))
+
+    if sort:
+        return sorted_stream(_walk(), key=str.lower, chunk_size=chunk_size)
+    return _walk()
 
 
 def list_folders(master_folder: Union[str, Path],
@@ -474,22 +1092,14 @@ def list_folders(master_folder: Union[str, Path],
     Returns
     -------
     List[str]
-        Sorted absolute folder paths.
+        Sorted absolute folder paths (see `iter_folders` for the streaming
+        version).
     """
-    base = Path(master_folder).expanduser()
-    if not base.exists() or not base.is_dir():
-        raise ValueError(f"Not a folder: {base}")
-
-    # Gather directories
-    it = base.rglob("*") if recursive else base.iterdir()
-    dirs = [p for p in it if p.is_dir()]
-
-    # Sort case-insensitively, return absolute paths
-    paths = sorted((str(p.resolve()) for p in dirs), key=str.lower)
+    paths = list(iter_folders(master_folder, recursive, sort=True))
 
     if output_txt is not None:
         out = Path(output_txt).expanduser()
         out.parent.mkdir(parents=True, exist_ok=True)
-        out.write_text("\n".join(paths) + ("\n" if paths else ""), encoding="utf-8")
+        write_lines(str(out), paths)
 
-    return paths
\ No newline at end of file
+    return paths
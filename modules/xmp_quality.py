@@ -0,0 +1,194 @@
+"""
+xmp_quality.py – per-image RTK quality from the DJI XMP block, per flight
+
+DJI images carry the RTK state of every capture in their XMP block (RtkFlag,
+RtkStdLon/Lat/Hgt, GpsStatus, gimbal angles, CaptureUUID).  `build_xmp_table`
+reads it for all JPGs of a flight on a thread pool – only the JPEG segment
+headers and the XMP packet, see `modules.jpeg_meta.read_xmp` – and stores it
+as a columnar table in <flight>/@xmp_quality.json:
+
+    {"columns": ["name", "size", "mtime", "rtk_flag", ...],
+     "data":    {"name": [...], "size": [...], "rtk_flag": [...], ...}}
+
+A re-run only reads images whose size or mtime changed.  `rtk_summary`
+condenses a table (fixed / float / single counts, worst standard deviation)
+and `xmp_quality_report` writes one CSV row per flight, so float-RTK
+captures show up before PPK and REDtoolbox instead of after them.
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modules.detectors import scan_folder
+from modules.jpeg_meta import read_dji_xmp
+from modules.progress import Progress
+from modules.profiling import stage, count
+
+__all__ = ["XMP_TABLE", "COLUMNS", "build_xmp_table", "read_xmp_table", "rtk_summary",
+           "xmp_quality_report"]
+
+XMP_TABLE = "@xmp_quality.json"
+
+# DJI RtkFlag values
+RTK_FIXED, RTK_FLOAT, RTK_SINGLE = 50, 34, 16
+
+# (column, DJI XMP property, type)
+_FIELDS: List[Tuple[str, str, type]] = [
+    ("rtk_flag", "RtkFlag", int),
+    ("rtk_std_lon", "RtkStdLon", float),
+    ("rtk_std_lat", "RtkStdLat", float),
+    ("rtk_std_hgt", "RtkStdHgt", float),
+    ("gps_status", "GpsStatus", str),
+    ("gimbal_roll", "GimbalRollDegree", float),
+    ("gimbal_pitch", "GimbalPitchDegree", float),
+    ("gimbal_yaw", "GimbalYawDegree", float),
+    ("capture_uuid", "CaptureUUID", str),
+]
+COLUMNS = ["name", "size", "mtime"] + [c for c, _, _ in _FIELDS]
+
+
+def _convert(value: Optional[str], typ: type):
+    if value is None or value == "":
+        return None
+    try:
+        return typ(float(value)) if typ is int else typ(value)
+    except ValueError:
+        return None
+
+
+def _read_one(path: str) -> List:
+    """Table values (without name/size/mtime) of one JPG; None where missing."""
+    try:
+        props = read_dji_xmp(path)
+    except OSError:
+        props = {}
+    count("xmp_reads")
+    return [_convert(props.get(prop), typ) for _, prop, typ in _FIELDS]
+
+
+def read_xmp_table(flight_dir: str) -> Optional[Dict[str, List]]:
+    """Columns of <flight_dir>/@xmp_quality.json, None if there is none."""
+    fn = os.path.join(flight_dir, XMP_TABLE)
+    if not os.path.exists(fn):
+        return None
+    with open(fn, encoding="utf-8") as fh:
+        return json.load(fh)["data"]
+
+
+def build_xmp_table(
+    flight_dir: str,
+    workers: int = 8,
+    listing: Optional[List[str]] = None
+) -> Dict[str, List]:
+    """
+    Read the DJI XMP of every JPG below *flight_dir* (names relative to it,
+    sorted) and write <flight_dir>/@xmp_quality.json; returns the columns.
+
+    Images whose size and mtime match the existing table are not read again.
+    `listing` is a `scan_folder(flight_dir)` result the caller already has.
+    """
+    if listing is None:
+        with stage("scan"):
+            listing = scan_folder(flight_dir)
+    jpgs = sorted(f for f in listing if f.lower().endswith((".jpg", ".jpeg")))
+
+    old = read_xmp_table(flight_dir) or {c: [] for c in COLUMNS}
+    known = {n: i for i, n in enumerate(old["name"])}
+    data: Dict[str, List] = {c: [] for c in COLUMNS}
+    todo: List[Tuple[int, str]] = []
+    for path in jpgs:
+        st = os.stat(path)
+        name = os.path.relpath(path, flight_dir).replace(os.sep, "/")
+        i = known.get(name)
+        fresh = i is not None and old["size"][i] == st.st_size and old["mtime"][i] == st.st_mtime
+        data["name"].append(name)
+        data["size"].append(st.st_size)
+        data["mtime"].append(st.st_mtime)
+        for c, _, _ in _FIELDS:
+            data[c].append(old[c][i] if fresh else None)
+        if not fresh:
+            todo.append((len(data["name"]) - 1, path))
+    count("stat_calls", len(jpgs))
+
+    with stage("xmp_read"), ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for (row, _), values in zip(todo, ex.map(_read_one, [p for _, p in todo])):
+            for (c, _, _), v in zip(_FIELDS, values):
+                data[c][row] = v
+
+    fn = os.path.join(flight_dir, XMP_TABLE)
+    tmp = fn + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"columns": COLUMNS, "data": data}, fh, separators=(",", ":"))
+    os.replace(tmp, fn)
+    return data
+
+
+def rtk_summary(data: Dict[str, List]) -> Dict:
+    """Counts per RTK state, fix ratio and the largest RTK standard deviations (m)."""
+    flags = data["rtk_flag"]
+    n = len(flags)
+    fixed = sum(1 for f in flags if f == RTK_FIXED)
+    float_ = [data["name"][i] for i, f in enumerate(flags) if f == RTK_FLOAT]
+
+    def _max(col: str) -> Optional[float]:
+        vals = [v for v in data[col] if v is not None]
+        return max(vals) if vals else None
+
+    return {
+        "images": n,
+        "fixed": fixed,
+        "float": len(float_),
+        "single": sum(1 for f in flags if f == RTK_SINGLE),
+        "no_rtk": sum(1 for f in flags if f is None or f not in (RTK_FIXED, RTK_FLOAT,
+                                                                 RTK_SINGLE)),
+        "fix_ratio": fixed / n if n else None,
+        "max_std_lat": _max("rtk_std_lat"),
+        "max_std_lon": _max("rtk_std_lon"),
+        "max_std_hgt": _max("rtk_std_hgt"),
+        "float_images": float_,
+    }
+
+
+def xmp_quality_report(
+    flight_dirs: Iterable[str],
+    report_fn: str,
+    workers: int = 8
+) -> List[Dict]:
+    """
+    Build (or refresh) the XMP table of every flight and write one CSV row
+    per flight to *report_fn*.  Flights are read one after another, the
+    images of each flight on `workers` threads.  Returns the summaries.
+    """
+    flight_dirs = list(flight_dirs)
+    prog = Progress("xmp_quality", total=len(flight_dirs), unit="flights")
+    rows: List[Dict] = []
+    for d in flight_dirs:
+        try:
+            summary = rtk_summary(build_xmp_table(d, workers))
+        except OSError as exc:
+            prog.fail(f"❌ {d}: {exc}")
+            continue
+        summary["flight"] = d
+        rows.append(summary)
+        if summary["float"] or summary["single"]:
+            prog.warn(f"⚠️  {d}: {summary['float']} float / {summary['single']} single "
+                      f"of {summary['images']} images")
+        prog.advance()
+
+    def _fmt(v) -> str:
+        return "" if v is None else f"{v:.3f}" if isinstance(v, float) else str(v)
+
+    with open(report_fn, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(["flight", "images", "fixed", "float", "single", "no_rtk", "fix_ratio",
+                    "max_std_lat", "max_std_lon", "max_std_hgt", "float_images"])
+        for r in rows:
+            w.writerow([r["flight"]] + [_fmt(r[k]) for k in
+                        ("images", "fixed", "float", "single", "no_rtk", "fix_ratio",
+                         "max_std_lat", "max_std_lon", "max_std_hgt")]
+                       + [" ".join(r["float_images"])])
+    prog.done(f"report: {report_fn}")
+    return rows